@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+
+# --------------- ENVIRONMENT SETUP --------------- #
+
+# Arguments
+import argparse
+
+# Date
+import datetime
+import time
+
+# JSON
+import json
+
+# Processes
+import platform
+import resource
+import socket
+import subprocess
+import tempfile
+
+# Requests
+import requests
+
+# Shared MDM Modules
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mdm_common.audit import MOBILE_DEVICE_AUDITS, mdm_run_audits
+from mdm_common.fetch import DEFAULT_WORKERS
+from mdm_common.inventory_store import InventoryStore
+from mdm_common.jamf_session import JamfSession
+from mdm_common.metrics import RunMetrics
+from mdm_common.pagination import DEFAULT_PAGE_SIZE
+from mdm_common.report_output import DEFAULT_CHUNK_SIZE, OUTPUT_FORMATS
+
+# The report pipelines being measured
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mdm_report'))
+import mdm_report
+
+# --------------- GLOBAL VARIABLES --------------- #
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MOCK_JAMF = os.path.join(REPOSITORY, 'mock_jamf', 'mock_jamf.py')
+DEFAULT_SIZES = [1000, 10000, 100000]
+STAGES = ['list', 'fetch', 'flatten', 'derive', 'write', 'changes', 'inventory', 'audit']
+# A metric that gets this much worse than the baseline is flagged by --compare,
+# unless it is a time that changed by less than REGRESSION_MIN_SECONDS (timer noise)
+REGRESSION_THRESHOLD = 0.10
+REGRESSION_MIN_SECONDS = 0.05
+
+# --------------- LOCAL VARIABLES --------------- #
+
+parser = argparse.ArgumentParser(description='Benchmark the computer and mobile device report pipelines at several fleet sizes.')
+parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                    help=f'fleet sizes to run; each size is used for computers and mobile devices (default: {DEFAULT_SIZES})')
+parser.add_argument('--jamf-url', default=None,
+                    help='benchmark against this server (e.g. one replaying recorded responses) instead of starting mock_jamf')
+parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                    help=f'number of concurrent device detail requests (default: {DEFAULT_WORKERS})')
+parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                    help=f'page size for Jamf Pro API listings (default: {DEFAULT_PAGE_SIZE})')
+parser.add_argument('--bulk', action='store_true',
+                    help='collect computers from paged /api/v1/computers-inventory instead of per-device Classic API calls')
+parser.add_argument('--format', nargs='+', choices=OUTPUT_FORMATS, default=['csv'],
+                    help='report file formats (default: csv)')
+parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                    help=f'rows held in memory before they are written to the report files (default: {DEFAULT_CHUNK_SIZE})')
+parser.add_argument('--latency', type=float, default=0.0, help='seconds of latency mock_jamf adds to every response')
+parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of mock_jamf responses that are 429s')
+parser.add_argument('--output', default=None,
+                    help='results file (default: benchmark_{commit}.json in the current directory)')
+parser.add_argument('--compare', default=None, help='earlier results file to compare this run with')
+parser.add_argument('--run-size', type=int, default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+# --------------- FUNCTIONS --------------- #
+
+def prog_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def prog_free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def prog_git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY, capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPOSITORY, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def mdm_benchmark_pipelines():
+    # Runs both reports with mdm_report's own pipeline functions in the current directory and
+    # returns per-report stage timings, from the stages those functions record in the session's metrics
+    report_args = mdm_report.prog_build_parser().parse_args(
+        ['--workers', str(args.workers), '--page-size', str(args.page_size), '--chunk-size', str(args.chunk_size),
+         '--inventory', 'mdm_inventory.sqlite', '--format', *args.format] + (['--bulk'] if args.bulk else [])
+    )
+    metrics = jamf_session.metrics
+    inventory = InventoryStore(report_args.inventory)
+    totals = {}
+    try:
+        started = time.perf_counter()
+        computer_writer = mdm_report.mdm_run_computer_report(jamf_session, report_args, inventory, metrics)
+        totals['computer'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        mobile_device_writer = mdm_report.mdm_run_mobile_device_report(jamf_session, report_args, inventory, metrics)
+        with metrics.stage('mobile_device.audit'):
+            audit_columns = sorted({column for rule in MOBILE_DEVICE_AUDITS for column in rule.columns})
+            list(mdm_run_audits(mobile_device_writer.read(columns=audit_columns), MOBILE_DEVICE_AUDITS))
+        totals['mobile_device'] = time.perf_counter() - started
+    finally:
+        inventory.close()
+
+    # 'computer.fetch' -> stages['computer']['fetch']
+    stages = {report: {} for report in totals}
+    for name, seconds in metrics.totals.items():
+        report, _, stage = name.partition('.')
+        if report in stages:
+            stages[report][stage] = round(seconds, 4)
+    for report, seconds in totals.items():
+        stages[report]['total'] = round(seconds, 4)
+    return {
+        'computers': computer_writer.rows_written,
+        'mobile_devices': mobile_device_writer.rows_written,
+        'stages': stages,
+    }
+
+
+def mdm_start_mock_jamf(size):
+    port = prog_free_port()
+    process = subprocess.Popen(
+        [sys.executable, MOCK_JAMF, '--port', str(port), '--computers', str(size), '--mobile-devices', str(size),
+         '--latency', str(args.latency), '--throttle-rate', str(args.throttle_rate), '--retry-after', '0'],
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/mock/stats", timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('mock_jamf did not start')
+
+
+def mdm_benchmark_size(size):
+    # Each size runs in a fresh process so its peak RSS is its own
+    process, url = (None, args.jamf_url) if args.jamf_url else mdm_start_mock_jamf(size)
+    try:
+        command = [sys.executable, os.path.abspath(__file__), '--run-size', str(size), '--jamf-url', url,
+                   '--workers', str(args.workers), '--page-size', str(args.page_size),
+                   '--chunk-size', str(args.chunk_size), '--format', *args.format]
+        if args.bulk:
+            command.append('--bulk')
+        started = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True)
+        wall_seconds = time.perf_counter() - started
+        if completed.returncode != 0:
+            raise RuntimeError(f"Benchmark at {size} devices failed:\n{completed.stderr}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        if process is not None:
+            stats = requests.get(f"{url}/mock/stats", timeout=5).json()
+            result['requests'] = sum(stats['requests'].values())
+            result['statuses'] = stats['statuses']
+            result['bytes'] = stats['bytes_sent']
+        else:
+            result['requests'] = sum(endpoint['requests'] for endpoint in result['endpoints'].values())
+        result['requests_per_second'] = round(result['requests'] / result['pipeline_seconds'], 1)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    result['size'] = size
+    result['wall_seconds'] = round(wall_seconds, 3)
+    return result
+
+
+def prog_compare_results(baseline, current):
+    # Prints each metric next to the baseline's; times and memory that grow past the threshold are flagged.
+    # Runs with different options (workers, bulk, latency, ...) are not comparable: the differences are
+    # listed instead and False is returned.
+    baseline_options = baseline.get('options', {})
+    differences = [
+        f"{name}: {baseline_options.get(name)!r} -> {value!r}"
+        for name, value in current['options'].items() if baseline_options.get(name) != value
+    ]
+    if differences:
+        print(f"\nNot comparing with {baseline.get('commit')} ({baseline.get('created')}); the options differ:")
+        for difference in differences:
+            print(f"  {difference}")
+        return False
+    baseline_sizes = {result['size']: result for result in baseline['results']}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('created')}):")
+    for result in current['results']:
+        before = baseline_sizes.get(result['size'])
+        if before is None:
+            continue
+        metrics = [('wall_seconds', result['wall_seconds'], before['wall_seconds'], True),
+                   ('peak_rss_mb', result['peak_rss_mb'], before['peak_rss_mb'], False)]
+        for report, timings in result['stages'].items():
+            for stage, seconds in timings.items():
+                if stage in before['stages'].get(report, {}):
+                    metrics.append((f"{report}.{stage}", seconds, before['stages'][report][stage], True))
+        print(f"\n{result['size']} devices")
+        for name, value, previous, is_time in metrics:
+            change = (value - previous) / previous if previous else 0.0
+            regressed = change > REGRESSION_THRESHOLD and not (is_time and value - previous < REGRESSION_MIN_SECONDS)
+            flag = '  REGRESSION' if regressed else ''
+            print(f"  {name:<28} {previous:>10} -> {value:>10} ({change:+.1%}){flag}")
+    return True
+
+
+# --------------- PROGRAM START --------------- #
+
+if args.run_size is not None:
+    # Child process: run the pipelines in a scratch directory and print the result as JSON
+    jamf_session = JamfSession(args.jamf_url, 'benchmark', 'benchmark', pool_size=args.workers, token_cache_dir=None)
+    jamf_session.metrics = RunMetrics()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        started = time.perf_counter()
+        result = mdm_benchmark_pipelines()
+        result['pipeline_seconds'] = round(time.perf_counter() - started, 3)
+        os.chdir(REPOSITORY)
+    result['peak_rss_mb'] = prog_peak_rss_mb()
+    # Client-side view of the requests, which also works against --jamf-url servers
+    result['endpoints'] = {
+        endpoint: {
+            'requests': summary['requests'],
+            'retries': sum(summary['retries'].values()),
+            'p50_seconds': summary['latency_seconds']['p50'],
+            'p95_seconds': summary['latency_seconds']['p95'],
+        }
+        for endpoint, summary in jamf_session.metrics.to_dict()['endpoints'].items()
+    }
+    print(json.dumps(result))
+    sys.exit(0)
+
+commit, dirty = prog_git_commit()
+benchmark = {
+    'commit': commit,
+    'dirty': dirty,
+    'created': datetime.datetime.now().isoformat(timespec='seconds'),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'options': {
+        'workers': args.workers, 'page_size': args.page_size, 'bulk': args.bulk, 'format': args.format,
+        'chunk_size': args.chunk_size, 'latency': args.latency, 'throttle_rate': args.throttle_rate,
+        'jamf_url': args.jamf_url,
+    },
+    'results': [],
+}
+for size in args.sizes:
+    print(f"Benchmarking {size} computers and {size} mobile devices...")
+    result = mdm_benchmark_size(size)
+    benchmark['results'].append(result)
+    rate = f", {result['requests_per_second']} requests/s" if 'requests_per_second' in result else ''
+    print(f"  {result['wall_seconds']}s wall{rate}, peak RSS {result['peak_rss_mb']} MB")
+    for report, timings in result['stages'].items():
+        print(f"  {report}: " + ', '.join(f"{stage} {timings.get(stage, 0):.2f}s" for stage in STAGES + ['total'] if stage in timings))
+
+output = args.output or f"benchmark_{commit or 'unknown'}.json"
+with open(output, 'w') as results_file:
+    json.dump(benchmark, results_file, indent=2)
+print(f"\nResults saved to {output}")
+
+if args.compare:
+    with open(args.compare) as baseline_file:
+        if not prog_compare_results(json.load(baseline_file), benchmark):
+            sys.exit(1)
@@ -2,27 +2,61 @@
 
 # --------------- ENVIRONMENT SETUP --------------- #
 
+# Arguments Module
+import argparse
+
+# Concurrency Module
+from concurrent.futures import ThreadPoolExecutor
+
+# Datetime Module
+import datetime
+
 # Getpass Module
 import getpass
 
+# HTTP Server Modules
+import hmac
+import json
+import secrets
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 # Pandas module
 import pandas as pd
 
 # Requests Module
 import requests
-from requests.auth import HTTPBasicAuth
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 # OS Module
 import os
 
+# Sys Module
+import sys
+
 # Time Module
 import time
 
+# URL Module
+from urllib.parse import parse_qs, quote, urlparse
+
+# Shared MDM Modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mdm_common.action_catalog import ActionCatalog
+from mdm_common.config import ConfigError, mdm_add_config_arguments, mdm_load_credentials, mdm_parse_args, prog_read_secret_file
+from mdm_common.fetch import DEFAULT_WORKERS
+from mdm_common.inventory_store import COMPUTER, DEFAULT_INVENTORY_PATH, INVENTORY_KEY_COLUMNS, MOBILE_DEVICE, InventoryStore
+from mdm_common.jamf_names import DEFAULT_NAMES_MAX_AGE, mdm_load_jamf_names
+from mdm_common.jamf_session import JamfSession, prog_response_error
+from mdm_common.token_manager import DEFAULT_TOKEN_CACHE_DIR
+from mdm_common.static_groups import StaticGroupChanges
+
 
 # ---------- GLOBAL VARIABLES ---------- #
 
+# Date
+TODAY = datetime.date.today().strftime('%Y-%m-%d')
+
 # Program Dictionary
 PROGRAM_DICT = [
     {
@@ -176,6 +210,14 @@ PROGRAM_DICT = [
         'purpose': 'Perform Device Audit',
     }
 ]
+# Lookup key -> field in Classic API /match results, used when the inventory store is stale
+MATCH_FIELDS = {
+    'serial_number': 'serial_number',
+    'username': 'username',
+    'email': 'email',
+    'udid': 'udid',
+    'full_name': 'realname',
+}
 # Device Dictionary
 DEVICE_DICT = [
 {
@@ -187,11 +229,13 @@ DEVICE_DICT = [
                 'option': '1',
                 'usage_type': 'Personal Mac',
                 'prestage_id': '',
+                'prestage_name': '',
             },
             {
                 'option': '2',
                 'usage_type': 'Shared Mac',
                 'prestage_id': '175',
+                'prestage_name': '',
                 'static_groups': [
                     {
                         'group_name': '',
@@ -219,11 +263,13 @@ DEVICE_DICT = [
                 'option': '1',
                 'usage_type': 'Personal iPad',
                 'prestage_id': '',
+                'prestage_name': '',
             },
             {
                 'option': '2',
                 'usage_type': 'Shared iPad',
                 'prestage_id': '',
+                'prestage_name': '',
             },
         ],
     },
@@ -236,70 +282,582 @@ DEVICE_DICT = [
                 'option': '1',
                 'usage_type': 'Personal iPhone',
                 'prestage_id': '',
+                'prestage_name': '',
             },
             {
                 'option': '2',
                 'usage_type': 'Shared iPhone',
-                'prestage_id': ''
+                'prestage_id': '',
+                'prestage_name': '',
             },
         ],
     },
 ]
-
-
-# ---------- LOCAL VARIABLES ---------- #
-
-local_user = getpass.getuser()
-script_name = os.path.basename(__file__)
-log = f"*{script_name} log:*\n" \
-          f"User: {local_user}"
-jamf_url = input("Enter your Jamf Pro Environment URL: ")
-username = input("Enter your Jamf Pro username: ")
-password = input("Enter your Jamf Pro password: ")
+# Batch Mode
+PREPARE_PURPOSE = 'Prepare Device in MDM Before Setup'
+BATCH_COLUMNS = ['serial_number', 'device_type', 'usage_type', 'action']
+BATCH_RESULT_COLUMNS = ['Line', 'Serial Number', 'Device Type', 'Usage Type', 'Action', 'Status', 'Details']
+# Jamf Pro API PreStage resource and inventory device type for each DEVICE_DICT device category
+PRESTAGE_RESOURCES = {'Computer': 'computer-prestages', 'Mobile Device': 'mobile-device-prestages'}
+DEVICE_CATEGORY_TYPES = {'Computer': COMPUTER, 'Mobile Device': MOBILE_DEVICE}
+# PreStage scopes are versioned; a write based on a stale versionLock is re-read and retried this many times
+PRESTAGE_SCOPE_ATTEMPTS = 3
+# Jamf rejects a whole add-multiple request with this status when one serial number is unknown or in another PreStage
+PRESTAGE_BAD_SERIAL_STATUS = 400
+# Server Mode
+DEFAULT_SERVE_HOST = '127.0.0.1'
+DEFAULT_SERVE_PORT = 8470
+# Clients send this file's contents as a bearer token; it is created owner-only on first start
+DEFAULT_API_TOKEN_PATH = os.path.join(DEFAULT_TOKEN_CACHE_DIR, 'mdm_actions_api.token')
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+
+# Menu and device catalog indexes; a malformed PROGRAM_DICT or DEVICE_DICT fails here at startup
+CATALOG = ActionCatalog(PROGRAM_DICT, DEVICE_DICT, DEVICE_CATEGORY_TYPES)
 
 
 # ---------- FUNCTIONS ---------- #
 
 # MDM Functions
-def mdm_get_token(jamf_url, username, password):
-    successful = False
-    attempts = 0
-    while successful == False:
+def mdm_get_token(jamf_session):
+    # Cached on disk and refreshed through keep-alive before it expires
+    token = jamf_session.token_manager.get_token()
+    return token
+
+
+def mdm_get_request_jamf_classic_json(jamf_session, endpoint):
+    response = jamf_session.get(endpoint)
+    response.raise_for_status()
+    result = response.json()
+    return result
+
+
+def mdm_get_request_jamf_pro(jamf_session, endpoint):
+    response = jamf_session.get(endpoint, bearer=True)
+    response.raise_for_status()
+    result = response.json()
+    return result
+
+
+def mdm_add_to_prestage_scope(jamf_session, device_category, prestage_id, serial_numbers):
+    # Adds the serial numbers to the PreStage's scope in one request.
+    # Returns {serial_number: error} for the serial numbers that could not be added.
+    endpoint = f"{jamf_session.jamf_url}/api/v2/{PRESTAGE_RESOURCES[device_category]}/{prestage_id}/scope"
+    for _ in range(PRESTAGE_SCOPE_ATTEMPTS):
+        scope = mdm_get_request_jamf_pro(jamf_session, endpoint)
+        assigned = {assignment['serialNumber'].upper() for assignment in scope.get('assignments', [])}
+        pending = [serial_number for serial_number in serial_numbers if serial_number not in assigned]
+        if not pending:
+            return {}
+        response = jamf_session.post(f"{endpoint}/add-multiple", bearer=True,
+                                     json={'serialNumbers': pending, 'versionLock': scope['versionLock']})
+        if response.status_code == 409:
+            # Someone else changed the scope since it was read
+            continue
+        if response.ok:
+            return {}
+        if response.status_code != PRESTAGE_BAD_SERIAL_STATUS or len(pending) == 1:
+            # Authorization and server errors fail every device alike; splitting would only repeat them
+            error = prog_response_error(response)
+            return {serial_number: error for serial_number in pending}
+        # One bad serial number fails the whole request; split it in halves to isolate the bad ones
+        middle = len(pending) // 2
+        errors = mdm_add_to_prestage_scope(jamf_session, device_category, prestage_id, pending[:middle])
+        errors.update(mdm_add_to_prestage_scope(jamf_session, device_category, prestage_id, pending[middle:]))
+        return errors
+    return {serial_number: f"PreStage {prestage_id} scope kept changing while it was being updated"
+            for serial_number in serial_numbers}
+
+
+def mdm_run_batch(jamf_session, rows, workers=DEFAULT_WORKERS):
+    # Runs the PreStage assignments and group changes of every valid row concurrently.
+    # Rows sharing a PreStage are assigned in one request and each static group gets a
+    # single update with all of its additions and removals. Returns one result per row.
+    results = []
+    prestages = {}
+    group_changes = StaticGroupChanges()
+    for row in rows:
+        result = prog_batch_result(row)
+        results.append(result)
+        try:
+            result['operations'] = prog_plan_batch_row(row)
+        except ValueError as error:
+            result['Status'] = 'FAILED'
+            result['Details'] = str(error)
+    superseded = prog_find_superseded_group_changes(results)
+    for result in results:
+        for operation, device_category, target_id in result.get('operations', []):
+            if (result['Line'], (operation, device_category, target_id)) in superseded:
+                continue
+            if operation == 'prestage':
+                serial_numbers = prestages.setdefault((device_category, target_id), [])
+                if result['Serial Number'] not in serial_numbers:
+                    serial_numbers.append(result['Serial Number'])
+            elif operation == 'add_to_group':
+                group_changes.add(DEVICE_CATEGORY_TYPES[device_category], target_id, result['Serial Number'])
+            else:
+                group_changes.remove(DEVICE_CATEGORY_TYPES[device_category], target_id, result['Serial Number'])
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+        prestage_futures = {
+            key: executor.submit(mdm_add_to_prestage_scope, jamf_session, key[0], key[1], serial_numbers)
+            for key, serial_numbers in prestages.items()
+        }
+        # Group updates run alongside the PreStage assignments
+        group_future = executor.submit(group_changes.apply, jamf_session, workers)
+        for (device_category, prestage_id), future in prestage_futures.items():
+            try:
+                failed = future.result()
+            except Exception as error:
+                failed = {serial_number: str(error) for serial_number in prestages[(device_category, prestage_id)]}
+            for serial_number, error in failed.items():
+                errors[(DEVICE_CATEGORY_TYPES[device_category], 'prestage', prestage_id, serial_number)] = error
+        for (device_type, group_id, serial_number), error in group_future.result().items():
+            errors[(device_type, 'group', group_id, serial_number)] = error
+
+    for result in results:
+        operations = result.pop('operations', None)
+        if operations is None:
+            continue
+        details = []
+        failed = False
+        for operation in operations:
+            kind = 'prestage' if operation[0] == 'prestage' else 'group'
+            error = superseded.get((result['Line'], operation))
+            if error is None:
+                error = errors.get((DEVICE_CATEGORY_TYPES[operation[1]], kind, operation[2], result['Serial Number']))
+            failed = failed or error is not None
+            details.append(prog_describe_operation(operation) + (f" failed: {error}" if error is not None else ''))
+        result['Status'] = 'FAILED' if failed else 'OK'
+        result['Details'] = '; '.join(details)
+    return results
+
+
+def mdm_match_devices(jamf_session, key, value):
+    # Classic API search across device fields, narrowed to exact matches on the lookup key
+    devices = []
+    field = MATCH_FIELDS[key]
+    for device_type, resource, results_key in [
+        (COMPUTER, 'computers', 'computers'),
+        (MOBILE_DEVICE, 'mobiledevices', 'mobile_devices'),
+    ]:
+        endpoint = f"{jamf_session.jamf_url}/JSSResource/{resource}/match/{quote(value, safe='')}"
+        results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
+        for device in results[results_key]:
+            if str(device.get(field) or '').lower() == value.lower():
+                devices.append({
+                    'Device Type': device_type,
+                    'ID': device['id'],
+                    'Device Name': device.get('name', ''),
+                    'Serial Number': device.get('serial_number', ''),
+                    'Username': device.get('username', ''),
+                })
+    return devices
+
+
+def mdm_find_devices(jamf_session, inventory, key, value):
+    # key is an inventory store key: serial_number, username, email, udid or full_name.
+    # The store answers when both device types were refreshed within its max age and it has a
+    # match; otherwise (stale store, or a device added since the last report) the API is asked.
+    if all(inventory.is_fresh(device_type, jamf_session.jamf_url) for device_type in INVENTORY_KEY_COLUMNS):
+        devices = []
+        for device_type in INVENTORY_KEY_COLUMNS:
+            for row in inventory.find(device_type, key, value):
+                devices.append(prog_summarize_inventory_row(device_type, row))
+        if devices:
+            return devices
+    return mdm_match_devices(jamf_session, key, value)
+
+
+class ActionService:
+    # What the server keeps warm between requests: the pooled, authenticated Jamf session, the
+    # inventory store for lookups and the catalog with resolved group and PreStage IDs, which is
+    # rebuilt from the cached names once they are older than names_max_age
+    def __init__(self, jamf_session, inventory, workers=DEFAULT_WORKERS, names_max_age=DEFAULT_NAMES_MAX_AGE):
+        self.jamf_session = jamf_session
+        self.inventory = inventory
+        self.workers = workers
+        self.names_max_age = names_max_age
+        self.started_at = time.time()
+        self.names_loaded_at = None
+        self.missing_names = []
+        self._names_lock = threading.Lock()
+
+    def load_names(self, refresh=False):
+        with self._names_lock:
+            self.missing_names = prog_resolve_catalog_names(self.jamf_session, self.names_max_age, refresh)
+            self.names_loaded_at = time.time()
+            return self.missing_names
+
+    def run(self, rows, dry_run=False):
+        if dry_run:
+            return prog_plan_batch(rows)
+        if self.names_loaded_at is None or time.time() - self.names_loaded_at >= self.names_max_age:
+            self.load_names()
+        return mdm_run_batch(self.jamf_session, rows, workers=self.workers)
+
+    def find_devices(self, key, value):
+        return mdm_find_devices(self.jamf_session, self.inventory, key, value)
+
+    def describe(self):
+        # The actions the API accepts, from PROGRAM_DICT and DEVICE_DICT
+        catalog = CATALOG
+        return {
+            'device_types': {
+                device['device_type']: {
+                    'device_category': device['device_category'],
+                    'usage_types': [usage['usage_type'] for usage in device['usage_options'].values()],
+                }
+                for device in catalog.device_types.values()
+            },
+            'actions': {
+                'prepare': PREPARE_PURPOSE,
+                **{
+                    device_type: [sub_action['description'] for sub_action in catalog.sub_actions.values()
+                                  if sub_action['device_type'] == device_type]
+                    for device_type in DEVICE_CATEGORY_TYPES.values()
+                },
+            },
+            'lookup_keys': list(MATCH_FIELDS),
+            'missing_names': self.missing_names,
+        }
+
+
+class ActionRequestHandler(BaseHTTPRequestHandler):
+    # Local HTTP/JSON API over server.service:
+    #   GET  /health                      status and uptime, no token needed
+    #   GET  /actions                     device types, usage types and actions
+    #   POST /actions                     run one row or {"rows": [...]}, optionally with "dry_run": true
+    #   GET  /devices?<lookup key>=value  devices by serial_number, username, email, udid or full_name
+    #   POST /names/refresh               fetch group and PreStage names from Jamf again
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        # The body is only read once the request is known to be acceptable; any earlier reply
+        # closes the connection so the unread body is not taken for the next request
         try:
-            response = requests.post(
-                url=f"{jamf_url}/api/v1/auth/token",
-                headers={"accept": "application/json"},
-                auth=HTTPBasicAuth(f'{username}', f'{password}'),
-                verify=False,
-            )
-            response.raise_for_status()
-            data = response.json()
-            token = data['token']
-            return token
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                print("Could not complete after 10 attempts.")
-                successful = True
-        else:
-            successful = True
+            length = prog_content_length(self.headers.get('Content-Length'))
+        except ValueError as error:
+            self.close_connection = True
+            self._send(400, {'error': str(error)})
+            return
+        if length > MAX_REQUEST_BYTES:
+            self.close_connection = True
+            self._send(413, {'error': f"Request body over {MAX_REQUEST_BYTES} bytes"})
+            return
+        if path == '/health':
+            # Liveness only; nothing about the Jamf server is shown without the token
+            if length:
+                self.close_connection = True
+            self._send(200, {'status': 'ok', 'uptime': round(time.time() - self.server.service.started_at)})
+            return
+        authorization = self.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(authorization, f"Bearer {self.server.api_token}".encode()):
+            if length:
+                self.close_connection = True
+            self._send(401, {'error': 'Missing or wrong API token'})
+            return
+        try:
+            body = self.rfile.read(length) if length else b''
+            status, payload = self._route(method, path, parse_qs(url.query), body)
+        except ValueError as error:
+            status, payload = 400, {'error': str(error)}
+        except requests.exceptions.RequestException as error:
+            status, payload = 502, {'error': f"Jamf request failed: {error}"}
+        except Exception as error:
+            # An unexpected Jamf payload or a bug still gets a reply instead of a dropped connection
+            print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {method} {path} failed: {error!r}", file=sys.stderr, flush=True)
+            if self.server.verbose:
+                traceback.print_exc()
+            status, payload = 500, {'error': f"Internal error: {error!r}"}
+        self._send(status, payload)
+
+    def _route(self, method, path, query, body):
+        service = self.server.service
+        if path == '/actions' and method == 'GET':
+            return 200, service.describe()
+        if path == '/actions' and method == 'POST':
+            payload = json.loads(body or b'{}')
+            rows = prog_rows_from_request(payload)
+            dry_run = isinstance(payload, dict) and bool(payload.get('dry_run'))
+            results = service.run(rows, dry_run=dry_run)
+            for result in results:
+                if not dry_run:
+                    print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {self.client_address[0]} "
+                          f"{result['Serial Number']} {result['Action']} - {result['Status']}: {result['Details']}", flush=True)
+            summary = {}
+            for result in results:
+                summary[result['Status']] = summary.get(result['Status'], 0) + 1
+            return 200, {'results': results, 'summary': summary}
+        if path == '/devices' and method == 'GET':
+            keys = [key for key in query if key in MATCH_FIELDS]
+            if len(keys) != 1 or len(query) != 1:
+                raise ValueError(f"Look up by exactly one of: {', '.join(MATCH_FIELDS)}")
+            return 200, {'devices': service.find_devices(keys[0], query[keys[0]][0])}
+        if path == '/names/refresh' and method == 'POST':
+            return 200, {'missing': service.load_names(refresh=True)}
+        if path in ('/actions', '/devices', '/names/refresh'):
+            return 405, {'error': f"{method} is not supported on {path}"}
+        return 404, {'error': f"No such endpoint: {path}"}
+
+    def _send(self, status, payload):
+        content = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class ActionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, api_token, verbose=False):
+        super().__init__(address, ActionRequestHandler)
+        self.service = service
+        self.api_token = api_token
+        self.verbose = verbose
 
 
 # Program Functions
+def prog_summarize_inventory_row(device_type, row):
+    return {
+        'Device Type': device_type,
+        'ID': row['ID'],
+        'Device Name': row['Name'] if device_type == COMPUTER else row['Device Name'],
+        'Serial Number': row['Serial Number'],
+        'Username': row['Username'],
+    }
+
+
+def prog_read_batch_csv(path):
+    # Rows of serial_number, device_type, usage_type and action. Headers are matched
+    # case-insensitively with spaces or underscores; usage_type is only needed to prepare devices.
+    batch = pd.read_csv(path, dtype=str, keep_default_na=False, skip_blank_lines=True)
+    batch.columns = [column.strip().lower().replace(' ', '_') for column in batch.columns]
+    missing = [column for column in BATCH_COLUMNS if column not in batch.columns and column != 'usage_type']
+    if missing:
+        raise ValueError(f"{path} is missing the column(s): {', '.join(missing)}")
+    if 'usage_type' not in batch.columns:
+        batch['usage_type'] = ''
+    rows = []
+    for index, row in enumerate(batch[BATCH_COLUMNS].to_dict('records')):
+        row = {column: value.strip() for column, value in row.items()}
+        if any(row.values()):
+            # Line number in the file, counting the header
+            row['line'] = index + 2
+            rows.append(row)
+    return rows
+
+
+def prog_plan_batch_row(row, require_ids=True):
+    # The PreStage and static group changes a batch row asks for, as (operation, device category, ID)
+    # tuples. Raises ValueError with the reason when the row cannot be run. With require_ids=False
+    # (dry runs, which do not ask Jamf for names) a PreStage or group configured by name only is
+    # planned by its quoted name instead.
+    if not row['serial_number']:
+        raise ValueError("Missing serial number")
+    device = CATALOG.device_type(row['device_type'])
+    if device is None:
+        raise ValueError(f"Unknown device type '{row['device_type']}'")
+    device_category = device['device_category']
+    if row['action'].lower() in ('prepare', PREPARE_PURPOSE.lower()):
+        usage = CATALOG.usage_type(row['usage_type'], device['device_type'])
+        if usage is None:
+            raise ValueError(f"Unknown usage type '{row['usage_type']}' for {device['device_type']}")
+        prestage_id = prog_configured_id(usage, 'prestage_id', 'prestage_name', 'PreStage', require_ids)
+        if prestage_id is None:
+            raise ValueError(f"No PreStage configured for {usage['usage_type']}")
+        operations = [('prestage', device_category, prestage_id)]
+        for group in usage['static_groups']:
+            operations.append(('add_to_group', device_category,
+                               prog_configured_id(group, 'group_id', 'group_name', 'Static group', require_ids)))
+        return operations
+    sub_action = CATALOG.sub_action(DEVICE_CATEGORY_TYPES[device_category], row['action'])
+    if sub_action is None:
+        raise ValueError(f"Unknown action '{row['action']}' for {device['device_type']}")
+    group_id = prog_configured_id(sub_action, 'group_id', 'group_name', 'Static group', require_ids)
+    if group_id is None:
+        raise ValueError(f"No group configured for {sub_action['description']}")
+    operation = 'remove_from_group' if sub_action['remove_from_group'] else 'add_to_group'
+    return [(operation, device_category, group_id)]
+
+
+def prog_configured_id(entry, id_key, name_key, label, require_ids):
+    # The entry's Jamf ID as a string, whether configured as 175 or '175', so planned operations
+    # match the keys StaticGroupChanges reports errors under; None when neither an ID nor a name is configured
+    if entry.get(id_key):
+        return str(entry[id_key])
+    if not entry.get(name_key):
+        return None
+    if require_ids:
+        # Names are resolved before a batch runs, so a name still without an ID is not in Jamf
+        raise ValueError(f"{label} '{entry[name_key]}' was not found in Jamf")
+    return f"'{entry[name_key]}'"
+
+
+def prog_plan_batch(rows):
+    # Dry run: what each row would change, without calling Jamf
+    results = [prog_batch_result(row) for row in rows]
+    for result, row in zip(results, rows):
+        try:
+            result['operations'] = prog_plan_batch_row(row, require_ids=False)
+        except ValueError as error:
+            result['Status'] = 'FAILED'
+            result['Details'] = str(error)
+    superseded = prog_find_superseded_group_changes(results)
+    for result in results:
+        operations = result.pop('operations', None)
+        if operations is None:
+            continue
+        details = []
+        for operation in operations:
+            error = superseded.get((result['Line'], operation))
+            details.append(prog_describe_operation(operation) + (f" failed: {error}" if error is not None else ''))
+        result['Status'] = 'FAILED' if any((result['Line'], operation) in superseded for operation in operations) else 'PLANNED'
+        result['Details'] = '; '.join(details)
+    return results
+
+
+def prog_find_superseded_group_changes(results):
+    # A static group gets one update per batch, so when a later row removes a device that an earlier
+    # row adds to the same group (or adds one it removes), only the later change is applied.
+    # Returns {(line, operation): reason} for the earlier changes, which are not sent and fail their row.
+    pending = {}
+    superseded = {}
+    for result in results:
+        for operation in result.get('operations', []):
+            if operation[0] == 'prestage':
+                continue
+            key = (DEVICE_CATEGORY_TYPES[operation[1]], operation[2], result['Serial Number'])
+            previous = pending.get(key, [])
+            if previous and previous[0][1][0] != operation[0]:
+                for line, earlier in previous:
+                    superseded[(line, earlier)] = f"superseded by line {result['Line']} ({prog_describe_operation(operation)})"
+                previous = []
+            pending[key] = previous + [(result['Line'], operation)]
+    return superseded
+
+
+def prog_resolve_catalog_names(jamf_session, max_age=DEFAULT_NAMES_MAX_AGE, refresh=False):
+    # Rebuilds CATALOG with the IDs of PreStages and groups configured by name only, from the cached
+    # names while they are fresh. Nothing is fetched when every entry has an ID.
+    # Returns descriptions of the names Jamf does not have.
+    global CATALOG
+    catalog = ActionCatalog(PROGRAM_DICT, DEVICE_DICT, DEVICE_CATEGORY_TYPES)
+    missing = []
+    if catalog.unresolved():
+        names = mdm_load_jamf_names(jamf_session, max_age=max_age, refresh=refresh)
+        missing = catalog.resolve_ids(names)
+    CATALOG = catalog
+    return missing
+
+
+def prog_rows_from_request(payload):
+    # API requests send one row object or {"rows": [...]}, with the batch CSV's column names
+    rows = payload.get('rows', [payload]) if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("Send a JSON object with serial_number, device_type, usage_type and action, or {\"rows\": [...]}")
+    normalized = []
+    for index, row in enumerate(rows):
+        for column in BATCH_COLUMNS:
+            if isinstance(row.get(column), (list, dict)):
+                raise ValueError(f"Row {index + 1}: {column} must be a string, not {type(row[column]).__name__}")
+        normalized.append(dict({column: str(row.get(column) or '').strip() for column in BATCH_COLUMNS}, line=index + 1))
+    return normalized
+
+
+def prog_content_length(value):
+    # Content-Length header -> body size; a missing header means no body
+    if value is None or not value.strip():
+        return 0
+    try:
+        length = int(value)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise ValueError(f"Invalid Content-Length: {value!r}")
+    return length
+
+
+def prog_load_api_token(path):
+    # Reads the server's API token, creating an owner-only file with a random one the first time
+    path = os.path.expanduser(path)
+    if os.path.exists(path):
+        return prog_read_secret_file(path)
+    os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as token_file:
+        token_file.write(token + '\n')
+    return token
+
+
+def prog_describe_operation(operation):
+    operation, device_category, target_id = operation
+    if operation == 'prestage':
+        return f"assign to PreStage {target_id}"
+    if operation == 'add_to_group':
+        return f"add to group {target_id}"
+    return f"remove from group {target_id}"
+
+
+def prog_batch_result(row):
+    return {
+        'Line': row['line'],
+        'Serial Number': row['serial_number'].upper(),
+        'Device Type': row['device_type'],
+        'Usage Type': row['usage_type'],
+        'Action': row['action'],
+        'Status': '',
+        'Details': '',
+    }
+
+
+def prog_print_batch_results(results, elapsed=None):
+    for result in results:
+        print(f"Line {result['Line']}: {result['Serial Number']} {result['Action']} - {result['Status']}: {result['Details']}")
+    counts = {}
+    for result in results:
+        counts[result['Status']] = counts.get(result['Status'], 0) + 1
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"\n{len(results)} rows: {summary or 'nothing to do'}" + (f" in {elapsed:.1f}s" if elapsed is not None else ''))
+
 
-def prog_get_device_category(device_type):
-    for item in DEVICE_DICT:
-        if item['device_type'] == device_type:
-            device_category = item['device_category']
-    return device_category
+def prog_print_devices(devices):
+    if not devices:
+        print("No devices found.")
+    for device in devices:
+        print(f"{device['Device Type']} {device['ID']}: {device['Device Name']} "
+              f"(Serial Number: {device['Serial Number']}, Username: {device['Username']})")
 
 
-def prog_get_prestage_id(usage_type):
-    for category in DEVICE_DICT:
-        for device in category['usage_types']:
-            if usage_type == device['usage_type']:
-                prestage_id = device['prestage_id']
-    return prestage_id
+def prog_prompt_for_choice(choices, prompt):
+    # Asks for an option number twice until both entries match one of choices (option -> label)
+    choice_input = ''
+    choice_input_check = 'a'
+    while choice_input != choice_input_check or choice_input not in choices:
+        print("\n")
+        for option, label in choices.items():
+            print(f"({option}) {label}")
+        choice_input = input(f"Enter the number for {prompt}: ")
+        choice_input_check = input(f"Re-enter the number for {prompt}: ")
+    return choices[choice_input]
 
 
 def prog_prompt_for_serial_number():
@@ -314,115 +872,166 @@ def prog_prompt_for_serial_number():
 
 
 def prog_prompt_for_device_type():
-    device_type_input = ''
-    device_type_input_check = 'a'
-    print("\n")
-    for item in DEVICE_DICT:
-        print(f"({item['option']}) {item['device_type']}")
-    while device_type_input != device_type_input_check:
-        device_type_input = input("Enter the number for Device Type: ")
-        device_type_input_check = input("Re-enter the number for Device Type: ")
-    for item in DEVICE_DICT:
-        if item['option'] == device_type_input:
-            device_type = item['device_type']
-    return device_type
+    return prog_prompt_for_choice(CATALOG.device_type_options, 'Device Type')
 
 
 def prog_prompt_for_usage_type(device_type):
-    usage_type_input = ''
-    usage_type_input_check = 'a'
-    print("\n")
-    for category in DEVICE_DICT:
-        if device_type == category['device_type']:
-            usage_type_list = category['usage_types']
-    for item in usage_type_list:
-        print(f"({item['option']}) {item['usage_type']}")
-    while usage_type_input != usage_type_input_check:
-        usage_type_input = input("Enter the number for Usage Type: ")
-        usage_type_input_check = input("Re-enter number for the Usage Type: ")
-    for item in usage_type_list:
-        if item['option'] == usage_type_input:
-            usage_type = item['usage_type']
-    return usage_type
-
+    usage_options = CATALOG.device_type(device_type)['usage_options']
+    choices = {option: usage['usage_type'] for option, usage in usage_options.items()}
+    return prog_prompt_for_choice(choices, 'Usage Type')
+
+
+def prog_build_parser():
+    parser = argparse.ArgumentParser(description='Perform quick Jamf actions on a device or user.')
+    parser.add_argument('--batch', metavar='CSV', default=None,
+                        help='run the actions in a CSV of serial_number, device_type, usage_type and action instead of the menu')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'batch requests in flight at once (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--results', default=None,
+                        help='where to write per-row batch results (default: {date}_mdm_actions_batch_results.csv)')
+    parser.add_argument('--names-max-age', type=int, default=DEFAULT_NAMES_MAX_AGE,
+                        help=f'seconds to reuse cached group and PreStage names (default: {DEFAULT_NAMES_MAX_AGE})')
+    parser.add_argument('--refresh-names', action='store_true', help='fetch group and PreStage names from Jamf even if cached')
+    parser.add_argument('--dry-run', action='store_true', help='check the batch CSV and show what would change without calling Jamf')
+    parser.add_argument('--serve', action='store_true',
+                        help='keep running and serve the actions over a local HTTP/JSON API instead of the menu')
+    parser.add_argument('--host', default=DEFAULT_SERVE_HOST, help=f'address to serve on (default: {DEFAULT_SERVE_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_SERVE_PORT, help=f'port to serve on (default: {DEFAULT_SERVE_PORT})')
+    parser.add_argument('--api-token-file', default=DEFAULT_API_TOKEN_PATH,
+                        help='file holding the token API clients must send, created on first start '
+                             f'(default: {DEFAULT_API_TOKEN_PATH})')
+    parser.add_argument('--inventory', default=DEFAULT_INVENTORY_PATH,
+                        help=f'SQLite inventory store written by mdm_report, used for device lookups (default: {DEFAULT_INVENTORY_PATH})')
+    parser.add_argument('--verbose', action='store_true', help='log every API request')
+    mdm_add_config_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    # Jamf URL and credentials come from the command line, environment or config file;
+    # anything still missing is prompted for unless --non-interactive
+    parser = prog_build_parser()
+    try:
+        args, config = mdm_parse_args(parser, 'mdm_actions', argv)
+        credentials = mdm_load_credentials(args, config, prompts={
+            'url': 'Enter your Jamf Pro Environment URL',
+            'username': 'Enter your Jamf Pro username',
+            'password': 'Enter your Jamf Pro password',
+        })
+    except ConfigError as error:
+        parser.error(str(error))
+
+    if args.batch:
+        try:
+            rows = prog_read_batch_csv(args.batch)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    if args.batch and args.dry_run:
+        results = prog_plan_batch(rows)
+        prog_print_batch_results(results)
+        if any(result['Status'] != 'PLANNED' for result in results):
+            sys.exit(1)
+        return
+
+    local_user = getpass.getuser()
+    script_name = os.path.basename(__file__)
+    log = f"*{script_name} log:*\n" \
+          f"User: {local_user}"
+    jamf_session = JamfSession(credentials.url, credentials.username, credentials.password)
+    # Written by each mdm_report run; lookups answer from it while it is fresh
+    inventory = InventoryStore(args.inventory)
+
+    # The store and the pooled session are closed however the run ends
+    try:
+        # Generate MDM token
+        mdm_get_token(jamf_session)
+
+        # Look up the IDs of PreStages and groups configured by name only, from a cached copy while it is fresh
+        missing_names = prog_resolve_catalog_names(jamf_session, args.names_max_age, args.refresh_names)
+        for missing in missing_names:
+            print(f"Warning: {missing} was not found in Jamf")
+
+        if args.serve:
+            try:
+                api_token = prog_load_api_token(args.api_token_file)
+            except (ConfigError, OSError) as error:
+                parser.error(str(error))
+            service = ActionService(jamf_session, inventory, workers=args.workers, names_max_age=args.names_max_age)
+            service.names_loaded_at = time.time()
+            service.missing_names = missing_names
+            server = ActionServer((args.host, args.port), service, api_token, verbose=args.verbose)
+            print(f"Serving mdm_actions for {credentials.url} at http://{args.host}:{server.server_address[1]} "
+                  f"(API token in {os.path.expanduser(args.api_token_file)})", flush=True)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return
+
+        if args.batch:
+            started = time.perf_counter()
+            results = mdm_run_batch(jamf_session, rows, workers=args.workers)
+            prog_print_batch_results(results, time.perf_counter() - started)
+            results_path = args.results or f"{TODAY}_mdm_actions_batch_results.csv"
+            pd.DataFrame(results, columns=BATCH_RESULT_COLUMNS).to_csv(results_path, index=False)
+            print(f"Results saved to {results_path}")
+            if any(result['Status'] != 'OK' for result in results):
+                sys.exit(1)
+            return
+
+        # Prompt for Purpose
+        purpose = prog_prompt_for_choice({option: item['purpose'] for option, item in CATALOG.purposes.items()},
+                                         "what you'd like to do")
+
+        if purpose == 'Prepare Device in MDM Before Setup':
+
+            # Prompt for Serial Number
+            serial_number = prog_prompt_for_serial_number()
+
+            # Prompt for Device Type
+            device_type = prog_prompt_for_device_type()
+
+            # Prompt for Usage Type
+            usage_type = prog_prompt_for_usage_type(device_type)
+
+            # Prompt for reason
+            description = ''
+            while description == '':
+                description = input("\nPlease enter a description of why you are initiating this request: ")
+
+            # Generate Summary Header
+            message = f"{log}\n" \
+                      f"Purpose: {purpose}\n" \
+                      f"Description: {description}\n" \
+                      f"Device Type: {device_type}\n" \
+                      f"Usage Type: {usage_type}\n" \
+                      f"Serial Number: {serial_number}\n" \
+                      f"*Activity*"
+            print(f"\n{message}")
+
+        elif purpose == 'Lookup Devices Issued to User':
+
+            # Prompt for Lookup Type
+            lookup_choices = CATALOG.purposes[CATALOG.purpose_options[purpose.lower()]]['choices']
+            lookup = prog_prompt_for_choice(lookup_choices, "how you'd like to look up the user")
+
+            # User ID is the Jamf username; User Name is the user's full name
+            if lookup == 'Lookup by User ID':
+                user = input("\nEnter the User ID: ")
+                devices = mdm_find_devices(jamf_session, inventory, 'username', user)
+            else:
+                user = input("\nEnter the User's Full Name: ")
+                devices = mdm_find_devices(jamf_session, inventory, 'full_name', user)
+            prog_print_devices(devices)
+
+    finally:
+        inventory.close()
+        jamf_session.close()
 
 
 # ---------- PROGRAM START ---------- #
 
-
-# Generate MDM token
-token = mdm_get_token(jamf_url, username, password)
-
-
-# Prompt for Purpose
-purpose_input = ''
-purpose_input_check = 'a'
-while purpose_input != purpose_input_check:
-    print("\n")
-    for item in PROGRAM_DICT:
-        print(f"({item['option']}) {item['purpose']}")
-    purpose_input = input("Enter the number for what you'd like to do: ")
-    purpose_input_check = input("Re-enter the number for what you'd like to do: ")
-for item in PROGRAM_DICT:
-    if item['option'] == purpose_input:
-        purpose = item['purpose']
-
-if purpose == 'Prepare Device in MDM Before Setup':
-
-    # Prompt for Serial Number
-    serial_number = prog_prompt_for_serial_number()
-
-    # Prompt for Device Type
-    device_type = prog_prompt_for_device_type()
-
-    # Prompt for Usage Type
-    usage_type = prog_prompt_for_usage_type(device_type)
-
-    # Get Device Category
-    device_category = prog_get_device_category(device_type)
-
-    # Get PreStage ID
-    prestage_id = prog_get_prestage_id(usage_type)
-
-    # Prompt for reason
-    description = ''
-    while description == '':
-        description = input("\nPlease enter a description of why you are initiating this request: ")
-
-    # Generate Summary Header
-    message_header = f"{message}\n" \
-                     f"Purpose: {purpose}\n" \
-                     f"Description: {description}\n" \
-                     f"Device Type: {device_type}\n" \
-                     f"Usage Type: {usage_type}\n" \
-                     f"Serial Number: {serial_number}\n" \
-                     f"*Activity*"
-
-    message = message_header
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# --------------- ACTION CATALOG --------------- #
+
+# Shared MDM Modules
+from mdm_common.config import ConfigError
+
+
+class ActionCatalog:
+    # mdm_actions' PROGRAM_DICT menu and DEVICE_DICT device catalog compiled into dict indexes
+    # once at load time, so menu choices, batch rows and API requests are resolved in O(1).
+    # A malformed catalog (missing keys, duplicate options or names, unknown device categories,
+    # non-numeric Jamf IDs) raises ConfigError here instead of failing mid-run.
+    # device_categories maps each DEVICE_DICT device_category to its inventory device type.
+    def __init__(self, program_dict, device_dict, device_categories):
+        self.device_categories = device_categories
+        self.purposes = {}
+        self.purpose_options = {}
+        self.device_types = {}
+        self.device_type_options = {}
+        self.usage_types = {}
+        self.sub_actions = {}
+        for item in program_dict:
+            self._add_purpose(item)
+        for item in device_dict:
+            self._add_device_type(item, device_categories)
+
+    def _add_purpose(self, item):
+        option = prog_required(item, 'option', 'PROGRAM_DICT')
+        purpose = prog_required(item, 'purpose', 'PROGRAM_DICT')
+        options = item.get('options', [])
+        # Follow-up menu choices (e.g. lookup by user ID or name) by their option number
+        choices = {}
+        for choice in (options if isinstance(options, list) else []):
+            choice_option = choice.get('option') or choice.get('sub-option')
+            prog_add_unique(choices, prog_required({'option': choice_option}, 'option', f"PROGRAM_DICT {purpose} choice"),
+                            prog_required(choice, 'description', f"PROGRAM_DICT {purpose} choice"),
+                            f"PROGRAM_DICT {purpose} choice {choice_option}")
+        prog_add_unique(self.purposes, option, dict(item, choices=choices), f"PROGRAM_DICT option {option}")
+        prog_add_unique(self.purpose_options, purpose.lower(), option, f"PROGRAM_DICT purpose '{purpose}'")
+        # Management actions are listed per device type, with the sub-actions that work through static groups
+        for device_type, actions in (options.items() if isinstance(options, dict) else []):
+            for action in actions:
+                for sub_action in action.get('sub-actions', []):
+                    self._add_sub_action(device_type, action, sub_action)
+
+    def _add_sub_action(self, device_type, action, sub_action):
+        description = prog_required(sub_action, 'description', 'PROGRAM_DICT sub-action')
+        if action['description'].startswith('Remove'):
+            # Removing an item adds the device to the item's exclusion group
+            remove = False
+        elif action['description'].startswith('Re-add'):
+            remove = True
+        else:
+            raise ConfigError(f"PROGRAM_DICT sub-action '{description}' belongs to '{action['description']}', "
+                              f"which is neither a Remove nor a Re-add action")
+        prog_check_jamf_id(sub_action.get('group_id', ''), f"group_id of PROGRAM_DICT sub-action '{description}'")
+        entry = dict(sub_action, device_type=device_type, remove_from_group=remove)
+        prog_add_unique(self.sub_actions, (device_type, description.lower()), entry, f"PROGRAM_DICT sub-action '{description}'")
+
+    def _add_device_type(self, item, device_categories):
+        device_type = prog_required(item, 'device_type', 'DEVICE_DICT')
+        option = prog_required(item, 'option', f"DEVICE_DICT {device_type}")
+        device_category = prog_required(item, 'device_category', f"DEVICE_DICT {device_type}")
+        if device_category not in device_categories:
+            raise ConfigError(f"DEVICE_DICT {device_type} has unknown device_category '{device_category}'")
+        entry = dict(item, usage_options={})
+        prog_add_unique(self.device_types, device_type.lower(), entry, f"DEVICE_DICT device_type '{device_type}'")
+        prog_add_unique(self.device_type_options, option, device_type, f"DEVICE_DICT option {option}")
+        for usage in item.get('usage_types', []):
+            usage_type = prog_required(usage, 'usage_type', f"DEVICE_DICT {device_type} usage type")
+            usage_option = prog_required(usage, 'option', f"DEVICE_DICT {usage_type}")
+            prog_check_jamf_id(usage.get('prestage_id', ''), f"prestage_id of {usage_type}")
+            # Placeholder groups with neither a name nor an ID are left out
+            static_groups = [dict(group) for group in usage.get('static_groups', []) if group.get('group_id') or group.get('group_name')]
+            for group in static_groups:
+                prog_check_jamf_id(group.get('group_id', ''), f"group_id of a {usage_type} static group")
+            usage_entry = dict(usage, device_type=device_type, device_category=device_category, static_groups=static_groups)
+            # Usage types are looked up on their own, so they must be unique across device types
+            prog_add_unique(self.usage_types, usage_type.lower(), usage_entry, f"DEVICE_DICT usage_type '{usage_type}'")
+            prog_add_unique(entry['usage_options'], usage_option, usage_entry, f"DEVICE_DICT {device_type} usage option {usage_option}")
+
+    def unresolved(self):
+        # (kind, device type, name, entry, ID key) for each PreStage or group configured by name only
+        references = []
+        for usage in self.usage_types.values():
+            device_type = self.device_categories[usage['device_category']]
+            if usage.get('prestage_name') and not usage['prestage_id']:
+                references.append(('prestage', device_type, usage['prestage_name'], usage, 'prestage_id'))
+            for group in usage['static_groups']:
+                if not group.get('group_id'):
+                    references.append(('group', device_type, group['group_name'], group, 'group_id'))
+        for sub_action in self.sub_actions.values():
+            if sub_action.get('group_name') and not sub_action.get('group_id'):
+                references.append(('group', sub_action['device_type'], sub_action['group_name'], sub_action, 'group_id'))
+        return references
+
+    def resolve_ids(self, names):
+        # Fills in the IDs of name-only entries from names (a JamfNames), in memory only.
+        # Returns descriptions of the names Jamf does not have, each once even when several entries use it.
+        missing = []
+        for kind, device_type, name, entry, key in self.unresolved():
+            if kind == 'group':
+                jamf_id = names.group_id(device_type, name)
+            else:
+                jamf_id = names.prestage_id(device_type, name)
+            if jamf_id is None:
+                missing.append(f"{device_type} {'static group' if kind == 'group' else 'PreStage'} '{name}'")
+            else:
+                entry[key] = jamf_id
+        return list(dict.fromkeys(missing))
+
+    def purpose(self, option):
+        return self.purposes.get(option)
+
+    def device_type(self, name):
+        return self.device_types.get(name.strip().lower())
+
+    def usage_type(self, name, device_type=None):
+        # Only a usage type of device_type, when given
+        usage = self.usage_types.get(name.strip().lower())
+        if usage is None or (device_type is not None and usage['device_type'].lower() != device_type.strip().lower()):
+            return None
+        return usage
+
+    def sub_action(self, device_type, description):
+        return self.sub_actions.get((device_type, description.strip().lower()))
+
+
+def prog_required(item, key, where):
+    value = item.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise ConfigError(f"{where} entry is missing '{key}': {item}")
+    return value
+
+
+def prog_add_unique(index, key, value, where):
+    if key in index:
+        raise ConfigError(f"Duplicate {where}")
+    index[key] = value
+
+
+def prog_check_jamf_id(value, where):
+    # Jamf object IDs are numeric; blank means not configured yet
+    if value and not str(value).isdigit():
+        raise ConfigError(f"Invalid {where}: '{value}' is not a Jamf ID")
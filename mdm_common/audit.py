@@ -0,0 +1,89 @@
+# --------------- AUDIT RULES --------------- #
+
+# Pandas
+import pandas as pd
+
+# Derived Columns
+from mdm_common.derived_columns import prog_apply_to_unique
+
+# Up to four dotted version components, each below 10000, packed into one sortable integer
+VERSION_PATTERN = r'^\s*(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:\.(\d+))?'
+VERSION_COMPONENT_SCALE = 10000
+
+
+def prog_version_key(series):
+    # '15.1' -> 15_0001_0000_0000; unparseable or blank versions become missing
+    def to_key(values):
+        parts = values.str.extract(VERSION_PATTERN).apply(pd.to_numeric).fillna(0)
+        key = pd.Series(0, index=values.index, dtype='Int64')
+        for column in parts.columns:
+            key = key * VERSION_COMPONENT_SCALE + parts[column].astype('Int64')
+        return key.where(values.str.match(VERSION_PATTERN).fillna(False))
+    return prog_apply_to_unique(series, to_key).astype('Int64')
+
+
+class AuditColumns:
+    # Converted views of report columns, computed once and shared by every rule
+    def __init__(self, df):
+        self.df = df
+        self._numeric = {}
+        self._version_keys = {}
+
+    def numeric(self, column):
+        if column not in self._numeric:
+            self._numeric[column] = pd.to_numeric(self.df[column].where(self.df[column] != ''), errors='coerce')
+        return self._numeric[column]
+
+    def version_key(self, column):
+        if column not in self._version_keys:
+            self._version_keys[column] = prog_version_key(self.df[column])
+        return self._version_keys[column]
+
+
+class AuditRule:
+    # predicate(audit_columns) returns a boolean mask of the rows that fail the audit
+    def __init__(self, title, columns, predicate):
+        self.title = title
+        self.columns = columns
+        self.predicate = predicate
+
+
+def audit_at_least(column, threshold):
+    return lambda audit_columns: audit_columns.numeric(column) >= threshold
+
+
+def audit_at_most(column, threshold):
+    return lambda audit_columns: audit_columns.numeric(column) <= threshold
+
+
+def audit_version_below(column, minimum_version):
+    minimum_key = prog_version_key(pd.Series([minimum_version]))[0]
+    return lambda audit_columns: audit_columns.version_key(column) < minimum_key
+
+
+def mdm_run_audits(df, rules):
+    # Yields (rule, failing rows) for each rule. Blank cells never fail a rule.
+    audit_columns = AuditColumns(df)
+    for rule in rules:
+        mask = rule.predicate(audit_columns).fillna(False).astype(bool)
+        yield rule, df.loc[mask, rule.columns]
+
+
+# Each rule selects the devices that fail it; all rules share one set of converted columns
+MOBILE_DEVICE_AUDITS = [
+    AuditRule(
+        'Mobile Devices with Full Storage',
+        ['Device Name', 'Username', 'Serial Number', 'Percentage Used'],
+        audit_at_least('Percentage Used', 80),
+    ),
+    AuditRule(
+        'Mobile Devices with Low Battery',
+        ['Device Name', 'Username', 'Serial Number', 'Battery Level'],
+        audit_at_most('Battery Level', 20),
+    ),
+    AuditRule(
+        'Mobile Devices with out of date software',
+        ['Device Name', 'Username', 'OS Version', 'Serial Number'],
+        audit_version_below('OS Version', '15.0'),
+    ),
+]
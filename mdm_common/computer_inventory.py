@@ -0,0 +1,130 @@
+# --------------- COMPUTER INVENTORY --------------- #
+
+# Pagination
+from mdm_common.pagination import JamfPager
+
+# Only the sections the computer report reads are requested
+COMPUTER_INVENTORY_SECTIONS = [
+    'GENERAL',
+    'USER_AND_LOCATION',
+    'HARDWARE',
+    'OPERATING_SYSTEM',
+    'SECURITY',
+    'STORAGE',
+]
+
+# Jamf Pro API enums differ from the Classic API display strings the report has always used
+GATEKEEPER_STATUS = {
+    'APP_STORE_AND_IDENTIFIED_DEVELOPERS': 'App Store and identified developers',
+    'APP_STORE': 'App Store',
+    'ANYWHERE': 'Anywhere',
+}
+
+
+def _value(section, key):
+    # Classic API returns '' for unset fields, which the report's blank handling expects
+    value = section.get(key)
+    return '' if value is None else value
+
+
+def _display(value, names=None):
+    if not isinstance(value, str) or value == '':
+        return value
+    if names and value in names:
+        return names[value]
+    return value.replace('_', ' ').capitalize()
+
+
+def mdm_get_computer_inventory(fetch_json, jamf_url, page_size):
+    # Paginated /api/v1/computers-inventory listing limited to the report's sections
+    params = '&'.join(f"section={section}" for section in COMPUTER_INVENTORY_SECTIONS)
+    endpoint = f"{jamf_url}/api/v1/computers-inventory"
+    return JamfPager(fetch_json, endpoint, page_size=page_size, params=f"{params}&sort=id%3Aasc")
+
+
+def mdm_get_name_lookup(fetch_json, endpoint, page_size):
+    # Departments and buildings come back as IDs from the inventory endpoint
+    return {item['id']: item['name'] for item in JamfPager(fetch_json, endpoint, page_size=page_size)}
+
+
+def prog_convert_inventory_to_classic(record, departments, buildings):
+    # Reshape a computers-inventory record into the JSSResource/computers/id layout
+    general = record.get('general') or {}
+    location = record.get('userAndLocation') or {}
+    hardware = record.get('hardware') or {}
+    operating_system = record.get('operatingSystem') or {}
+    security = record.get('security') or {}
+    storage = []
+    disks = (record.get('storage') or {}).get('disks') or []
+    # Boot disk and boot partition first, matching the Classic API's order
+    disks = sorted(disks, key=lambda disk: not any(
+        partition.get('partitionType') == 'BOOT' for partition in disk.get('partitions') or []
+    ))
+    for disk in disks:
+        partitions = sorted(disk.get('partitions') or [], key=lambda partition: partition.get('partitionType') != 'BOOT')
+        storage.append({
+            'drive_capacity_mb': _value(disk, 'sizeMegabytes'),
+            'partitions': [
+                {
+                    'available_mb': _value(partition, 'availableMegabytes'),
+                    'filevault_status': _display(_value(partition, 'fileVault2State')),
+                }
+                for partition in partitions
+            ],
+        })
+    return {
+        'general': {
+            'ip_address': _value(general, 'lastIpAddress'),
+            'management_status': {
+                'enrolled_via_dep': _value(general, 'enrolledViaAutomatedDeviceEnrollment'),
+            },
+            'name': _value(general, 'name'),
+            'serial_number': _value(hardware, 'serialNumber'),
+            'udid': _value(record, 'udid'),
+            'report_date': _value(general, 'reportDate'),
+            'last_contact_time': _value(general, 'lastContactTime'),
+            'last_enrolled_date_utc': _value(general, 'lastEnrolledDate'),
+            'mdm_profile_expiration_utc': _value(general, 'mdmProfileExpiration'),
+        },
+        'location': {
+            'username': _value(location, 'username'),
+            'realname': _value(location, 'realname'),
+            'email_address': _value(location, 'email'),
+            'position': _value(location, 'position'),
+            'department': departments.get(location.get('departmentId'), ''),
+            'building': buildings.get(location.get('buildingId'), ''),
+            'room': _value(location, 'room'),
+        },
+        'hardware': {
+            'model': _value(hardware, 'model'),
+            'model_identifier': _value(hardware, 'modelIdentifier'),
+            'os_version': _value(operating_system, 'version'),
+            'processor_type': _value(hardware, 'processorType'),
+            'is_apple_silicon': _value(hardware, 'appleSilicon'),
+            'processor_architecture': _value(hardware, 'processorArchitecture'),
+            'number_cores': _value(hardware, 'coreCount'),
+            'total_ram_mb': _value(hardware, 'totalRamMegabytes'),
+            'battery_capacity': _value(hardware, 'batteryCapacityPercent'),
+            'sip_status': _display(_value(security, 'sipStatus')),
+            'gatekeeper_status': _display(_value(security, 'gatekeeperStatus'), GATEKEEPER_STATUS),
+            'storage': storage,
+        },
+    }
+
+
+def mdm_iter_computers_in_bulk(fetch_json, jamf_url, page_size):
+    # Yields (device_id, computer) pairs in the same shape as the per-device fetch engine,
+    # using about N / page_size requests instead of one request per device
+    departments = mdm_get_name_lookup(fetch_json, f"{jamf_url}/api/v1/departments", page_size)
+    buildings = mdm_get_name_lookup(fetch_json, f"{jamf_url}/api/v1/buildings", page_size)
+    computers = mdm_get_computer_inventory(fetch_json, jamf_url, page_size)
+    total_count = computers.total_count
+
+    def generate():
+        for record in computers:
+            device_id = record['id']
+            if isinstance(device_id, str) and device_id.isdigit():
+                device_id = int(device_id)
+            yield device_id, prog_convert_inventory_to_classic(record, departments, buildings)
+
+    return total_count, generate()
@@ -0,0 +1,152 @@
+# --------------- CONFIGURATION --------------- #
+
+# Arguments
+import argparse
+import configparser
+
+# Getpass
+import getpass
+
+# Files
+import os
+import stat
+
+# Config file with a [jamf] section and optional per-script sections of option defaults
+DEFAULT_CONFIG_PATH = os.path.join(os.path.expanduser('~'), '.config', 'mdm_scripts', 'config.ini')
+CONFIG_ENV = 'MDM_SCRIPTS_CONFIG'
+URL_ENV = 'JAMF_URL'
+USERNAME_ENV = 'JAMF_USERNAME'
+PASSWORD_ENV = 'JAMF_PASSWORD'
+PASSWORD_FILE_ENV = 'JAMF_PASSWORD_FILE'
+
+
+class ConfigError(Exception):
+    pass
+
+
+class JamfCredentials:
+    def __init__(self, url, username, password):
+        self.url = url.rstrip('/')
+        self.username = username
+        self.password = password
+
+
+def mdm_add_config_arguments(parser):
+    # Options shared by every script for loading settings and credentials without prompting
+    parser.add_argument('--config', default=None,
+                        help=f'config file (default: ${CONFIG_ENV} or {DEFAULT_CONFIG_PATH} if it exists)')
+    parser.add_argument('--jamf-url', default=None, help=f'Jamf Pro URL (default: ${URL_ENV} or [jamf] url)')
+    parser.add_argument('--username', default=None, help=f'Jamf API username (default: ${USERNAME_ENV} or [jamf] username)')
+    parser.add_argument('--password-file', default=None,
+                        help=f'file holding only the Jamf API password, readable by its owner alone '
+                             f'(default: ${PASSWORD_FILE_ENV} or [jamf] password_file)')
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='fail instead of prompting when a setting is missing, for scheduled runs')
+
+
+def mdm_load_config(path=None, environ=os.environ):
+    # The explicit path must exist; the default location is optional
+    path = path or environ.get(CONFIG_ENV)
+    config = configparser.ConfigParser(interpolation=None)
+    if path is None:
+        config.read(DEFAULT_CONFIG_PATH)
+        return config
+    path = os.path.expanduser(path)
+    if not os.path.exists(path):
+        raise ConfigError(f"Config file not found: {path}")
+    config.read(path)
+    return config
+
+
+def mdm_parse_args(parser, section, argv=None, environ=os.environ):
+    # Parses argv with the config file's [section] values as option defaults, so a scheduled
+    # run can keep its options in the config file. Command-line options still win.
+    known, _ = parser.parse_known_args(argv)
+    config = mdm_load_config(known.config, environ)
+    if config.has_section(section):
+        parser.set_defaults(**prog_config_defaults(parser, config[section]))
+    args = parser.parse_args(argv)
+    return args, config
+
+
+def prog_config_defaults(parser, section):
+    # Converts config values with each option's own type; unknown keys are an error
+    actions = {action.dest: action for action in parser._actions}
+    defaults = {}
+    for key, value in section.items():
+        dest = key.replace('-', '_')
+        action = actions.get(dest)
+        if action is None or dest in ('help', 'config'):
+            raise ConfigError(f"Unknown option in [{section.name}]: {key}")
+        if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction)):
+            try:
+                defaults[dest] = section.getboolean(key)
+            except ValueError:
+                raise ConfigError(f"Invalid value for {key} in [{section.name}]: {value} (expected true or false)")
+            continue
+        convert = action.type or str
+        try:
+            if action.nargs in ('+', '*'):
+                defaults[dest] = [convert(item) for item in value.split()]
+            else:
+                defaults[dest] = convert(value)
+        except (TypeError, ValueError) as error:
+            raise ConfigError(f"Invalid value for {key} in [{section.name}]: {value} ({error})")
+        if action.choices is not None:
+            values = defaults[dest] if isinstance(defaults[dest], list) else [defaults[dest]]
+            for item in values:
+                if item not in action.choices:
+                    raise ConfigError(f"Invalid value for {key} in [{section.name}]: {item}")
+    return defaults
+
+
+def prog_read_secret_file(path):
+    # Like an SSH key, the file must not be readable by anyone but its owner
+    path = os.path.expanduser(path)
+    try:
+        mode = os.stat(path).st_mode
+    except OSError as error:
+        raise ConfigError(f"Cannot read password file {path}: {error.strerror}")
+    if os.name == 'posix' and mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise ConfigError(f"Password file {path} is accessible by other users; run chmod 600 {path}")
+    with open(path) as secret_file:
+        return secret_file.read().rstrip('\r\n')
+
+
+def prog_prompt(label, secret=False):
+    try:
+        return getpass.getpass(f"{label}: ") if secret else input(f"{label}: ")
+    except EOFError:
+        raise ConfigError(f"{label} was not configured and there is no input to prompt for it")
+
+
+def mdm_load_credentials(args, config, prompts=None, environ=os.environ):
+    # Each setting comes from the first source that has it: command line, environment, config file,
+    # then an interactive prompt (unless --non-interactive). The password is only ever read from
+    # $JAMF_PASSWORD, a password file or the prompt, never from the config file itself.
+    # prompts optionally overrides the prompt text for 'url', 'username' and 'password'.
+    prompts = dict({'url': 'Jamf Pro URL', 'username': 'Jamf API username', 'password': 'Jamf API password'}, **(prompts or {}))
+    jamf = config['jamf'] if config.has_section('jamf') else {}
+    if 'password' in jamf:
+        raise ConfigError("Keep the password out of the config file; point [jamf] password_file at a chmod 600 file instead")
+
+    def resolve(name, option, flag, env, key):
+        value = option or environ.get(env) or jamf.get(key)
+        if value:
+            return value
+        if args.non_interactive:
+            raise ConfigError(f"No {name} configured; set {flag}, ${env} or [jamf] {key}")
+        return prog_prompt(prompts[name])
+
+    url = resolve('url', args.jamf_url, '--jamf-url', URL_ENV, 'url')
+    username = resolve('username', args.username, '--username', USERNAME_ENV, 'username')
+    password = environ.get(PASSWORD_ENV)
+    if not password:
+        password_file = args.password_file or environ.get(PASSWORD_FILE_ENV) or jamf.get('password_file')
+        if password_file:
+            password = prog_read_secret_file(password_file)
+        elif args.non_interactive:
+            raise ConfigError(f"No password configured; set --password-file, ${PASSWORD_FILE_ENV}, ${PASSWORD_ENV} or [jamf] password_file")
+        else:
+            password = prog_prompt(prompts['password'], secret=True)
+    return JamfCredentials(url, username, password)
@@ -0,0 +1,89 @@
+# --------------- DERIVED COLUMNS --------------- #
+
+# NumPy
+import numpy as np
+
+# Pandas
+import pandas as pd
+
+# A year is the first word starting with, or starting one character before, "20", e.g. "2020)" or "(2019"
+YEAR_PATTERN = r'(?:^|\s)\S?(20\d{2})'
+
+
+def _blank_to_na(series):
+    # Report columns use '' for missing values
+    return series.where(series != '')
+
+
+def prog_apply_to_unique(series, transform):
+    # Fleet columns repeat a small set of values (models, check-in days), so the string
+    # work runs once per distinct value and is broadcast back with an integer take
+    codes, uniques = pd.factorize(_blank_to_na(series))
+    transformed = transform(pd.Series(uniques, dtype=object).astype('string'))
+    # Blank rows (code -1) borrow row 0 and are masked back to missing
+    transformed = transformed.reindex(range(max(1, len(transformed))))
+    result = transformed.take(np.where(codes < 0, 0, codes)).where(codes >= 0)
+    result.index = series.index
+    return result
+
+
+def prog_days_since(series, today):
+    # Whole days between the YYYY-MM-DD prefix of each timestamp and today
+    # Casting to a 10-character NumPy string truncates in C rather than slicing row by row
+    just_dates = pd.Series(_blank_to_na(series).fillna('').to_numpy(dtype='U10'), index=series.index)
+    dates = prog_apply_to_unique(just_dates, lambda values: pd.to_datetime(values, format='%Y-%m-%d', errors='coerce'))
+    return (pd.Timestamp(today) - dates).dt.days.astype('Int64')
+
+
+def prog_convert_mb_to_gb_column(series):
+    mb = pd.to_numeric(_blank_to_na(series), errors='coerce')
+    return pd.Series(np.trunc(mb / 1024), index=series.index).astype('Int64')
+
+
+def prog_extract_year(series):
+    return prog_apply_to_unique(series, lambda values: values.str.extract(YEAR_PATTERN, expand=False))
+
+
+def prog_add_computer_derived_columns(df, today):
+    # One columnar pass; every derived column has exactly one value per row
+    df['Days Since Last Check In'] = prog_days_since(df['Last Check In'], today)
+    df['Days Since Last Enrollment'] = prog_days_since(df['Last Enrollment'], today)
+    df['Days Since Last Inventory Update'] = prog_days_since(df['Last Inventory Update'], today)
+    df['Year'] = prog_extract_year(df['Model'])
+    df['Ram GB'] = prog_convert_mb_to_gb_column(df['Ram MB'])
+    df['Storage Available GB'] = prog_convert_mb_to_gb_column(df['Storage Available MB'])
+    df['Storage Total GB'] = prog_convert_mb_to_gb_column(df['Storage Total MB'])
+    return df
+
+
+def prog_remove_spaces(series):
+    return _blank_to_na(series).astype('string').str.replace(' ', '', regex=False).fillna('')
+
+
+def prog_format_phone_number(series):
+    # Drop a leading '+' and the digit after it, or a leading '1'; the all-zero placeholder is blank
+    numbers = _blank_to_na(series).astype('string')
+    numbers = numbers.where(numbers != '00000000000')
+    formatted = numbers.where(~numbers.str.startswith('+'), numbers.str[2:])
+    formatted = formatted.where(~numbers.str.startswith('1'), numbers.str[1:])
+    return formatted.fillna('')
+
+
+def prog_days_since_inventory_update(series, today):
+    # Classic mobile device timestamps look like 'Monday, January 08 2024 at 3:35 PM'
+    def parse(values):
+        parts = values.str.extract(r'^\S+\s+(\w+)\s+(\d{1,2})\s+(\d{4})')
+        return pd.to_datetime(parts[0] + ' ' + parts[1] + ' ' + parts[2], format='%B %d %Y', errors='coerce')
+    dates = prog_apply_to_unique(series, parse)
+    return (pd.Timestamp(today) - dates).dt.days.astype('Int64')
+
+
+def prog_add_mobile_device_derived_columns(df, today):
+    # Cleanup and derived columns for the mobile device report in one columnar pass
+    df['ICCID'] = prog_remove_spaces(df['ICCID'])
+    df['IMEI'] = prog_remove_spaces(df['IMEI'])
+    df['Phone Number'] = prog_format_phone_number(df['Phone Number'])
+    df['Available GB'] = prog_convert_mb_to_gb_column(df['Available MB'])
+    df['Capacity GB'] = prog_convert_mb_to_gb_column(df['Capacity MB'])
+    df['Days Since Last Inventory Update'] = prog_days_since_inventory_update(df['Last Inventory Update'], today)
+    return df
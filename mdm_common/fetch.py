@@ -0,0 +1,49 @@
+# --------------- FETCH ENGINE --------------- #
+
+# Concurrency
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Logging
+import sys
+
+# Requests
+import requests
+
+# Default number of device detail requests kept in flight at once
+DEFAULT_WORKERS = 8
+
+
+def _fetch_device(fetch_function, device_id, metrics):
+    # A device whose request fails or whose response cannot be read becomes a blank row instead of
+    # aborting the report; it is reported on stderr and counted in the run metrics. Any other
+    # exception is a bug and propagates.
+    try:
+        return fetch_function(device_id)
+    except (requests.exceptions.RequestException, KeyError, TypeError, ValueError) as error:
+        print(f"Could not fetch device {device_id}: {error!r}", file=sys.stderr)
+        if metrics is not None:
+            metrics.count_failed_device(device_id)
+        return None
+
+
+def mdm_fetch_concurrently(fetch_function, device_ids, workers=DEFAULT_WORKERS, metrics=None):
+    # Yield (device_id, result) pairs in the same order as device_ids.
+    # At most workers * 2 requests are queued ahead of the consumer, so device_ids
+    # may be a lazy iterator and memory stays bounded regardless of fleet size.
+    workers = max(1, int(workers))
+    device_ids = iter(device_ids)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit_next():
+            for device_id in device_ids:
+                pending.append((device_id, executor.submit(_fetch_device, fetch_function, device_id, metrics)))
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            device_id, future = pending.popleft()
+            result = future.result()
+            submit_next()
+            yield device_id, result
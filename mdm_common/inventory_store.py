@@ -0,0 +1,128 @@
+# --------------- INVENTORY STORE --------------- #
+
+# Files
+import json
+import os
+import sqlite3
+
+# Threading
+import threading
+
+# Time
+import time
+
+DEFAULT_INVENTORY_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'mdm_scripts', 'inventory.sqlite')
+# Lookups fall back to the API once the last report run is older than this
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+COMPUTER = 'computer'
+MOBILE_DEVICE = 'mobile_device'
+
+# Indexed lookup column -> report column, per device type
+INVENTORY_KEY_COLUMNS = {
+    COMPUTER: {
+        'serial_number': 'Serial Number',
+        'username': 'Username',
+        'email': 'Email',
+        'udid': 'UDID',
+        'full_name': 'Full Name',
+    },
+    MOBILE_DEVICE: {
+        'serial_number': 'Serial Number',
+        'username': 'Username',
+        'email': 'Email Address',
+        'udid': 'UDID',
+        'full_name': 'Name',
+    },
+}
+INVENTORY_KEYS = ['serial_number', 'username', 'email', 'udid', 'full_name']
+
+
+class InventoryStore:
+    # Local copy of the last report run's device rows, indexed for the lookups mdm_actions makes.
+    # A refresh replaces one device type's rows in a single transaction, so readers never see
+    # a half-written inventory. Text keys are matched case-insensitively. One store may be
+    # shared by several threads (e.g. the mdm_actions server); its queries run one at a time.
+    def __init__(self, path=DEFAULT_INVENTORY_PATH):
+        os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        key_columns = ', '.join(f'{key} TEXT COLLATE NOCASE' for key in INVENTORY_KEYS)
+        self._connection.execute(
+            f'CREATE TABLE IF NOT EXISTS devices (device_type TEXT, id INTEGER, {key_columns}, row TEXT, '
+            'PRIMARY KEY (device_type, id))'
+        )
+        for key in INVENTORY_KEYS:
+            self._connection.execute(f'CREATE INDEX IF NOT EXISTS devices_{key} ON devices ({key})')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS refreshes (device_type TEXT PRIMARY KEY, jamf_url TEXT, refreshed_at REAL)'
+        )
+        self._connection.commit()
+
+    def begin_refresh(self, device_type):
+        # Rows added until finish_refresh() replace this device type's rows
+        with self._lock:
+            self._connection.execute('DELETE FROM devices WHERE device_type = ?', (device_type,))
+
+    def add_rows(self, device_type, columns, rows):
+        key_indexes = [columns.index(INVENTORY_KEY_COLUMNS[device_type][key]) for key in INVENTORY_KEYS]
+        id_index = columns.index('ID')
+        with self._lock:
+            self._connection.executemany(
+                f'INSERT OR REPLACE INTO devices VALUES (?, ?, {", ".join("?" for _ in INVENTORY_KEYS)}, ?)',
+                (
+                    (device_type, row[id_index], *[prog_key_value(row[index]) for index in key_indexes],
+                     json.dumps(dict(zip(columns, row)), default=str))
+                    for row in rows
+                ),
+            )
+
+    def finish_refresh(self, device_type, jamf_url):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?)', (device_type, jamf_url, time.time())
+            )
+            self._connection.commit()
+
+    def age(self, device_type, jamf_url):
+        # Seconds since this device type was last refreshed from jamf_url, or None if it never was
+        with self._lock:
+            refreshed = self._connection.execute(
+                'SELECT refreshed_at FROM refreshes WHERE device_type = ? AND jamf_url = ?', (device_type, jamf_url)
+            ).fetchone()
+        return None if refreshed is None else time.time() - refreshed[0]
+
+    def is_fresh(self, device_type, jamf_url, max_age=DEFAULT_MAX_AGE):
+        age = self.age(device_type, jamf_url)
+        return age is not None and age <= max_age
+
+    def find(self, device_type, key, value):
+        # Report rows (as dicts) whose indexed key matches value
+        if key not in INVENTORY_KEYS:
+            raise ValueError(f"Unknown inventory key: {key}")
+        with self._lock:
+            rows = self._connection.execute(
+                f'SELECT row FROM devices WHERE device_type = ? AND {key} = ? ORDER BY id', (device_type, value)
+            ).fetchall()
+        return [json.loads(row) for row, in rows]
+
+    def get(self, device_type, device_id):
+        with self._lock:
+            stored = self._connection.execute(
+                'SELECT row FROM devices WHERE device_type = ? AND id = ?', (device_type, device_id)
+            ).fetchone()
+        return None if stored is None else json.loads(stored[0])
+
+    def close(self):
+        # An unfinished refresh is rolled back, leaving the previous inventory in place
+        with self._lock:
+            self._connection.rollback()
+            self._connection.close()
+
+
+def prog_key_value(value):
+    # Blank report cells are stored as NULL so they never match a lookup
+    if value is None or value == '':
+        return None
+    return str(value)
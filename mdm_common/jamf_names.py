@@ -0,0 +1,97 @@
+# --------------- NAME RESOLVER --------------- #
+
+# Concurrency
+from concurrent.futures import ThreadPoolExecutor
+
+# Files
+import hashlib
+import json
+import os
+
+# Time
+import time
+
+# Shared MDM Modules
+from mdm_common.inventory_store import COMPUTER, MOBILE_DEVICE
+from mdm_common.pagination import DEFAULT_PAGE_SIZE, JamfPager
+from mdm_common.token_manager import DEFAULT_TOKEN_CACHE_DIR
+
+# Names are fetched again once the cached copy is older than this
+DEFAULT_NAMES_MAX_AGE = 60 * 60
+# Classic API static group listings (one unpaginated call each) and Jamf Pro API PreStage listings (paginated)
+GROUP_LISTINGS = {COMPUTER: ('computergroups', 'computer_groups'), MOBILE_DEVICE: ('mobiledevicegroups', 'mobile_device_groups')}
+PRESTAGE_LISTINGS = {COMPUTER: 'api/v3/computer-prestages', MOBILE_DEVICE: 'api/v2/mobile-device-prestages'}
+
+
+class JamfNames:
+    # Static group and PreStage name -> ID maps of one Jamf server, per device type
+    def __init__(self, groups, prestages, fetched_at=None):
+        self.groups = groups
+        self.prestages = prestages
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def group_id(self, device_type, name):
+        return self.groups.get(device_type, {}).get(name.strip())
+
+    def prestage_id(self, device_type, name):
+        return self.prestages.get(device_type, {}).get(name.strip())
+
+    def to_dict(self):
+        return {'fetched_at': self.fetched_at, 'groups': self.groups, 'prestages': self.prestages}
+
+
+def mdm_fetch_jamf_names(jamf_session, page_size=DEFAULT_PAGE_SIZE):
+    # Every static group and PreStage, in four listings fetched concurrently
+    def fetch_json(endpoint, bearer):
+        response = jamf_session.get(endpoint, bearer=bearer)
+        response.raise_for_status()
+        return response.json()
+
+    def static_groups(device_type):
+        resource, results_key = GROUP_LISTINGS[device_type]
+        groups = fetch_json(f"{jamf_session.jamf_url}/JSSResource/{resource}", bearer=False)[results_key]
+        return {group['name']: str(group['id']) for group in groups if not group.get('is_smart')}
+
+    def prestages(device_type):
+        endpoint = f"{jamf_session.jamf_url}/{PRESTAGE_LISTINGS[device_type]}"
+        pager = JamfPager(lambda url: fetch_json(url, bearer=True), endpoint, page_size=page_size, prefetch=False)
+        return {prestage['displayName']: str(prestage['id']) for prestage in pager}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        group_futures = {device_type: executor.submit(static_groups, device_type) for device_type in GROUP_LISTINGS}
+        prestage_futures = {device_type: executor.submit(prestages, device_type) for device_type in PRESTAGE_LISTINGS}
+        return JamfNames(
+            {device_type: future.result() for device_type, future in group_futures.items()},
+            {device_type: future.result() for device_type, future in prestage_futures.items()},
+        )
+
+
+def mdm_load_jamf_names(jamf_session, cache_dir=DEFAULT_TOKEN_CACHE_DIR, max_age=DEFAULT_NAMES_MAX_AGE,
+                        refresh=False, page_size=DEFAULT_PAGE_SIZE):
+    # Names from the cache file for this Jamf URL while it is younger than max_age,
+    # otherwise fetched from Jamf and saved (best effort, like the token cache). refresh=True always fetches.
+    cache_path = prog_names_cache_path(cache_dir, jamf_session.jamf_url) if cache_dir else None
+    if cache_path and not refresh:
+        try:
+            with open(cache_path) as cache_file:
+                cached = json.load(cache_file)
+            if time.time() - float(cached['fetched_at']) < max_age:
+                return JamfNames(cached['groups'], cached['prestages'], float(cached['fetched_at']))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    names = mdm_fetch_jamf_names(jamf_session, page_size)
+    if cache_path:
+        try:
+            os.makedirs(os.path.dirname(cache_path), mode=0o700, exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as cache_file:
+                json.dump(names.to_dict(), cache_file)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+    return names
+
+
+def prog_names_cache_path(cache_dir, jamf_url):
+    cache_key = hashlib.sha256(jamf_url.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"names_{cache_key}.json")
@@ -0,0 +1,124 @@
+# --------------- JAMF SESSION --------------- #
+
+# Time
+import time
+
+# Requests
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase, HTTPBasicAuth
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+# Retry and Rate Limiting
+from mdm_common.retry import RequestThrottle
+
+# Token Manager
+from mdm_common.token_manager import DEFAULT_TOKEN_CACHE_DIR, JamfTokenManager
+
+# Default number of keep-alive connections held open to the Jamf server
+DEFAULT_POOL_SIZE = 16
+
+
+class JamfBearerAuth(AuthBase):
+    # Asks the token manager at send time so a refreshed token is picked up
+    def __init__(self, jamf_session):
+        self.jamf_session = jamf_session
+
+    def __call__(self, request):
+        request.headers['Authorization'] = f'Bearer {self.jamf_session.token_manager.get_token()}'
+        return request
+
+
+class JamfSession:
+    # One pooled, keep-alive HTTP session shared by every Jamf request helper.
+    # Classic API requests use basic auth, Jamf Pro API requests use the bearer token.
+    # Retries, backoff and rate limiting all happen here (see RequestThrottle), so the scripts'
+    # request helpers only send the request and check the final status.
+    def __init__(self, jamf_url, username, password, pool_size=DEFAULT_POOL_SIZE,
+                 token_cache_dir=DEFAULT_TOKEN_CACHE_DIR, rate=None):
+        self.jamf_url = jamf_url.rstrip('/')
+        self.basic_auth = HTTPBasicAuth(username, password)
+        self.bearer_auth = JamfBearerAuth(self)
+        self.token_manager = JamfTokenManager(self, username, cache_dir=token_cache_dir)
+        # Optional mdm_common.response_cache.ResponseCache consulted by get()
+        self.response_cache = None
+        # Optional mdm_common.metrics.RunMetrics that records every request attempt
+        self.metrics = None
+        # Backoff, Retry-After, optional requests-per-second cap and adaptive concurrency for every request
+        self.throttle = RequestThrottle(pool_size, rate=rate)
+        # Token requests get their own limiter so a refresh never waits behind workers blocked on the token
+        self.auth_throttle = RequestThrottle(1)
+        # Blocking pool so extra workers wait for a free connection instead of opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.verify = False
+        self.session.headers.update({'Accept': 'application/json'})
+
+    def request(self, method, endpoint, accept='application/json', bearer=False, **kwargs):
+        headers = {'Accept': accept}
+        if bearer:
+            headers['Content-Type'] = 'application/json'
+        headers.update(kwargs.pop('headers', {}))
+        auth = kwargs.pop('auth', None) or (self.bearer_auth if bearer else self.basic_auth)
+        throttle = kwargs.pop('throttle', None) or self.throttle
+        metrics = self.metrics
+        # Outcome of the previous attempt, so a resend is counted as a retry of that status
+        attempts = []
+
+        def send_request():
+            if metrics is None:
+                return self.session.request(method, endpoint, headers=headers, auth=auth, **kwargs)
+            if attempts:
+                metrics.count_retry(method, endpoint, attempts[-1])
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, endpoint, headers=headers, auth=auth, **kwargs)
+            except requests.exceptions.RequestException:
+                attempts.append(None)
+                metrics.observe_request(method, endpoint, None, time.perf_counter() - started, 0)
+                raise
+            attempts.append(response.status_code)
+            metrics.observe_request(method, endpoint, response.status_code, time.perf_counter() - started, len(response.content))
+            return response
+
+        response = throttle.send(method, send_request)
+        if auth is self.bearer_auth and response.status_code == 401:
+            # Token was revoked or expired server-side; fetch a new one and resend once
+            rejected_token = response.request.headers['Authorization'][len('Bearer '):]
+            self.token_manager.invalidate(rejected_token)
+            response = throttle.send(method, send_request)
+        return response
+
+    def get(self, endpoint, accept='application/json', bearer=False, **kwargs):
+        if self.response_cache is None or kwargs:
+            return self.request('GET', endpoint, accept=accept, bearer=bearer, **kwargs)
+        response = self.response_cache.get(endpoint, accept)
+        if response is not None and self.metrics is not None:
+            self.metrics.count_cache_hit('GET', endpoint)
+        if response is None:
+            response = self.request('GET', endpoint, accept=accept, bearer=bearer)
+            self.response_cache.put(endpoint, accept, response)
+        return response
+
+    def post(self, endpoint, accept='application/json', bearer=False, **kwargs):
+        return self.request('POST', endpoint, accept=accept, bearer=bearer, **kwargs)
+
+    def put(self, endpoint, accept='application/json', bearer=False, **kwargs):
+        return self.request('PUT', endpoint, accept=accept, bearer=bearer, **kwargs)
+
+    def close(self):
+        if self.response_cache is not None:
+            self.response_cache.close()
+        self.session.close()
+
+
+def prog_response_error(response):
+    # Jamf Pro API errors carry descriptions; the Classic API returns an HTML page
+    try:
+        descriptions = [error.get('description') or error.get('code', '') for error in response.json().get('errors', [])]
+    except (ValueError, AttributeError):
+        descriptions = []
+    return f"HTTP {response.status_code}" + (f" ({'; '.join(descriptions)})" if descriptions else '')
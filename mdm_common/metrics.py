@@ -0,0 +1,267 @@
+# --------------- RUN METRICS --------------- #
+
+# JSON
+import json
+
+# Threading
+import threading
+
+# Time
+import time
+
+# URLs
+from urllib.parse import urlsplit
+
+# Histogram bucket upper bounds in seconds, as Prometheus client libraries use by default
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# The path segment after one of these is a value, e.g. /JSSResource/computers/serialnumber/{serialnumber}
+ENDPOINT_VALUE_SEGMENTS = {'id', 'name', 'serialnumber', 'udid', 'macaddress', 'match', 'username'}
+CONNECTION_ERROR = 'connection_error'
+
+
+def prog_endpoint_template(url):
+    # https://jamf/JSSResource/computers/id/12?x=1 -> /JSSResource/computers/id/{id}, so requests group per endpoint
+    parts = urlsplit(url).path.rstrip('/').split('/')
+    for index in range(1, len(parts)):
+        if parts[index - 1] in ENDPOINT_VALUE_SEGMENTS:
+            parts[index] = '{' + parts[index - 1] + '}'
+        elif parts[index].isdigit():
+            parts[index] = '{id}'
+    return '/'.join(parts)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def cumulative(self):
+        # (upper bound, observations at or below it) pairs ending with +Inf
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation; max for the overflow bucket
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return self.max if bound == float('inf') else bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): total for bound, total in self.cumulative()},
+        }
+
+
+class _EndpointMetrics:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses = {}
+        self.retries = {}
+        self.bytes = 0
+        self.cache_hits = 0
+
+
+class StageTimer:
+    # Wall time per stage. Stages nest: time spent in an inner stage (derive inside write)
+    # is only counted for the inner one. Stages are entered from the main thread only.
+    def __init__(self):
+        self.totals = {}
+        self._stack = []
+
+    def stage(self, name):
+        return _TimedStage(self, name)
+
+    def _start(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            outer, started = self._stack[-1]
+            self.totals[outer] = self.totals.get(outer, 0.0) + now - started
+        self._stack.append((name, now))
+
+    def _stop(self):
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self.totals[name] = self.totals.get(name, 0.0) + now - started
+        if self._stack:
+            self._stack[-1] = (self._stack[-1][0], now)
+
+
+class _TimedStage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer._start(self.name)
+
+    def __exit__(self, *exc_info):
+        self.timer._stop()
+
+
+def prog_timed_iter(iterable, timer, name):
+    # Counts the time spent waiting for each item as the named stage
+    iterator = iter(iterable)
+    while True:
+        with timer.stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class RunMetrics(StageTimer):
+    # Request latency histograms, statuses, retries and bytes per endpoint, plus stage durations,
+    # for one script run. JamfSession records every request attempt when its metrics are set.
+    def __init__(self):
+        super().__init__()
+        self.started = time.time()
+        self._started_counter = time.perf_counter()
+        self._endpoints = {}
+        self.failed_devices = []
+        self._lock = threading.Lock()
+
+    def _endpoint(self, method, url):
+        key = (method, prog_endpoint_template(url))
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = self._endpoints.setdefault(key, _EndpointMetrics())
+        return endpoint
+
+    def observe_request(self, method, url, status, seconds, size):
+        # status is None when the request failed without a response
+        with self._lock:
+            endpoint = self._endpoint(method, url)
+            endpoint.latency.observe(seconds)
+            status = CONNECTION_ERROR if status is None else str(status)
+            endpoint.statuses[status] = endpoint.statuses.get(status, 0) + 1
+            endpoint.bytes += size
+
+    def count_retry(self, method, url, reason):
+        # reason is the status (or connection_error) of the attempt being retried
+        with self._lock:
+            endpoint = self._endpoint(method, url)
+            reason = CONNECTION_ERROR if reason is None else str(reason)
+            endpoint.retries[reason] = endpoint.retries.get(reason, 0) + 1
+
+    def count_failed_device(self, device_id):
+        # A device whose details could not be fetched and was left blank in the report
+        with self._lock:
+            self.failed_devices.append(device_id)
+
+    def count_cache_hit(self, method, url):
+        with self._lock:
+            self._endpoint(method, url).cache_hits += 1
+
+    def to_dict(self):
+        with self._lock:
+            endpoints = {
+                f"{method} {path}": {
+                    'requests': endpoint.latency.count,
+                    'statuses': dict(endpoint.statuses),
+                    'retries': dict(endpoint.retries),
+                    'bytes': endpoint.bytes,
+                    'cache_hits': endpoint.cache_hits,
+                    'latency_seconds': endpoint.latency.to_dict(),
+                }
+                for (method, path), endpoint in sorted(self._endpoints.items(), key=lambda item: item[0][::-1])
+            }
+            failed_devices = list(self.failed_devices)
+        return {
+            'started': self.started,
+            'run_seconds': round(time.perf_counter() - self._started_counter, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.totals.items()},
+            'totals': {
+                'requests': sum(endpoint['requests'] for endpoint in endpoints.values()),
+                'retries': sum(sum(endpoint['retries'].values()) for endpoint in endpoints.values()),
+                'bytes': sum(endpoint['bytes'] for endpoint in endpoints.values()),
+                'cache_hits': sum(endpoint['cache_hits'] for endpoint in endpoints.values()),
+                'failed_devices': len(failed_devices),
+            },
+            'failed_devices': failed_devices,
+            'endpoints': endpoints,
+        }
+
+    def to_prometheus(self, prefix='mdm'):
+        # Prometheus text exposition format, for the node_exporter textfile collector or a pushgateway
+        summary = self.to_dict()
+        lines = []
+
+        def metric(name, metric_type, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+
+        def sample(name, labels, value):
+            label_text = ','.join(f'{key}="{prog_escape_label(label)}"' for key, label in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        endpoints = [(key.split(' ', 1), endpoint) for key, endpoint in summary['endpoints'].items()]
+        metric('request_duration_seconds', 'histogram', 'Jamf API request latency per attempt.')
+        for (method, path), endpoint in endpoints:
+            labels = {'method': method, 'endpoint': path}
+            latency = endpoint['latency_seconds']
+            for bound, total in latency['buckets'].items():
+                sample('request_duration_seconds_bucket', dict(labels, le=bound), total)
+            sample('request_duration_seconds_sum', labels, latency['sum'])
+            sample('request_duration_seconds_count', labels, latency['count'])
+        metric('requests_total', 'counter', 'Jamf API request attempts by response status.')
+        for (method, path), endpoint in endpoints:
+            for status, count in endpoint['statuses'].items():
+                sample('requests_total', {'method': method, 'endpoint': path, 'status': status}, count)
+        metric('request_retries_total', 'counter', 'Jamf API requests sent again, by the status that caused it.')
+        for (method, path), endpoint in endpoints:
+            for reason, count in endpoint['retries'].items():
+                sample('request_retries_total', {'method': method, 'endpoint': path, 'reason': reason}, count)
+        metric('response_bytes_total', 'counter', 'Jamf API response body bytes received.')
+        for (method, path), endpoint in endpoints:
+            sample('response_bytes_total', {'method': method, 'endpoint': path}, endpoint['bytes'])
+        metric('response_cache_hits_total', 'counter', 'Responses read from the on-disk response cache.')
+        for (method, path), endpoint in endpoints:
+            sample('response_cache_hits_total', {'method': method, 'endpoint': path}, endpoint['cache_hits'])
+        metric('failed_devices_total', 'counter', 'Devices left blank because their details could not be fetched.')
+        sample('failed_devices_total', {}, summary['totals']['failed_devices'])
+        metric('stage_duration_seconds', 'gauge', 'Wall time spent in each phase of the run.')
+        for name, seconds in summary['stages'].items():
+            sample('stage_duration_seconds', {'stage': name}, seconds)
+        metric('run_duration_seconds', 'gauge', 'Wall time of the whole run.')
+        sample('run_duration_seconds', {}, summary['run_seconds'])
+        metric('run_start_timestamp_seconds', 'gauge', 'Unix time the run started.')
+        sample('run_start_timestamp_seconds', {}, summary['started'])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # Prometheus text for .prom files, a JSON summary otherwise
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2) + '\n'
+        with open(path, 'w') as metrics_file:
+            metrics_file.write(content)
+
+
+def prog_escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
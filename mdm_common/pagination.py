@@ -0,0 +1,64 @@
+# --------------- PAGINATION --------------- #
+
+# Concurrency
+from concurrent.futures import ThreadPoolExecutor
+
+# Default page size for Jamf Pro API listings
+DEFAULT_PAGE_SIZE = 500
+
+
+class JamfPager:
+    # Lazily iterates over every result of a paginated Jamf Pro API listing.
+    # Only the current page and the prefetched next page are held in memory, and the next
+    # page is requested in the background while the current one is being consumed.
+    def __init__(self, fetch_json, endpoint, page_size=DEFAULT_PAGE_SIZE, params='', prefetch=True):
+        self.fetch_json = fetch_json
+        self.endpoint = endpoint
+        self.page_size = page_size
+        self.params = params
+        self.prefetch = prefetch
+        self._first_page = None
+
+    @property
+    def total_count(self):
+        # Read from the first page, which is kept so iteration does not request it twice
+        if self._first_page is None:
+            self._first_page = self._fetch_page(0)
+        return self._first_page.get('totalCount', 0)
+
+    def _fetch_page(self, page):
+        separator = '&' if '?' in self.endpoint else '?'
+        url = f"{self.endpoint}{separator}page={page}&page-size={self.page_size}"
+        if self.params:
+            url = f"{url}&{self.params}"
+        return self.fetch_json(url)
+
+    def _is_last_page(self, results, seen):
+        # totalCount is authoritative: a server may cap page-size below what was asked for,
+        # so a short page only ends the listing when there is no totalCount
+        total_count = results.get('totalCount')
+        if total_count is not None:
+            return seen >= total_count
+        return len(results.get('results', [])) < self.page_size
+
+    def __iter__(self):
+        first_page = self._first_page if self._first_page is not None else self._fetch_page(0)
+        self._first_page = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 0
+            results = first_page
+            seen = 0
+            while True:
+                items = results.get('results', [])
+                seen += len(items)
+                next_page = None
+                if items and not self._is_last_page(results, seen):
+                    if self.prefetch:
+                        next_page = executor.submit(self._fetch_page, page + 1)
+                    else:
+                        next_page = page + 1
+                yield from items
+                if next_page is None:
+                    return
+                page += 1
+                results = next_page.result() if self.prefetch else self._fetch_page(next_page)
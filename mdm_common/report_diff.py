@@ -0,0 +1,148 @@
+# --------------- REPORT DIFF --------------- #
+
+# Files
+import os
+import re
+
+# Pandas
+import pandas as pd
+
+# Report Output
+from mdm_common.report_output import OUTPUT_EXTENSIONS
+
+# Columns whose changes are reported; check-in times, battery and free space change every run
+COMPUTER_DIFF_COLUMNS = [
+    'Building', 'Department', 'Email', 'Filevault Status', 'Full Name', 'Gatekeeper Status',
+    'Management Status', 'Model', 'Name', 'OS Version', 'Position', 'Room', 'Serial Number',
+    'SIP Status', 'Username',
+]
+MOBILE_DEVICE_DIFF_COLUMNS = [
+    'Building', 'Carrier', 'Department', 'Device Name', 'Email Address', 'Model', 'Name', 'OS Build',
+    'OS Version', 'Passcode Status', 'Phone Number', 'Position', 'Room', 'Serial Number', 'Username',
+]
+# Rows read from a report at a time
+DIFF_CHUNK_ROWS = 50000
+# Report formats to compare, first choice first
+DIFF_FORMATS = ['parquet', 'feather', 'csv']
+
+
+def mdm_iter_report_chunks(path, columns, chunk_rows=DIFF_CHUNK_ROWS):
+    # Yields DataFrames of the given columns with every value as text ('' when missing),
+    # so reports written in different formats compare equal
+    if path.endswith('.csv'):
+        chunks = pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+    else:
+        import pyarrow.ipc
+        import pyarrow.parquet
+        if path.endswith('.parquet'):
+            batches = pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns)
+        else:
+            reader = pyarrow.ipc.open_file(path)
+            batches = (reader.get_batch(index).select(columns) for index in range(reader.num_record_batches))
+        chunks = (batch.to_pandas() for batch in batches)
+    for chunk in chunks:
+        yield chunk[columns].astype('string').fillna('')
+
+
+def prog_hash_rows(df):
+    # One 64-bit hash per row, computed column-wise
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class ReportDiff:
+    # added and removed are sorted lists of device IDs; changed maps a device ID to
+    # {column: (previous value, current value)} for each column that differs
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def to_frame(self):
+        # One row per added or removed device and per changed field
+        records = [(device_id, 'Added', '', '', '') for device_id in self.added]
+        records += [(device_id, 'Removed', '', '', '') for device_id in self.removed]
+        for device_id, fields in self.changed.items():
+            for column, (previous, current) in fields.items():
+                records.append((device_id, 'Changed', column, previous, current))
+        return pd.DataFrame.from_records(records, columns=['ID', 'Change', 'Column', 'Previous', 'Current'])
+
+
+def mdm_diff_reports(previous_path, current_path, columns):
+    # Compares two written reports keyed by ID in two passes over the previous report and one
+    # over the current one. Rows are matched on a hash of the compared columns, and only rows
+    # whose hashes differ are compared field by field.
+    columns = ['ID'] + [column for column in columns if column != 'ID']
+    compared = columns[1:]
+
+    previous_hashes = {}
+    for chunk in mdm_iter_report_chunks(previous_path, columns):
+        for device_id, row_hash in zip(chunk['ID'].tolist(), prog_hash_rows(chunk[compared])):
+            previous_hashes.setdefault(device_id, row_hash)
+
+    added = []
+    seen_ids = set()
+    changed_rows = {}
+    for chunk in mdm_iter_report_chunks(current_path, columns):
+        differs = []
+        for device_id, row_hash in zip(chunk['ID'].tolist(), prog_hash_rows(chunk[compared])):
+            previous_hash = previous_hashes.get(device_id)
+            if previous_hash is None:
+                added.append(device_id)
+            seen_ids.add(device_id)
+            differs.append(previous_hash is not None and previous_hash != row_hash)
+        for row in chunk[differs].itertuples(index=False):
+            changed_rows[row[0]] = row[1:]
+    removed = [device_id for device_id in previous_hashes if device_id not in seen_ids]
+
+    changed = {}
+    if changed_rows:
+        for chunk in mdm_iter_report_chunks(previous_path, columns):
+            for row in chunk[chunk['ID'].isin(list(changed_rows))].itertuples(index=False):
+                fields = {
+                    column: (previous, current)
+                    for column, previous, current in zip(compared, row[1:], changed_rows[row[0]])
+                    if previous != current
+                }
+                if fields:
+                    changed[row[0]] = fields
+    changed = {device_id: changed[device_id] for device_id in prog_sort_ids(changed)}
+    return ReportDiff(prog_sort_ids(added), prog_sort_ids(removed), changed)
+
+
+def prog_sort_ids(ids):
+    # Device IDs are compared as text; numeric IDs sort numerically
+    return sorted(ids, key=lambda device_id: (len(device_id), device_id))
+
+
+def mdm_find_previous_report(name, today, directory='.'):
+    # The newest {date}_{name} report written before today, preferring the DIFF_FORMATS order
+    pattern = re.compile(rf'^(\d{{4}}-\d{{2}}-\d{{2}})_{re.escape(name)}\.(\w+)$')
+    extensions = [OUTPUT_EXTENSIONS[output_format] for output_format in DIFF_FORMATS]
+    candidates = []
+    for entry in os.listdir(directory):
+        match = pattern.match(entry)
+        if match and match.group(1) < today.isoformat() and match.group(2) in extensions:
+            candidates.append((match.group(1), -extensions.index(match.group(2)), entry))
+    if not candidates:
+        return None
+    return os.path.join(directory, max(candidates)[2])
+
+
+def mdm_diff_with_previous_report(report_writer, today, columns, directory='.'):
+    # Diffs the report just written against the last earlier run's, or returns None on the first run
+    previous_path = mdm_find_previous_report(report_writer.name, today, directory)
+    if previous_path is None:
+        return None
+    output_format = [output_format for output_format in DIFF_FORMATS if output_format in report_writer.output_formats][0]
+    return mdm_diff_reports(previous_path, report_writer.output_path(output_format, latest=False), columns)
+
+
+def mdm_report_changes(report_writer, today, columns, directory='.'):
+    # Prints a summary of the changes since the last run and saves them as {today}_{name}_changes.csv
+    diff = mdm_diff_with_previous_report(report_writer, today, columns, directory)
+    if diff is None:
+        print("No earlier report to compare with.")
+        return None
+    print(f"Since the last report: {len(diff.added)} added, {len(diff.removed)} removed, {len(diff.changed)} changed")
+    diff.to_frame().to_csv(os.path.join(directory, f"{today}_{report_writer.name}_changes.csv"), index=False)
+    return diff
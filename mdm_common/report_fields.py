@@ -0,0 +1,148 @@
+# --------------- REPORT FIELDS --------------- #
+
+# Functions
+import functools
+import operator
+
+# Report column -> path into the Classic API device record. A path is a tuple of keys and
+# list indexes; an optional third item is the value used when the path is missing.
+COMPUTER_REPORT_FIELDS = [
+    ('Apple Silicon', ('hardware', 'is_apple_silicon')),
+    ('Battery Capacity', ('hardware', 'battery_capacity')),
+    ('Building', ('location', 'building')),
+    ('Department', ('location', 'department')),
+    ('Email', ('location', 'email_address')),
+    ('Filevault Status', ('hardware', 'storage', 0, 'partitions', 0, 'filevault_status')),
+    ('Full Name', ('location', 'realname')),
+    ('Gatekeeper Status', ('hardware', 'gatekeeper_status')),
+    ('IP Address', ('general', 'ip_address')),
+    ('Last Check In', ('general', 'last_contact_time')),
+    ('Last Enrollment', ('general', 'last_enrolled_date_utc')),
+    ('Last Inventory Update', ('general', 'report_date')),
+    ('Management Status', ('general', 'management_status', 'enrolled_via_dep')),
+    ('MDM Expiration', ('general', 'mdm_profile_expiration_utc')),
+    ('Model', ('hardware', 'model')),
+    ('Model ID', ('hardware', 'model_identifier')),
+    ('Name', ('general', 'name')),
+    ('OS Version', ('hardware', 'os_version')),
+    ('Position', ('location', 'position')),
+    ('Processor', ('hardware', 'processor_type')),
+    ('Processor Architecture', ('hardware', 'processor_architecture')),
+    ('Processor Cores', ('hardware', 'number_cores')),
+    ('Ram MB', ('hardware', 'total_ram_mb')),
+    ('Room', ('location', 'room')),
+    ('Serial Number', ('general', 'serial_number')),
+    ('SIP Status', ('hardware', 'sip_status')),
+    ('Storage Available MB', ('hardware', 'storage', 0, 'partitions', 0, 'available_mb')),
+    ('Storage Total MB', ('hardware', 'storage', 0, 'drive_capacity_mb')),
+    ('UDID', ('general', 'udid')),
+    ('Username', ('location', 'username')),
+]
+
+MOBILE_DEVICE_REPORT_FIELDS = [
+    ('Available MB', ('general', 'available_mb')),
+    ('Battery Level', ('general', 'battery_level')),
+    ('Building', ('location', 'building')),
+    ('Capacity MB', ('general', 'capacity_mb')),
+    ('Carrier', ('network', 'home_carrier_network')),
+    ('Department', ('location', 'department')),
+    ('Device Name', ('general', 'device_name')),
+    ('Email Address', ('location', 'email_address')),
+    ('Enrollment Method', ('general', 'enrollment_method')),
+    ('ICCID', ('network', 'iccid')),
+    ('IMEI', ('network', 'imei')),
+    ('Last Enrollment UTC', ('general', 'last_enrollment_utc')),
+    ('Last Inventory Update', ('general', 'last_inventory_update')),
+    ('Model', ('general', 'model')),
+    ('Model Identifier', ('general', 'model_identifier')),
+    ('Model Number', ('general', 'model_number')),
+    ('Name', ('location', 'realname')),
+    ('Passcode Status', ('security', 'passcode_present')),
+    ('Position', ('location', 'position')),
+    ('Phone Number', ('general', 'phone_number')),
+    ('OS Build', ('general', 'os_build')),
+    ('OS Version', ('general', 'os_version')),
+    ('Percentage Used', ('general', 'percentage_used')),
+    ('Room', ('location', 'room')),
+    ('Serial Number', ('general', 'serial_number')),
+    ('UDID', ('general', 'udid')),
+    ('Username', ('location', 'username')),
+]
+
+# Raised by a path lookup on a missing key, a short list, or a record that could not be fetched (None)
+MISSING_FIELD_ERRORS = (KeyError, IndexError, TypeError)
+
+
+def prog_compile_path(path):
+    # record -> record[path[0]][path[1]]..., used for the field-by-field fallback
+    return functools.partial(functools.reduce, operator.getitem, path)
+
+
+def prog_compile_row(paths):
+    # Builds device_id, record -> (device_id, value, ...) from the paths without a Python call per
+    # field: one itemgetter fetches the top-level sections ('general', 'hardware', ...), one per
+    # section fetches all its direct fields, deeper paths (storage, partitions) are walked with
+    # prog_compile_path, and a last itemgetter puts the values back in field order.
+    sections = list(dict.fromkeys(path[0] for path in paths))
+    section_keys = {section: [] for section in sections}
+    deep_paths = []
+    for path in paths:
+        if len(path) == 2:
+            section_keys[path[0]].append(path[1])
+        else:
+            deep_paths.append(path)
+    # Values are gathered as device_id, each section's direct fields in section order, then deep fields
+    gathered = [(section, key) for section in sections for key in section_keys[section]]
+    gathered += [tuple(path) for path in deep_paths]
+    positions = {}
+    for position, entry in enumerate(gathered, start=1):
+        positions.setdefault(entry, position)
+    order = operator.itemgetter(0, *(positions[tuple(path)] for path in paths))
+
+    get_sections = prog_tuple_getter(sections)
+    get_fields = tuple(prog_tuple_getter(section_keys[section]) for section in sections)
+    get_deep = tuple(prog_compile_path(path) for path in deep_paths)
+
+    def row(device_id, record):
+        values = [device_id]
+        for get_section_fields, section in zip(get_fields, get_sections(record)):
+            values += get_section_fields(section)
+        values += [get_path(record) for get_path in get_deep]
+        return order(values)
+    return row
+
+
+def prog_tuple_getter(keys):
+    # itemgetter that always returns a tuple: itemgetter('a') returns the bare value, itemgetter() fails
+    if len(keys) > 1:
+        return operator.itemgetter(*keys)
+    if keys:
+        single = operator.itemgetter(keys[0])
+        return lambda value: (single(value),)
+    # A section with only deep fields must still exist for the row to be complete
+    return lambda value: ()
+
+
+class FieldExtractor:
+    # Flattens one device record into a fixed-width tuple: (device_id, field, field, ...).
+    # The mapping is compiled once. A missing field gets its own default without blanking the rest of the row.
+    __slots__ = ('columns', '_row', '_getters', '_defaults')
+
+    def __init__(self, fields, id_column='ID'):
+        self.columns = (id_column,) + tuple(field[0] for field in fields)
+        self._row = prog_compile_row([field[1] for field in fields])
+        self._getters = tuple(prog_compile_path(field[1]) for field in fields)
+        self._defaults = tuple(field[2] if len(field) > 2 else '' for field in fields)
+
+    def extract(self, device_id, record):
+        try:
+            return self._row(device_id, record)
+        except MISSING_FIELD_ERRORS:
+            return (device_id, *self._extract_each(record))
+
+    def _extract_each(self, record):
+        for getter, default in zip(self._getters, self._defaults):
+            try:
+                yield getter(record)
+            except MISSING_FIELD_ERRORS:
+                yield default
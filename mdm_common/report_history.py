@@ -0,0 +1,172 @@
+# --------------- REPORT HISTORY --------------- #
+
+# Date
+import datetime
+
+# Files
+import os
+import re
+
+# Pandas
+import pandas as pd
+
+# Report Output
+from mdm_common.report_output import COMPRESSION, OUTPUT_EXTENSIONS, mdm_apply_schema, prog_arrow_schema, prog_require_pyarrow
+
+DATE_COLUMN = 'Report Date'
+# Rows read from a report at a time while it is copied into the history
+HISTORY_BATCH_ROWS = 50000
+# Dated report files, best source first when a day was written in several formats
+HISTORY_SOURCE_FORMATS = ['parquet', 'feather', 'csv']
+
+
+def prog_to_date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+class ReportHistory:
+    # Append-only history of one report: {root}/{name}/date=YYYY-MM-DD/part.parquet, one file per day
+    # with one row per device ID and a 'Report Date' column. Past days are never rewritten;
+    # appending a day that already exists (a re-run) replaces only that day.
+    # Queries read just the requested columns of the requested days.
+    def __init__(self, root, name, schema):
+        prog_require_pyarrow('parquet')
+        self.name = name
+        self.directory = os.path.join(root, name)
+        self.schema = schema
+
+    def partition_path(self, day):
+        return os.path.join(self.directory, f"date={day.isoformat()}", 'part.parquet')
+
+    def dates(self):
+        if not os.path.isdir(self.directory):
+            return []
+        days = []
+        for entry in os.listdir(self.directory):
+            if entry.startswith('date=') and os.path.exists(os.path.join(self.directory, entry, 'part.parquet')):
+                days.append(prog_to_date(entry[len('date='):]))
+        return sorted(days)
+
+    def append(self, day, report_path):
+        # Streams a written report (CSV, Parquet or Arrow) into the day's file, keeping the
+        # first row seen for each device ID. The file is swapped in only once complete.
+        import pyarrow as pa
+        import pyarrow.parquet
+        day = prog_to_date(day)
+        path = self.partition_path(day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        seen_ids = set()
+        writer = None
+        try:
+            for table in self._read_batches(report_path):
+                keep = []
+                for index, device_id in enumerate(table.column('ID').to_pylist()):
+                    if device_id not in seen_ids:
+                        seen_ids.add(device_id)
+                        keep.append(index)
+                table = table.take(pa.array(keep, type=pa.int64()))
+                table = table.append_column(DATE_COLUMN, pa.array([day] * len(table), type=pa.date32()))
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(temp_path, table.schema, compression=COMPRESSION)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            return 0
+        os.replace(temp_path, path)
+        return len(seen_ids)
+
+    def _read_batches(self, report_path):
+        # Report chunks as Arrow tables with categories stored as plain strings
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+        if report_path.endswith('.csv'):
+            for chunk in pd.read_csv(report_path, dtype=str, keep_default_na=False, chunksize=HISTORY_BATCH_ROWS):
+                arrow_schema = prog_arrow_schema(chunk.columns, self.schema, 'feather')
+                typed = mdm_apply_schema(chunk, self.schema).reset_index(drop=True)
+                typed = typed.astype({
+                    column: 'string' for column in typed.columns if isinstance(typed[column].dtype, pd.CategoricalDtype)
+                })
+                yield pa.Table.from_pandas(typed, schema=arrow_schema, preserve_index=False)
+            return
+        if report_path.endswith('.parquet'):
+            batches = pyarrow.parquet.ParquetFile(report_path).iter_batches(batch_size=HISTORY_BATCH_ROWS)
+        else:
+            reader = pyarrow.ipc.open_file(report_path)
+            batches = (reader.get_batch(index) for index in range(reader.num_record_batches))
+        for batch in batches:
+            table = pa.Table.from_batches([batch])
+            arrow_schema = prog_arrow_schema(table.column_names, self.schema, 'feather')
+            yield table.cast(arrow_schema)
+
+    def import_dated_reports(self, directory='.'):
+        # Backfills days from {date}_{name}.{csv,parquet,arrow} files not yet in the history
+        pattern = re.compile(rf'^(\d{{4}}-\d{{2}}-\d{{2}})_{re.escape(self.name)}\.(\w+)$')
+        extensions = {OUTPUT_EXTENSIONS[output_format]: output_format for output_format in HISTORY_SOURCE_FORMATS}
+        sources = {}
+        for entry in os.listdir(directory):
+            match = pattern.match(entry)
+            if not match or match.group(2) not in extensions:
+                continue
+            day = prog_to_date(match.group(1))
+            rank = HISTORY_SOURCE_FORMATS.index(extensions[match.group(2)])
+            if day not in sources or rank < sources[day][0]:
+                sources[day] = (rank, os.path.join(directory, entry))
+        existing = set(self.dates())
+        imported = []
+        for day in sorted(sources):
+            if day not in existing:
+                self.append(day, sources[day][1])
+                imported.append(day)
+        return imported
+
+    def _dataset(self, start, end):
+        # The days between start and end (inclusive) as one dataset, or None if there are none
+        import pyarrow as pa
+        import pyarrow.dataset
+        import pyarrow.parquet
+        start, end = prog_to_date(start), prog_to_date(end)
+        days = [day for day in self.dates() if (start is None or day >= start) and (end is None or day <= end)]
+        if not days:
+            return None
+        paths = [self.partition_path(day) for day in days]
+        # Report columns can change between days; columns missing from a day read as null
+        schema = pa.unify_schemas([pyarrow.parquet.read_schema(path) for path in paths])
+        return pyarrow.dataset.dataset(paths, schema=schema, format='parquet')
+
+    def device(self, device_id, columns=None, start=None, end=None):
+        # One device's rows over time, indexed by report date
+        import pyarrow.dataset
+        dataset = self._dataset(start, end)
+        if dataset is None:
+            return pd.DataFrame(columns=columns).rename_axis(DATE_COLUMN)
+        if columns is not None:
+            columns = [DATE_COLUMN] + [column for column in columns if column != DATE_COLUMN]
+        table = dataset.to_table(columns=columns, filter=pyarrow.dataset.field('ID') == device_id)
+        return table.to_pandas(date_as_object=False).set_index(DATE_COLUMN).sort_index()
+
+    def column(self, column, start=None, end=None, agg=None):
+        # Without agg: a report date x device ID frame of the column's values.
+        # With agg (e.g. 'median', 'mean', 'max', 'count'): one value per report date.
+        dataset = self._dataset(start, end)
+        if dataset is None:
+            return pd.Series(dtype=object, name=column).rename_axis(DATE_COLUMN) if agg else pd.DataFrame().rename_axis(DATE_COLUMN)
+        df = dataset.to_table(columns=[DATE_COLUMN, 'ID', column]).to_pandas(date_as_object=False)
+        if agg is not None:
+            return df.groupby(DATE_COLUMN)[column].agg(agg)
+        return df.pivot(index=DATE_COLUMN, columns='ID', values=column)
+
+
+def mdm_record_history(root, report_writer, today, directory='.'):
+    # Adds today's report to its history, from the best format that was written, then backfills
+    # any older dated reports in directory that the history does not have yet
+    history = ReportHistory(root, report_writer.name, report_writer.schema)
+    output_format = [output_format for output_format in HISTORY_SOURCE_FORMATS if output_format in report_writer.output_formats][0]
+    history.append(today, report_writer.output_path(output_format, latest=False))
+    history.import_dated_reports(directory)
+    return history
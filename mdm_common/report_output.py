@@ -0,0 +1,235 @@
+# --------------- REPORT OUTPUT --------------- #
+
+# Pandas
+import pandas as pd
+
+# Derived Columns
+from mdm_common.derived_columns import prog_apply_to_unique
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'feather']
+OUTPUT_EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet', 'feather': 'arrow'}
+COMPRESSION = 'zstd'
+# Rows collected before a chunk is written
+DEFAULT_CHUNK_SIZE = 1000
+
+# Column types; anything not listed is stored as a string.
+# ('datetime', format) parses with that format, ('datetime', None) parses ISO-like timestamps.
+COMPUTER_REPORT_SCHEMA = {
+    'Apple Silicon': 'boolean',
+    'Battery Capacity': 'Int64',
+    'Building': 'category',
+    'Days Since Last Check In': 'Int64',
+    'Days Since Last Enrollment': 'Int64',
+    'Days Since Last Inventory Update': 'Int64',
+    'Department': 'category',
+    'Enrollment DEP': 'boolean',
+    'Filevault Status': 'category',
+    'Gatekeeper Status': 'category',
+    'ID': 'Int64',
+    'Last Check In': ('datetime', None),
+    'Last Enrollment': ('datetime', None),
+    'Last Inventory Update': ('datetime', None),
+    'Management Status': 'boolean',
+    'MDM Expiration': ('datetime', None),
+    'Model': 'category',
+    'Model ID': 'category',
+    'OS Version': 'category',
+    'Position': 'category',
+    'Processor': 'category',
+    'Processor Architecture': 'category',
+    'Processor Cores': 'Int64',
+    'Ram GB': 'Int64',
+    'Ram MB': 'Int64',
+    'Room': 'category',
+    'SIP Status': 'category',
+    'Storage Available GB': 'Int64',
+    'Storage Available MB': 'Int64',
+    'Storage Total GB': 'Int64',
+    'Storage Total MB': 'Int64',
+    'Year': 'Int64',
+}
+
+MOBILE_DEVICE_REPORT_SCHEMA = {
+    'Available GB': 'Int64',
+    'Available MB': 'Int64',
+    'Battery Level': 'Int64',
+    'Building': 'category',
+    'Capacity GB': 'Int64',
+    'Capacity MB': 'Int64',
+    'Carrier': 'category',
+    'Days Since Last Inventory Update': 'Int64',
+    'Department': 'category',
+    'Enrollment Method': 'category',
+    'ID': 'Int64',
+    'Last Enrollment': ('datetime', None),
+    'Last Enrollment UTC': ('datetime', None),
+    'Last Inventory Update': ('datetime', '%A, %B %d %Y at %I:%M %p'),
+    'Model': 'category',
+    'Model Identifier': 'category',
+    'Model Number': 'category',
+    'OS Build': 'category',
+    'OS Version': 'category',
+    'Passcode Status': 'boolean',
+    'Percentage Used': 'Int64',
+    'Position': 'category',
+    'Room': 'category',
+}
+
+BOOLEAN_VALUES = {True: True, False: False, 'true': True, 'false': False, 'True': True, 'False': False}
+
+
+def prog_convert_column(series, dtype):
+    # Report cells use '' for missing values
+    series = series.where(series != '')
+    if isinstance(dtype, tuple):
+        date_format = dtype[1]
+        # Timestamps without an offset are treated as UTC
+        return prog_apply_to_unique(
+            series,
+            lambda values: pd.to_datetime(values, format=date_format, errors='coerce', utc=True),
+        )
+    if dtype in ('Int64', 'Float64'):
+        numbers = pd.to_numeric(series, errors='coerce').astype('Float64')
+        if dtype == 'Int64':
+            # Like unparseable text, a value that is not a whole number is missing rather than truncated
+            return numbers.where(numbers % 1 == 0).astype('Int64')
+        return numbers
+    if dtype == 'boolean':
+        return series.map(BOOLEAN_VALUES).astype('boolean')
+    if dtype == 'category':
+        return series.astype('string').astype('category')
+    return series.astype('string')
+
+
+def mdm_apply_schema(df, schema):
+    typed = {column: prog_convert_column(df[column], schema.get(column, 'string')) for column in df.columns}
+    return pd.DataFrame(typed, index=df.index)
+
+
+def prog_require_pyarrow(output_format):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit(f"pyarrow is required for --format {output_format}: pip install pyarrow")
+
+
+def prog_arrow_schema(columns, schema, output_format):
+    # A fixed Arrow schema so every chunk is written with the same column types
+    import pyarrow as pa
+    fields = []
+    for column in columns:
+        dtype = schema.get(column, 'string')
+        if isinstance(dtype, tuple):
+            arrow_type = pa.timestamp('us', tz='UTC')
+        elif dtype == 'Int64':
+            arrow_type = pa.int64()
+        elif dtype == 'Float64':
+            arrow_type = pa.float64()
+        elif dtype == 'boolean':
+            arrow_type = pa.bool_()
+        elif dtype == 'category' and output_format == 'parquet':
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        else:
+            # Arrow IPC files cannot swap dictionaries between batches, so categories are stored as strings
+            arrow_type = pa.string()
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+class ReportWriter:
+    # Writes a report in chunks as rows arrive, so memory is bounded by the chunk size rather
+    # than the fleet. Each chunk is a list of row tuples in input_columns order; the
+    # transform adds derived columns to the chunk's DataFrame before it is written.
+    # Writes {today}_{name} (and {name} when latest is set) in each requested format.
+    # CSV keeps the untyped text layout; Parquet and Arrow files carry the typed schema.
+    def __init__(self, name, today, output_formats, schema, input_columns, latest=True, transform=None):
+        self.name = name
+        self.schema = schema
+        self.input_columns = list(input_columns)
+        self.transform = transform
+        self.output_formats = output_formats
+        self.paths = [f"{today}_{name}"]
+        if latest:
+            self.paths.insert(0, name)
+        self.columns = None
+        self.rows_written = 0
+        self._arrow_writers = {}
+        for output_format in output_formats:
+            if output_format != 'csv':
+                prog_require_pyarrow(output_format)
+
+    def output_path(self, output_format, latest=True):
+        path = self.paths[0] if latest else self.paths[-1]
+        return f"{path}.{OUTPUT_EXTENSIONS[output_format]}"
+
+    def write(self, rows):
+        df = pd.DataFrame.from_records(rows, columns=self.input_columns)
+        if self.columns is not None and df.empty:
+            return
+        if self.transform is not None:
+            df = self.transform(df)
+        df = df.reindex(sorted(df.columns), axis=1)
+        df = df.astype(object)
+        first_chunk = self.columns is None
+        if first_chunk:
+            self.columns = list(df.columns)
+        typed_df = None
+        for output_format in self.output_formats:
+            if output_format == 'csv':
+                for path in self.paths:
+                    df.to_csv(f"{path}.csv", index=False, mode='w' if first_chunk else 'a', header=first_chunk)
+                continue
+            if typed_df is None:
+                typed_df = mdm_apply_schema(df, self.schema).reset_index(drop=True)
+            self._write_arrow(output_format, typed_df)
+        self.rows_written += len(df)
+
+    def _write_arrow(self, output_format, typed_df):
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+        if output_format not in self._arrow_writers:
+            arrow_schema = prog_arrow_schema(self.columns, self.schema, output_format)
+            writers = []
+            for path in self.paths:
+                target = f"{path}.{OUTPUT_EXTENSIONS[output_format]}"
+                if output_format == 'parquet':
+                    writers.append(pyarrow.parquet.ParquetWriter(target, arrow_schema, compression=COMPRESSION))
+                else:
+                    options = pyarrow.ipc.IpcWriteOptions(compression=COMPRESSION)
+                    writers.append(pyarrow.ipc.new_file(target, arrow_schema, options=options))
+            self._arrow_writers[output_format] = (arrow_schema, writers)
+        arrow_schema, writers = self._arrow_writers[output_format]
+        if output_format == 'feather':
+            typed_df = typed_df.astype({
+                column: 'string' for column in typed_df.columns if isinstance(typed_df[column].dtype, pd.CategoricalDtype)
+            })
+        table = pa.Table.from_pandas(typed_df, schema=arrow_schema, preserve_index=False)
+        for writer in writers:
+            writer.write_table(table)
+
+    def close(self):
+        for _, writers in self._arrow_writers.values():
+            for writer in writers:
+                writer.close()
+        self._arrow_writers = {}
+
+    def read(self, columns=None):
+        # Builds an in-memory frame from the written report, preferring the typed formats
+        for output_format in ['parquet', 'feather', 'csv']:
+            if output_format in self.output_formats:
+                return mdm_read_report(self.output_path(output_format), self.schema, columns=columns)
+
+
+def mdm_read_report(path, schema, columns=None):
+    # Loads a report written in any output format with the typed schema applied
+    if path.endswith('.parquet'):
+        prog_require_pyarrow('parquet')
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.arrow'):
+        prog_require_pyarrow('feather')
+        df = pd.read_feather(path, columns=columns)
+        categories = [column for column in df.columns if schema.get(column) == 'category']
+        return df.astype({column: 'category' for column in categories})
+    df = pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+    return mdm_apply_schema(df, schema)
@@ -0,0 +1,108 @@
+# --------------- RESPONSE CACHE --------------- #
+
+# Files
+import os
+import sqlite3
+
+# Threading
+import threading
+
+# Time
+import time
+
+# Requests
+import requests
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'mdm_scripts', 'responses.sqlite')
+DEFAULT_CACHE_MAX_MB = 512
+
+# (endpoint substring, seconds) checked in order; the first match sets the TTL
+DEFAULT_TTLS = [
+    ('/JSSResource/computers/id/', 60 * 60),
+    ('/JSSResource/mobiledevices/id/', 60 * 60),
+    ('/api/v1/departments', 24 * 60 * 60),
+    ('/api/v1/buildings', 24 * 60 * 60),
+]
+# Listings decide what gets fetched, so they go stale quickly
+DEFAULT_TTL = 5 * 60
+
+
+class ResponseCache:
+    # Persistent cache of successful Jamf GET responses keyed by endpoint and accept type.
+    # Entries expire per endpoint TTL and the least recently used are evicted once the
+    # cache grows past max_bytes. With bypass set, cached entries are ignored but refreshed.
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024,
+                 ttls=DEFAULT_TTLS, default_ttl=DEFAULT_TTL, bypass=False):
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, body BLOB, content_type TEXT, size INTEGER, expires REAL, last_access REAL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self._connection.execute('DELETE FROM responses WHERE expires < ?', (time.time(),))
+        self._total_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def ttl_for(self, endpoint):
+        for pattern, ttl in self.ttls:
+            if pattern in endpoint:
+                return ttl
+        return self.default_ttl
+
+    def get(self, endpoint, accept):
+        # Returns a requests.Response rebuilt from the cache, or None
+        if self.bypass:
+            return None
+        key = f"{accept} {endpoint}"
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body, content_type FROM responses WHERE key = ? AND expires >= ?', (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+        response = requests.Response()
+        response.status_code = 200
+        response.url = endpoint
+        response._content = row[0]
+        response.headers['Content-Type'] = row[1]
+        return response
+
+    def put(self, endpoint, accept, response):
+        if response.status_code != 200:
+            return
+        key = f"{accept} {endpoint}"
+        body = response.content
+        now = time.time()
+        with self._lock:
+            previous = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, body, response.headers.get('Content-Type', accept), len(body), now + self.ttl_for(endpoint), now),
+            )
+            self._total_bytes += len(body) - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = self.max_bytes * 0.9
+        rows = self._connection.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,139 @@
+# --------------- RETRY AND RATE LIMITING --------------- #
+
+# Date
+import email.utils
+import time
+
+# Random
+import random
+
+# Threading
+import threading
+
+# Requests
+import requests
+
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 60
+# Statuses that mean the request was not processed and can be sent again with any method
+RETRY_STATUSES = {429, 503}
+# Gateway errors: the request may have reached Jamf, so only idempotent methods are resent
+IDEMPOTENT_RETRY_STATUSES = {502, 504}
+# Statuses that mean the server wants clients to slow down
+THROTTLE_STATUSES = {429, 503}
+# Methods that are safe to resend after a connection error or gateway error
+IDEMPOTENT_METHODS = {'GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'}
+
+
+def prog_parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket:
+    # Allows `rate` requests per second on average with bursts of up to `burst`
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveConcurrencyLimit:
+    # Caps requests in flight. The cap halves when the server throttles and grows back by
+    # one after a full window of successful responses (additive increase, multiplicative decrease).
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self.successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self._condition.notify_all()
+
+
+class RequestThrottle:
+    # Sends requests through the concurrency limit and optional token bucket, retrying
+    # throttled and transient failures with exponential backoff, full jitter and Retry-After.
+    def __init__(self, max_concurrency, rate=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.concurrency = AdaptiveConcurrencyLimit(max_concurrency)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def send(self, method, send_request):
+        # send_request() performs one HTTP request and returns the response
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self.concurrency.acquire()
+            throttled = False
+            try:
+                response = send_request()
+                throttled = response.status_code in THROTTLE_STATUSES
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                attempt += 1
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_attempts:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+            finally:
+                self.concurrency.release(throttled)
+            attempt += 1
+            retryable = response.status_code in RETRY_STATUSES or (
+                response.status_code in IDEMPOTENT_RETRY_STATUSES and method in IDEMPOTENT_METHODS
+            )
+            if not retryable or attempt >= self.max_attempts:
+                return response
+            time.sleep(self.backoff(attempt, prog_parse_retry_after(response.headers.get('Retry-After'))))
@@ -0,0 +1,82 @@
+# --------------- DEVICE SNAPSHOT --------------- #
+
+# Files
+import json
+import sqlite3
+
+# Pagination
+from mdm_common.pagination import JamfPager
+
+
+def _device_id(value):
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
+
+
+def mdm_get_computer_change_stamps(fetch_json, jamf_url, page_size):
+    # Ordered {device_id: report date} from the GENERAL section only, which is cheap to page through
+    endpoint = f"{jamf_url}/api/v1/computers-inventory"
+    pager = JamfPager(fetch_json, endpoint, page_size=page_size, params='section=GENERAL&sort=id%3Aasc')
+    return {_device_id(record['id']): (record.get('general') or {}).get('reportDate') for record in pager}
+
+
+def mdm_get_mobile_device_change_stamps(fetch_json, jamf_url, page_size):
+    # Ordered {device_id: last inventory update} from the GENERAL section only
+    endpoint = f"{jamf_url}/api/v2/mobile-devices/detail"
+    pager = JamfPager(fetch_json, endpoint, page_size=page_size, params='section=GENERAL&sort=mobileDeviceId%3Aasc')
+    return {
+        _device_id(record['mobileDeviceId']): (record.get('general') or {}).get('lastInventoryUpdateDate')
+        for record in pager
+    }
+
+
+class DeviceSnapshot:
+    # Report rows from the last run keyed by device ID, each with the change stamp it was
+    # fetched at, kept in SQLite so neither the old nor the new snapshot is held in memory.
+    # A device whose stamp is unchanged can reuse its stored row instead of being fetched again.
+    def __init__(self, path, columns, id_column='ID'):
+        self.path = path
+        self.columns = list(columns)
+        self._id_index = self.columns.index(id_column)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS meta (columns TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS devices (id TEXT PRIMARY KEY, stamp TEXT, row TEXT)')
+        self._connection.execute('DROP TABLE IF EXISTS next_devices')
+        self._connection.execute('CREATE TABLE next_devices (id TEXT PRIMARY KEY, stamp TEXT, row TEXT)')
+        stored_columns = self._connection.execute('SELECT columns FROM meta').fetchone()
+        self.stored_columns = json.loads(stored_columns[0]) if stored_columns else []
+
+    def unchanged_ids(self, stamps):
+        # Device IDs whose stamp matches the last run.
+        # A change to the report's columns invalidates the whole snapshot.
+        if self.stored_columns != self.columns:
+            return set()
+        unchanged = set()
+        for device_id, stamp in self._connection.execute('SELECT id, stamp FROM devices'):
+            device_id = _device_id(device_id)
+            if stamp is not None and stamps.get(device_id) == stamp:
+                unchanged.add(device_id)
+        return unchanged
+
+    def row(self, device_id):
+        stored = self._connection.execute('SELECT row FROM devices WHERE id = ?', (str(device_id),)).fetchone()
+        return tuple(json.loads(stored[0]))
+
+    def add(self, device_id, stamp, row):
+        # Blank rows are devices that could not be fetched; leave them out so they are retried
+        if stamp is None or all(value == '' for index, value in enumerate(row) if index != self._id_index):
+            return
+        self._connection.execute(
+            'INSERT OR REPLACE INTO next_devices VALUES (?, ?, ?)', (str(device_id), stamp, json.dumps(row))
+        )
+
+    def save(self):
+        # Replace the snapshot with this run's rows; devices no longer listed are dropped
+        with self._connection:
+            self._connection.execute('DROP TABLE devices')
+            self._connection.execute('ALTER TABLE next_devices RENAME TO devices')
+            self._connection.execute('DELETE FROM meta')
+            self._connection.execute('INSERT INTO meta VALUES (?)', (json.dumps(self.columns),))
+        self.stored_columns = self.columns
+        self._connection.close()
@@ -0,0 +1,89 @@
+# --------------- STATIC GROUPS --------------- #
+
+# Concurrency
+from concurrent.futures import ThreadPoolExecutor
+
+# XML
+from xml.sax.saxutils import escape
+
+# Shared MDM Modules
+from mdm_common.fetch import DEFAULT_WORKERS
+from mdm_common.inventory_store import COMPUTER, MOBILE_DEVICE
+from mdm_common.jamf_session import prog_response_error
+
+# Classic API group resource and member element for each device type
+GROUP_RESOURCES = {COMPUTER: ('computergroups', 'computer'), MOBILE_DEVICE: ('mobiledevicegroups', 'mobile_device')}
+# The Classic API rejects the whole update with this status when one of its devices cannot be matched
+GROUP_CONFLICT_STATUS = 409
+
+
+def mdm_update_static_group(jamf_session, device_type, group_id, additions=(), deletions=()):
+    # Adds and removes devices by serial number in one PUT; returns an error or None
+    resource, member = GROUP_RESOURCES[device_type]
+    body = f"<{member}_group>"
+    for change, serial_numbers in (('additions', additions), ('deletions', deletions)):
+        if serial_numbers:
+            members = ''.join(f"<{member}><serial_number>{escape(serial_number)}</serial_number></{member}>"
+                              for serial_number in serial_numbers)
+            body += f"<{member}_{change}>{members}</{member}_{change}>"
+    body += f"</{member}_group>"
+    response = jamf_session.put(f"{jamf_session.jamf_url}/JSSResource/{resource}/id/{group_id}",
+                                accept='application/xml', data=body.encode(), headers={'Content-Type': 'text/xml'})
+    if not response.ok:
+        return response.status_code, prog_response_error(response)
+    return None
+
+
+class StaticGroupChanges:
+    # Collects device additions and removals per static group and applies them with one
+    # Classic API PUT per group, so Jamf re-evaluates each group's scope once per wave
+    # instead of once per device. A device both added to and removed from a group before
+    # apply() gets whichever change came last; callers reporting each change should leave out
+    # the earlier one.
+    def __init__(self):
+        self._changes = {}
+
+    def add(self, device_type, group_id, serial_number):
+        self._changes.setdefault((device_type, str(group_id)), {})[serial_number.upper()] = True
+
+    def remove(self, device_type, group_id, serial_number):
+        self._changes.setdefault((device_type, str(group_id)), {})[serial_number.upper()] = False
+
+    def __len__(self):
+        return len(self._changes)
+
+    def apply(self, jamf_session, workers=DEFAULT_WORKERS):
+        # Sends every group's changes concurrently and clears them. Returns
+        # {(device_type, group_id, serial_number): error} for the changes that failed.
+        changes, self._changes = self._changes, {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+            futures = {
+                key: executor.submit(prog_apply_group_changes, jamf_session, key[0], key[1], list(members.items()))
+                for key, members in changes.items()
+            }
+            for (device_type, group_id), future in futures.items():
+                try:
+                    failed = future.result()
+                except Exception as error:
+                    failed = {serial_number: str(error) for serial_number in changes[(device_type, group_id)]}
+                for serial_number, error in failed.items():
+                    errors[(device_type, group_id, serial_number)] = error
+        return errors
+
+
+def prog_apply_group_changes(jamf_session, device_type, group_id, members):
+    # members is a list of (serial_number, added). Returns {serial_number: error}.
+    additions = [serial_number for serial_number, added in members if added]
+    deletions = [serial_number for serial_number, added in members if not added]
+    failure = mdm_update_static_group(jamf_session, device_type, group_id, additions, deletions)
+    if failure is None:
+        return {}
+    status, error = failure
+    if status != GROUP_CONFLICT_STATUS or len(members) == 1:
+        return {serial_number: error for serial_number, _ in members}
+    # One unmatched device fails the whole update; split it in halves to isolate the bad ones
+    middle = len(members) // 2
+    errors = prog_apply_group_changes(jamf_session, device_type, group_id, members[:middle])
+    errors.update(prog_apply_group_changes(jamf_session, device_type, group_id, members[middle:]))
+    return errors
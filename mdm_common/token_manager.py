@@ -0,0 +1,159 @@
+# --------------- TOKEN MANAGER --------------- #
+
+# Date
+import datetime
+import re
+import time
+
+# Files
+import hashlib
+import json
+import os
+
+# Threading
+import threading
+
+# Requests
+import requests
+from requests.auth import AuthBase
+
+# Token cache location, one file per Jamf URL and username
+DEFAULT_TOKEN_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mdm_scripts')
+# Refresh this many seconds before the token expires
+REFRESH_MARGIN = 120
+# Lifetime assumed when the server does not send an expiry
+DEFAULT_TOKEN_LIFETIME = 20 * 60
+
+
+class _ExplicitBearerAuth(AuthBase):
+    # Used for keep-alive, which must be sent with the token being extended
+    def __init__(self, token):
+        self.token = token
+
+    def __call__(self, request):
+        request.headers['Authorization'] = f'Bearer {self.token}'
+        return request
+
+
+def prog_parse_token_expiry(expires):
+    # Jamf returns e.g. 2024-05-01T12:00:00.123Z; the fraction length varies between versions
+    if not expires:
+        return time.time() + DEFAULT_TOKEN_LIFETIME
+    expires = expires.replace('Z', '+00:00')
+    expires = re.sub(r'\.(\d{1,6})\d*', lambda match: '.' + match.group(1).ljust(6, '0'), expires)
+    expiry = datetime.datetime.fromisoformat(expires)
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+    return expiry.timestamp()
+
+
+class JamfTokenManager:
+    # Caches the Jamf Pro bearer token and its expiry in memory and on disk.
+    # Concurrent callers share one in-flight refresh; callers holding a token that is
+    # still valid keep using it while the refresh runs instead of waiting.
+    def __init__(self, jamf_session, username, cache_dir=DEFAULT_TOKEN_CACHE_DIR, refresh_margin=REFRESH_MARGIN):
+        self.jamf_session = jamf_session
+        self.refresh_margin = refresh_margin
+        cache_key = hashlib.sha256(f"{jamf_session.jamf_url}|{username}".encode()).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, f"token_{cache_key}.json") if cache_dir else None
+        self._lock = threading.Lock()
+        self._refresh_done = None
+        self._state = self._load_cache()
+
+    def get_token(self):
+        token, expires = self._state
+        if token and time.time() < expires - self.refresh_margin:
+            return token
+        with self._lock:
+            token, expires = self._state
+            if token and time.time() < expires - self.refresh_margin:
+                return token
+            leader = self._refresh_done is None
+            if leader:
+                self._refresh_done = threading.Event()
+            refresh_done = self._refresh_done
+        if leader:
+            try:
+                self._refresh(token, expires)
+            finally:
+                with self._lock:
+                    self._refresh_done = None
+                refresh_done.set()
+        elif token and time.time() < expires:
+            # Another worker is refreshing and the current token is still usable
+            return token
+        else:
+            refresh_done.wait()
+        token, expires = self._state
+        if not token:
+            raise requests.exceptions.HTTPError("Could not obtain a Jamf Pro API token.")
+        return token
+
+    def invalidate(self, token):
+        # Drop a token the server rejected so the next caller fetches a new one
+        with self._lock:
+            if self._state[0] == token:
+                self._state = (None, 0)
+
+    def _refresh(self, token, expires):
+        data = None
+        if token and time.time() < expires:
+            data = self._keep_alive(token)
+        if data is None:
+            data = self._request_new_token()
+        if data is None:
+            self._state = (None, 0)
+            return
+        self._state = (data['token'], prog_parse_token_expiry(data.get('expires')))
+        self._save_cache()
+
+    def _keep_alive(self, token):
+        try:
+            response = self.jamf_session.post(
+                f"{self.jamf_session.jamf_url}/api/v1/auth/keep-alive",
+                auth=_ExplicitBearerAuth(token),
+                throttle=self.jamf_session.auth_throttle,
+            )
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+    def _request_new_token(self):
+        # Retries and backoff happen in the session's auth throttle
+        try:
+            response = self.jamf_session.post(
+                f"{self.jamf_session.jamf_url}/api/v1/auth/token",
+                throttle=self.jamf_session.auth_throttle,
+            )
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Could not get a Jamf Pro API token: {e}")
+            return None
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return (None, 0)
+        try:
+            with open(self.cache_path) as cache_file:
+                cached = json.load(cache_file)
+            return (cached['token'], float(cached['expires']))
+        except (OSError, ValueError, KeyError, TypeError):
+            return (None, 0)
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        token, expires = self._state
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), mode=0o700, exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            # Create the file owner-only before any token bytes are written
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump({'token': token, 'expires': expires}, cache_file)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            # The cache is an optimisation; a read-only home directory should not stop the run
+            pass
@@ -3,8 +3,13 @@
 
 # --------------- ENVIRONMENT SETUP --------------- #
 
+# Arguments
+import argparse
+
+# Functions
+import functools
+
 # Date
-import time
 from datetime import date
 import datetime
 
@@ -12,578 +17,355 @@ import datetime
 import pandas as pd
 pd.options.mode.chained_assignment = None
 
-# Requests
-import requests
-from requests.auth import HTTPBasicAuth
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
 # TQDM
 from tqdm import tqdm
 
+# Shared MDM Modules
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mdm_common.computer_inventory import mdm_iter_computers_in_bulk
+from mdm_common.config import ConfigError, mdm_add_config_arguments, mdm_load_credentials, mdm_parse_args
+from mdm_common.derived_columns import prog_add_computer_derived_columns, prog_add_mobile_device_derived_columns
+from mdm_common.fetch import DEFAULT_WORKERS, mdm_fetch_concurrently
+from mdm_common.inventory_store import COMPUTER, DEFAULT_INVENTORY_PATH, MOBILE_DEVICE, InventoryStore
+from mdm_common.jamf_session import JamfSession
+from mdm_common.metrics import RunMetrics, prog_timed_iter
+from mdm_common.pagination import DEFAULT_PAGE_SIZE, JamfPager
+from mdm_common.report_output import (
+    COMPUTER_REPORT_SCHEMA,
+    DEFAULT_CHUNK_SIZE,
+    MOBILE_DEVICE_REPORT_SCHEMA,
+    OUTPUT_FORMATS,
+    ReportWriter,
+)
+from mdm_common.report_diff import COMPUTER_DIFF_COLUMNS, MOBILE_DEVICE_DIFF_COLUMNS, mdm_report_changes
+from mdm_common.report_fields import COMPUTER_REPORT_FIELDS, MOBILE_DEVICE_REPORT_FIELDS, FieldExtractor
+from mdm_common.report_history import mdm_record_history
+from mdm_common.response_cache import DEFAULT_CACHE_MAX_MB, ResponseCache
+from mdm_common.snapshot import DeviceSnapshot, mdm_get_computer_change_stamps, mdm_get_mobile_device_change_stamps
+
 # --------------- GLOBAL VARIABLES --------------- #
 
 # DateTime
 NOW = datetime.datetime.now()
 CURRENT_YEAR = NOW.year
 TODAY = date.today()
-today_list = []
-today_list.append(TODAY.strftime('%Y'))
-today_list.append(TODAY.strftime('%m'))
-today_list.append(TODAY.strftime('%d'))
-# Convert to int
-for n, i in enumerate(today_list):
-    today_list[n] = int(i)
 
-# --------------- LOCAL VARIABLES --------------- #
+# Snapshots of the last run used by --incremental
+COMPUTER_SNAPSHOT = 'mdm_computer_snapshot.sqlite'
+MOBILE_DEVICE_SNAPSHOT = 'mdm_mobile_device_snapshot.sqlite'
 
-jamf_url = input('Enter your Jamf API URL: ')
-username = input('Enter your Jamf API username: ')
-password = input('Enter your Jamf API password: ')
+# Report columns and where each one is read from in the Classic API device record
+COMPUTER_FIELDS = FieldExtractor(COMPUTER_REPORT_FIELDS)
+MOBILE_DEVICE_FIELDS = FieldExtractor(MOBILE_DEVICE_REPORT_FIELDS)
 
 # --------------- FUNCTIONS --------------- #
 
 # MDM Functions
-def mdm_get_token(jamf_url, username, password):
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.post(
-                url=f"{jamf_url}/api/v1/auth/token",
-                headers={"accept": "application/json"},
-                auth=HTTPBasicAuth(f'{username}', f'{password}'),
-                verify=False,
-            )
-            response.raise_for_status()
-            data = response.json()
-            token = data['token']
-            return token
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                print("Could not complete after 10 attempts.")
-                successful = True
-        else:
-            successful = True
+def mdm_get_token(jamf_session):
+    # Cached on disk and refreshed through keep-alive before it expires
+    token = jamf_session.token_manager.get_token()
+    return token
 
 
-def mdm_get_all_computer_data(jamf_url):
-    endpoint = f"{jamf_url}/api/preview/computers"
-    results = mdm_get_request_jamf_pro(token, endpoint)
-    computers = results['results']
+def mdm_get_all_computer_data(jamf_session, page_size):
+    # Pages are streamed lazily; total_count is read from the first page
+    endpoint = f"{jamf_session.jamf_url}/api/preview/computers"
+    computers = JamfPager(functools.partial(mdm_get_request_jamf_pro, jamf_session), endpoint, page_size=page_size)
     return computers
 
 
-def mdm_get_all_mobile_device_general_data(jamf_url):
-    endpoint = f"{jamf_url}/JSSResource/mobiledevices"
-    results = mdm_get_request_jamf_classic_json(username, password, endpoint)
+def mdm_get_all_mobile_device_general_data(jamf_session):
+    endpoint = f"{jamf_session.jamf_url}/JSSResource/mobiledevices"
+    results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
     mobile_devices = results['mobile_devices']
     return mobile_devices
 
 
-def mdm_get_computer_data_by_id(jamf_url, device_id):
-    endpoint = f"{jamf_url}/JSSResource/computers/id/{device_id}"
-    results = mdm_get_request_jamf_classic_json(username, password, endpoint)
+def mdm_get_computer_data_by_id(jamf_session, device_id):
+    endpoint = f"{jamf_session.jamf_url}/JSSResource/computers/id/{device_id}"
+    results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
     computer = results['computer']
     return computer
 
 
-def mdm_get_mobile_device_data_by_id(jamf_url, device_id):
-    endpoint = f"{jamf_url}/JSSResource/mobiledevices/id/{device_id}"
-    results = mdm_get_request_jamf_classic_json(username, password, endpoint)
+def mdm_get_mobile_device_data_by_id(jamf_session, device_id):
+    endpoint = f"{jamf_session.jamf_url}/JSSResource/mobiledevices/id/{device_id}"
+    results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
     mobile_device_data = results['mobile_device']
     return mobile_device_data
 
 
-def mdm_get_request_jamf_classic_json(username, password, endpoint):
-    headers = {'accept': 'application/json'}
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.get(
-                url=endpoint,
-                auth=HTTPBasicAuth(f'{username}', f'{password}'),
-                headers=headers,
-                verify=False,
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                successful = True
+def mdm_get_request_jamf_classic_json(jamf_session, endpoint):
+    response = jamf_session.get(endpoint)
+    response.raise_for_status()
+    result = response.json()
+    return result
+
+
+def mdm_get_request_jamf_pro(jamf_session, endpoint):
+    response = jamf_session.get(endpoint, bearer=True)
+    response.raise_for_status()
+    result = response.json()
+    return result
+
+
+def mdm_run_computer_report(jamf_session, args, inventory, metrics):
+    jamf_url = jamf_session.jamf_url
+    fetch_json = functools.partial(mdm_get_request_jamf_pro, jamf_session)
+    print("\nStarting Computer Report")
+
+    # Get all computer data from MDM
+    print("Getting all computer data...")
+    with metrics.stage('computer.list'):
+        if args.bulk:
+            # Read the report's inventory sections in pages instead of one request per device
+            number_of_computers, computer_details = mdm_iter_computers_in_bulk(fetch_json, jamf_url, args.page_size)
+        elif args.incremental:
+            # Device IDs with their last inventory report date; details are fetched once the columns are known
+            computer_stamps = mdm_get_computer_change_stamps(fetch_json, jamf_url, args.page_size)
+            number_of_computers = len(computer_stamps)
         else:
-            success = True
-
-
-def mdm_get_request_jamf_pro(token, endpoint):
-    headers = {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}',
-    }
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.get(
-                url=endpoint,
-                headers=headers,
-                verify=False,
+            computers = mdm_get_all_computer_data(jamf_session, args.page_size)
+            number_of_computers = computers.total_count
+            computer_ids = (computer['id'] for computer in computers)
+            computer_details = mdm_fetch_concurrently(
+                lambda device_id: mdm_get_computer_data_by_id(jamf_session, device_id),
+                computer_ids,
+                workers=args.workers,
+                metrics=metrics,
             )
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                print("Could not complete after 10 attempts.")
-                successful = True
+    print(f"Total number of computers found: {number_of_computers}")
+
+    # Only computers that are new or have a newer report date than the last run are fetched again
+    unchanged_computers = set()
+    if args.incremental:
+        computer_snapshot = DeviceSnapshot(COMPUTER_SNAPSHOT, COMPUTER_FIELDS.columns)
+        unchanged_computers = computer_snapshot.unchanged_ids(computer_stamps)
+        print(f"Computers unchanged since last run: {len(unchanged_computers)}")
+        computer_details = mdm_fetch_concurrently(
+            lambda device_id: None if device_id in unchanged_computers else mdm_get_computer_data_by_id(jamf_session, device_id),
+            computer_stamps,
+            workers=args.workers,
+            metrics=metrics,
+        )
+
+    # Rows are written to the report files every --chunk-size computers
+    computer_writer = ReportWriter(
+        'mdm_computer_report', TODAY, args.format, COMPUTER_REPORT_SCHEMA, COMPUTER_FIELDS.columns,
+        transform=lambda df: prog_derive_in_stage(metrics, prog_add_computer_derived_columns, df, 'computer.derive'),
+    )
+
+    # Loop through each device and flatten its details into one report row
+    print("Looping through each computer to get additional data...")
+    inventory.begin_refresh(COMPUTER)
+    rows = []
+    for device_id, computer in tqdm(prog_timed_iter(computer_details, metrics, 'computer.fetch'), total=number_of_computers):
+        with metrics.stage('computer.flatten'):
+            if device_id in unchanged_computers:
+                # Reuse the row stored by the last run
+                row = computer_snapshot.row(device_id)
+            else:
+                # Fields missing from the details, or details that could not be fetched, are left blank
+                row = COMPUTER_FIELDS.extract(device_id, computer)
+            rows.append(row)
+            # Store the row before derived columns are added
+            if args.incremental:
+                computer_snapshot.add(device_id, computer_stamps[device_id], row)
+        # Derived columns are added and the chunk is written to Box, then the rows start over
+        if len(rows) >= args.chunk_size:
+            with metrics.stage('computer.write'):
+                computer_writer.write(rows)
+            with metrics.stage('computer.inventory'):
+                inventory.add_rows(COMPUTER, COMPUTER_FIELDS.columns, rows)
+            rows = []
+
+    # Save computer report to Box
+    print("Saving MDM Computer Report to Box...")
+    with metrics.stage('computer.write'):
+        computer_writer.write(rows)
+        computer_writer.close()
+    if args.history:
+        with metrics.stage('computer.history'):
+            mdm_record_history(args.history, computer_writer, TODAY)
+    # Devices added, removed or changed since the last run
+    with metrics.stage('computer.changes'):
+        mdm_report_changes(computer_writer, TODAY, COMPUTER_DIFF_COLUMNS)
+    with metrics.stage('computer.inventory'):
+        inventory.add_rows(COMPUTER, COMPUTER_FIELDS.columns, rows)
+        inventory.finish_refresh(COMPUTER, jamf_url)
+    # Replace the last run's rows; deleted computers drop out
+    if args.incremental:
+        with metrics.stage('computer.snapshot'):
+            computer_snapshot.save()
+    return computer_writer
+
+
+def mdm_run_mobile_device_report(jamf_session, args, inventory, metrics):
+    jamf_url = jamf_session.jamf_url
+    print("\nStarting Mobile Device Report")
+
+    # Get all mobile device data
+    print("Getting all mobile device data...")
+    with metrics.stage('mobile_device.list'):
+        if args.incremental:
+            # Device IDs with their last inventory update; details are fetched once the columns are known
+            mobile_device_stamps = mdm_get_mobile_device_change_stamps(
+                functools.partial(mdm_get_request_jamf_pro, jamf_session), jamf_url, args.page_size,
+            )
+            mobile_devices = [{'id': device_id} for device_id in mobile_device_stamps]
         else:
-            success = True
+            mobile_devices = mdm_get_all_mobile_device_general_data(jamf_session)
+
+    # Get total number of devices
+    number_of_mobile_devices = len(mobile_devices)
+    print(f"Total number of mobile devices found: {number_of_mobile_devices}")
+
+    # Only mobile devices that are new or have a newer inventory update than the last run are fetched again
+    unchanged_mobile_devices = set()
+    if args.incremental:
+        mobile_device_snapshot = DeviceSnapshot(MOBILE_DEVICE_SNAPSHOT, MOBILE_DEVICE_FIELDS.columns)
+        unchanged_mobile_devices = mobile_device_snapshot.unchanged_ids(mobile_device_stamps)
+        print(f"Mobile devices unchanged since last run: {len(unchanged_mobile_devices)}")
+    mobile_device_ids = (mobile_device['id'] for mobile_device in mobile_devices)
+    mobile_device_details = mdm_fetch_concurrently(
+        lambda device_id: None if device_id in unchanged_mobile_devices else mdm_get_mobile_device_data_by_id(jamf_session, device_id),
+        mobile_device_ids,
+        workers=args.workers,
+        metrics=metrics,
+    )
+    # Rows are written to the report files every --chunk-size mobile devices
+    mobile_device_writer = ReportWriter(
+        'mdm_mobile_device_report', TODAY, args.format, MOBILE_DEVICE_REPORT_SCHEMA, MOBILE_DEVICE_FIELDS.columns,
+        transform=lambda df: prog_derive_in_stage(metrics, prog_add_mobile_device_derived_columns, df, 'mobile_device.derive'),
+    )
+
+    # Loop through each device and flatten its details into one report row
+    print("Looping through each mobile device to get additional data...")
+    inventory.begin_refresh(MOBILE_DEVICE)
+    rows = []
+    for device_id, device_data in tqdm(prog_timed_iter(mobile_device_details, metrics, 'mobile_device.fetch'), total=number_of_mobile_devices):
+        with metrics.stage('mobile_device.flatten'):
+            if device_id in unchanged_mobile_devices:
+                # Reuse the row stored by the last run
+                row = mobile_device_snapshot.row(device_id)
+            else:
+                # Fields missing from the details, or details that could not be fetched, are left blank
+                row = MOBILE_DEVICE_FIELDS.extract(device_id, device_data)
+            rows.append(row)
+            # Store the row before cleanup and derived columns
+            if args.incremental:
+                mobile_device_snapshot.add(device_id, mobile_device_stamps[device_id], row)
+        # Cleanup and derived columns are applied and the chunk is written to Box, then the rows start over
+        if len(rows) >= args.chunk_size:
+            with metrics.stage('mobile_device.write'):
+                mobile_device_writer.write(rows)
+            with metrics.stage('mobile_device.inventory'):
+                inventory.add_rows(MOBILE_DEVICE, MOBILE_DEVICE_FIELDS.columns, rows)
+            rows = []
+
+    # Save Mobile Device Report to Box
+    print("Saving MDM Mobile Device Report to Box...")
+    with metrics.stage('mobile_device.write'):
+        mobile_device_writer.write(rows)
+        mobile_device_writer.close()
+    if args.history:
+        with metrics.stage('mobile_device.history'):
+            mdm_record_history(args.history, mobile_device_writer, TODAY)
+    # Devices added, removed or changed since the last run
+    with metrics.stage('mobile_device.changes'):
+        mdm_report_changes(mobile_device_writer, TODAY, MOBILE_DEVICE_DIFF_COLUMNS)
+    with metrics.stage('mobile_device.inventory'):
+        inventory.add_rows(MOBILE_DEVICE, MOBILE_DEVICE_FIELDS.columns, rows)
+        inventory.finish_refresh(MOBILE_DEVICE, jamf_url)
+    # Replace the last run's rows; deleted mobile devices drop out
+    if args.incremental:
+        with metrics.stage('mobile_device.snapshot'):
+            mobile_device_snapshot.save()
+    return mobile_device_writer
 
 
 # Program Functions
-def prog_convert_mb_to_gb(mb):
-    gb = int(mb) / 1024
-    gb = int(gb)
-    return gb
+def prog_build_parser():
+    parser = argparse.ArgumentParser(description='Generate Jamf computer and mobile device reports.')
+    mdm_add_config_arguments(parser)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of concurrent device detail requests (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f'page size for Jamf Pro API listings (default: {DEFAULT_PAGE_SIZE})')
+    collection_mode = parser.add_mutually_exclusive_group()
+    collection_mode.add_argument('--bulk', action='store_true',
+                                 help='collect computers from paged /api/v1/computers-inventory instead of per-device Classic API calls')
+    collection_mode.add_argument('--incremental', action='store_true',
+                                 help='only fetch devices that are new or changed since the last run\'s snapshot')
+    parser.add_argument('--format', nargs='+', choices=OUTPUT_FORMATS, default=['csv'],
+                        help='report file formats; parquet and feather keep column types and need pyarrow (default: csv)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'rows held in memory before they are written to the report files (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--max-rate', type=float, default=None,
+                        help='cap on Jamf API requests per second (default: no cap, concurrency still adapts to throttling)')
+    parser.add_argument('--cache', action='store_true',
+                        help='cache Jamf GET responses on disk so re-runs read from disk instead of the API')
+    parser.add_argument('--cache-bypass', action='store_true',
+                        help='ignore cached responses for this run but refresh the cache (implies --cache)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help=f'size limit of the response cache before least recently used entries are evicted (default: {DEFAULT_CACHE_MAX_MB})')
+    parser.add_argument('--inventory', default=DEFAULT_INVENTORY_PATH,
+                        help=f'SQLite inventory store refreshed by this run for mdm_actions lookups (default: {DEFAULT_INVENTORY_PATH})')
+    parser.add_argument('--history', default=None,
+                        help='directory of the date-partitioned report history to append this run to; older dated reports are backfilled (needs pyarrow)')
+    parser.add_argument('--metrics', default=None,
+                        help='write request and stage metrics here at the end of the run: Prometheus text for .prom files, JSON otherwise')
+    return parser
+
+
+def prog_derive_in_stage(metrics, derive, df, stage):
+    # Derived columns are added inside ReportWriter.write(); their time is counted separately from the write
+    with metrics.stage(stage):
+        return derive(df, TODAY)
+
+
+def main(argv=None):
+    # Settings come from the command line, environment and config file ([mdm_report] for options);
+    # anything still missing is prompted for unless --non-interactive
+    parser = prog_build_parser()
+    try:
+        args, config = mdm_parse_args(parser, 'mdm_report', argv)
+        credentials = mdm_load_credentials(args, config)
+    except ConfigError as error:
+        parser.error(str(error))
 
+    # Shared keep-alive session sized so every fetch worker has its own pooled connection
+    jamf_session = JamfSession(credentials.url, credentials.username, credentials.password, pool_size=args.workers, rate=args.max_rate)
+    if args.cache or args.cache_bypass:
+        jamf_session.response_cache = ResponseCache(max_bytes=args.cache_max_mb * 1024 * 1024, bypass=args.cache_bypass)
 
-# --------------- PROGRAM START --------------- #
+    # Request latency, retries and bytes per endpoint, and the time spent in each stage of the run
+    metrics = RunMetrics()
+    jamf_session.metrics = metrics
+
+    # Indexed copy of this run's rows; mdm_actions answers serial and user lookups from it
+    inventory = InventoryStore(args.inventory)
+
+    # Get MDM token for Jamf Pro environment
+    with metrics.stage('auth'):
+        mdm_get_token(jamf_session)
 
-# Get MDM token for Jamf Pro environment
-token = mdm_get_token(jamf_url, username, password)
-
-# Generate Computer Report
-print("\nStarting Computer Report")
-
-# Get all computer data from MDM
-print("Getting all computer data...")
-computers = mdm_get_all_computer_data(jamf_url)
-number_of_computers = len(computers)
-print(f"Total number of computers found: {number_of_computers}")
-
-# Create empty dict that will become dataframe
-data = {
-    'Apple Silicon': [],
-    'Battery Capacity': [],
-    'Building': [],
-    'Department': [],
-    'Email': [],
-    'Filevault Status': [],
-    'Full Name': [],
-    'Gatekeeper Status': [],
-    'ID': [],
-    'IP Address': [],
-    'Last Check In': [],
-    'Last Enrollment': [],
-    'Last Inventory Update': [],
-    'Management Status': [],
-    'MDM Expiration': [],
-    'Model': [],
-    'Model ID': [],
-    'Name': [],
-    'OS Version': [],
-    'Position': [],
-    'Processor': [],
-    'Processor Architecture': [],
-    'Processor Cores': [],
-    'Ram MB': [],
-    'Room': [],
-    'Serial Number': [],
-    'SIP Status': [],
-    'Storage Available MB': [],
-    'Storage Total MB': [],
-    'UDID': [],
-    'Username': [],
-}
-
-# Loop through each device, get device ID, and get additional data. Then, append to dict.
-print("Looping through each computer to get additional data...")
-for item in tqdm(range(number_of_computers)):
-    # Get device id
-    device_id = computers[item]['id']
-    data['ID'].append(device_id)
-    # Use device id to get additional data
-    computer = mdm_get_computer_data_by_id(jamf_url, device_id)
-    try:
-        # Append data to dict
-        data['IP Address'].append(computer['general']['ip_address'])
-        data['Management Status'].append(computer['general']['management_status']['enrolled_via_dep'])
-        data['Name'].append(computer['general']['name'])
-        data['Serial Number'].append(computer['general']['serial_number'])
-        data['UDID'].append(computer['general']['udid'])
-        data['Last Inventory Update'].append(computer['general']['report_date'])
-        data['Last Check In'].append(computer['general']['last_contact_time'])
-        data['Last Enrollment'].append(computer['general']['last_enrolled_date_utc'])
-        data['MDM Expiration'].append(computer['general']['mdm_profile_expiration_utc'])
-        data['Username'].append(computer['location']['username'])
-        data['Full Name'].append(computer['location']['realname'])
-        data['Email'].append(computer['location']['email_address'])
-        data['Position'].append(computer['location']['position'])
-        data['Department'].append(computer['location']['department'])
-        data['Building'].append(computer['location']['building'])
-        data['Room'].append(computer['location']['room'])
-        data['Model'].append(computer['hardware']['model'])
-        data['Model ID'].append(computer['hardware']['model_identifier'])
-        data['OS Version'].append(computer['hardware']['os_version'])
-        data['Processor'].append(computer['hardware']['processor_type'])
-        data['Apple Silicon'].append(computer['hardware']['is_apple_silicon'])
-        data['Processor Architecture'].append(computer['hardware']['processor_architecture'])
-        data['Processor Cores'].append(computer['hardware']['number_cores'])
-        data['Ram MB'].append(computer['hardware']['total_ram_mb'])
-        data['Battery Capacity'].append(computer['hardware']['battery_capacity'])
-        data['SIP Status'].append(computer['hardware']['sip_status'])
-        data['Gatekeeper Status'].append(computer['hardware']['gatekeeper_status'])
-        data['Storage Total MB'].append(computer['hardware']['storage'][0]['drive_capacity_mb'])
-        data['Storage Available MB'].append(computer['hardware']['storage'][0]['partitions'][0]['available_mb'])
-        data['Filevault Status'].append(computer['hardware']['storage'][0]['partitions'][0]['filevault_status'])
-    except IndexError:
-        pass
-    except KeyError:
-        pass
-    # If an attribute was skipped due to IndexError or KeyError, add a blank entry, which will become nan value
-    correct_length = len(data['ID'])
-    for list in data:
-        target_list = data[list]
-        if len(target_list) != correct_length:
-            target_list.append('')
-
-# Generate additional columns of formatted data
-print("Generating additional columns of data...")
-# Days Since Last Check In
-# Start by creating empty list in data dict
-data['Days Since Last Check In'] = []
-# Loop through 'Last Check In'
-for item in data['Last Check In']:
-    if item == '':
-        data['Days Since Last Check In'].append('')
-    else:
-        # Pull date from item
-        just_date = item[:10]
-        just_date_list = just_date.split('-')
-        # Convert each item in list to int
-        for n, i in enumerate(just_date_list):
-            just_date_list[n] = int(i)
-        # Get total days from today minus last contact date
-        d0 = date(just_date_list[0], just_date_list[1], just_date_list[2])
-        d1 = date(today_list[0], today_list[1], today_list[2])
-        delta = d1 - d0
-        data['Days Since Last Check In'].append(delta.days)
-
-# Days Since Last Enrollment
-data['Days Since Last Enrollment'] = []
-for item in data['Last Enrollment']:
-    if item == '':
-        data['Days Since Last Enrollment'].append('')
-    else:
-        # Pull date from item
-        just_date = item[:10]
-        just_date_list = just_date.split('-')
-        # Convert each item in list to int
-        for n, i in enumerate(just_date_list):
-            just_date_list[n] = int(i)
-        # Get total days from today minus last contact date
-        d0 = date(just_date_list[0], just_date_list[1], just_date_list[2])
-        d1 = date(today_list[0], today_list[1], today_list[2])
-        delta = d1 - d0
-        data['Days Since Last Enrollment'].append(delta.days)
-
-# Days Since Last Inventory Update
-data['Days Since Last Inventory Update'] = []
-for item in data['Last Inventory Update']:
-    if item == '':
-        data['Days Since Last Inventory Update'].append('')
-    else:
-        # Pull date from item
-        just_date = item[:10]
-        just_date_list = just_date.split('-')
-        # Convert each item in list to int
-        for n, i in enumerate(just_date_list):
-            just_date_list[n] = int(i)
-        # Get total days from today minus last contact date
-        d0 = date(just_date_list[0], just_date_list[1], just_date_list[2])
-        d1 = date(today_list[0], today_list[1], today_list[2])
-        delta = d1 - d0
-        data['Days Since Last Inventory Update'].append(delta.days)
-
-# Computer Year
-# Start by creating empty list in data dict
-data['Year'] = []
-# Loop through 'Model'
-for item in data['Model']:
-    if item == '':
-        data['Year'].append('')
-    else:
-        # Split Model into list
-        list = item.split()
-        for char in list:
-            if char[0:2] == '20':
-                new_char = char[0:4]
-                # Append to year list
-                data['Year'].append(new_char)
-            elif char[1:3] == '20':
-                new_char = char[1:5]
-                data['Year'].append(new_char)
-
-# Ram GB
-data['Ram GB'] = []
-for item in data['Ram MB']:
-    if item == '':
-        data['Ram GB'].append('')
-    else:
-        mb = item
-        gb = prog_convert_mb_to_gb(mb)
-        data['Ram GB'].append(gb)
-
-# Storage Available GB
-data['Storage Available GB'] = []
-for item in data['Storage Available MB']:
-    if item == '':
-        data['Storage Available GB'].append('')
-    else:
-        mb = item
-        gb = prog_convert_mb_to_gb(mb)
-        data['Storage Available GB'].append(gb)
-
-# Storage Total GB
-data['Storage Total GB'] = []
-for item in data['Storage Total MB']:
-    if item == '':
-        data['Storage Total GB'].append('')
-    else:
-        mb = item
-        gb = prog_convert_mb_to_gb(mb)
-        data['Storage Total GB'].append(gb)
-
-# Save computer report to Box
-print("Saving MDM Computer Report to Box...")
-df = pd.DataFrame.from_dict(data)
-df = df.reindex(sorted(df.columns), axis=1)
-df = df.astype(object)
-df.to_csv("mdm_computer_report.csv", index=False)
-df.to_csv(f"{TODAY}_mdm_computer_report.csv", index=False)
-# Create copy of dataframe to potentially reference later in script
-current_computer_report_df = df.copy()
-
-# MOBILE DEVICE REPORT
-print("\nStarting Mobile Device Report")
-
-# Get all mobile device data
-print("Getting all mobile device data...")
-mobile_devices = mdm_get_all_mobile_device_general_data(jamf_url)
-
-# Get total number of devices
-number_of_mobile_devices = len(mobile_devices)
-print(f"Total number of mobile devices found: {number_of_mobile_devices}")
-
-# Create empty dict that will become dataframe
-data = {
-    'Available MB': [],
-    'Battery Level': [],
-    'Building': [],
-    'Capacity MB': [],
-    'Carrier': [],
-    'Department': [],
-    'Device Name': [],
-    'Email Address': [],
-    'Enrollment Method': [],
-    'ICCID': [],
-    'ID': [],
-    'IMEI': [],
-    'Last Enrollment UTC': [],
-    'Last Inventory Update': [],
-    'Model': [],
-    'Model Identifier': [],
-    'Model Number': [],
-    'Name': [],
-    'Passcode Status': [],
-    'Position': [],
-    'Phone Number': [],
-    'OS Build': [],
-    'OS Version': [],
-    'Percentage Used': [],
-    'Room': [],
-    'Serial Number': [],
-    'UDID': [],
-    'Username': [],
-}
-print("Looping through each mobile device to get additional data...")
-# Loop through each device, get device ID, and get additional data. Then, append to dict.
-for item in tqdm(range(number_of_mobile_devices)):
-    # Get device id
-    device_id = mobile_devices[item]['id']
-    data['ID'].append(device_id)
-    # Use device id to get additional data
-    device_data = mdm_get_mobile_device_data_by_id(jamf_url, device_id)
     try:
-        # Append data to data dict
-        data['Available MB'].append(device_data['general']['available_mb'])
-        data['Battery Level'].append(device_data['general']['battery_level'])
-        data['Building'].append(device_data['location']['building'])
-        data['Capacity MB'].append(device_data['general']['capacity_mb'])
-        data['Carrier'].append(device_data['network']['home_carrier_network'])
-        data['Department'].append(device_data['location']['department'])
-        data['Device Name'].append(device_data['general']['device_name'])
-        data['Email Address'].append(device_data['location']['email_address'])
-        data['Enrollment Method'].append(device_data['general']['enrollment_method'])
-        data['ICCID'].append(device_data['network']['iccid'])
-        data['IMEI'].append(device_data['network']['imei'])
-        data['Last Enrollment UTC'].append(device_data['general']['last_enrollment_utc'])
-        data['Last Inventory Update'].append(device_data['general']['last_inventory_update'])
-        data['Model'].append(device_data['general']['model'])
-        data['Model Identifier'].append(device_data['general']['model_identifier'])
-        data['Model Number'].append(device_data['general']['model_number'])
-        data['Name'].append(device_data['location']['realname'])
-        data['OS Build'].append(device_data['general']['os_build'])
-        data['OS Version'].append(device_data['general']['os_version'])
-        data['Passcode Status'].append(device_data['security']['passcode_present'])
-        data['Percentage Used'].append(device_data['general']['percentage_used'])
-        data['Phone Number'].append(device_data['general']['phone_number'])
-        data['Position'].append(device_data['location']['position'])
-        data['Room'].append(device_data['location']['room'])
-        data['Serial Number'].append(device_data['general']['serial_number'])
-        data['UDID'].append(device_data['general']['udid'])
-        data['Username'].append(device_data['location']['username'])
-    except IndexError:
-        pass
-    except KeyError:
-        pass
-    # If an attribute was skipped due to IndexError or KeyError, add a blank entry
-    correct_length = len(data['ID'])
-    for list in data:
-        target_list = data[list]
-        if len(target_list) != correct_length:
-            target_list.append('')
-
-# Perform clean up of data
-print("Performing cleanup of data...")
-
-# Format ICCIDs
-formatted_iccid_list = []
-for item in data['ICCID']:
-    if item == '':
-        formatted_iccid_list.append('')
-    else:
-        formatted_iccid = item.replace(' ','')
-        formatted_iccid_list.append(formatted_iccid)
-data['ICCID'] = formatted_iccid_list
-
-# Format IMEI
-formatted_imei_list = []
-for item in data['IMEI']:
-    if item == '':
-        formatted_imei_list.append('')
-    else:
-        formatted_imei = item.replace(' ', '')
-        formatted_imei_list.append(formatted_imei)
-data['IMEI'] = formatted_imei_list
-
-# Format Phone Number
-formatted_phone_number_list = []
-for item in data['Phone Number']:
-    # If entry is empty, skip.
-    if item == '' or item == '00000000000':
-        formatted_phone_number_list.append('')
-    else:
-        # Remove '+' if it exists
-        if item[0] == '+':
-            formatted_phone_number = item[2:]
-        # Remove '1' from phone number
-        if item[0] == '1':
-            formatted_phone_number = item[1:]
-        formatted_phone_number_list.append(formatted_phone_number)
-data['Phone Number'] = formatted_phone_number_list
-
-# Generate additional columns of formatted data
-print("Generating additional columns of data...")
-
-# Available GB
-data['Available GB'] = []
-for item in data['Available MB']:
-    if item == '':
-        data['Available GB'].append('')
-    else:
-        mb = item
-        gb = prog_convert_mb_to_gb(mb)
-        data['Available GB'].append(gb)
-
-# Capacity GB
-data['Capacity GB'] = []
-for item in data['Capacity MB']:
-    if item == '':
-        data['Capacity GB'].append('')
-    else:
-        mb = item
-        gb = prog_convert_mb_to_gb(mb)
-        data['Capacity GB'].append(gb)
-
-# Days Since Last Inventory Update
-# Start by creating empty list in data dict
-data['Days Since Last Inventory Update'] = []
-# Loop through 'Last Check In'
-for item in data['Last Inventory Update']:
-    if item == '':
-        data['Days Since Last Inventory Update'].append('')
-    else:
-        last_inventory_update = item
-        # Get just the date from last inventory update
-        date_list = str.split(last_inventory_update)
-        # Filter down date list to what we need
-        just_date_list = []
-        just_date_list.append(date_list[1])
-        just_date_list.append(date_list[2])
-        just_date_list.append(date_list[3])
-        # Convert month string to number string
-        for n, i in enumerate(just_date_list):
-            if i == 'January':
-                just_date_list[n] = '1'
-            elif i == 'February':
-                just_date_list[n] = '2'
-            elif i == 'March':
-                just_date_list[n] = '3'
-            elif i == 'April':
-                just_date_list[n] = '4'
-            elif i == 'May':
-                just_date_list[n] = '5'
-            elif i == 'June':
-                just_date_list[n] = '6'
-            elif i == 'July':
-                just_date_list[n] = '7'
-            elif i == 'August':
-                just_date_list[n] = '8'
-            elif i == 'September':
-                just_date_list[n] = '9'
-            elif i == 'October':
-                just_date_list[n] = '10'
-            elif i == 'November':
-                just_date_list[n] = '11'
-            elif i == 'December':
-                just_date_list[n] = '12'
-        # Convert date list to integer
-        for n, i in enumerate(just_date_list):
-            just_date_list[n] = int(i)
-        # Reorder list
-        date_order = [2, 0, 1]
-        just_date_list = [just_date_list[i] for i in date_order]
-        # Get total days from today minus last check in date
-        d0 = date(just_date_list[0], just_date_list[1], just_date_list[2])
-        d1 = date(today_list[0], today_list[1], today_list[2])
-        delta = d1 - d0
-        days = delta.days
-        days_int = int(days)
-        data['Days Since Last Inventory Update'].append(days_int)
-
-# Save Mobile Device Report to Box
-print("Saving MDM Mobile Device Report to Box...")
-df = pd.DataFrame.from_dict(data)
-df = df.reindex(sorted(df.columns), axis=1)
-df = df.astype(object)
-df.to_csv("mdm_mobile_device_report.csv", index=False)
-df.to_csv(f"{TODAY}_mdm_mobile_device_report.csv", index=False)
-# Create copy of dataframe for potential future reference
-current_mobile_device_report_df = df.copy()
\ No newline at end of file
+        mdm_run_computer_report(jamf_session, args, inventory, metrics)
+        mdm_run_mobile_device_report(jamf_session, args, inventory, metrics)
+    finally:
+        inventory.close()
+        jamf_session.close()
+
+    # Where the run's time went, per stage and per Jamf API endpoint
+    if args.metrics:
+        metrics.write(args.metrics)
+        print(f"Run metrics saved to {args.metrics}")
+
+
+# --------------- PROGRAM START --------------- #
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,39 @@
 # -- MODULES -- #
 
+# Arguments
+import argparse
+
+# Functions
+import functools
+
 # Date
 import datetime
 from datetime import date
 
-# Getpass
-from getpass import getpass
-
-# Packaging
-import packaging
-from packaging import version
-
-# Pandas
-import pandas as pd
-
-# Requests
-import requests
-from requests.auth import HTTPBasicAuth
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
 #TQDM
 from tqdm import tqdm
 
+# Shared MDM Modules
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mdm_common.audit import MOBILE_DEVICE_AUDITS, mdm_run_audits
+from mdm_common.computer_inventory import mdm_iter_computers_in_bulk
+from mdm_common.config import ConfigError, mdm_add_config_arguments, mdm_load_credentials, mdm_parse_args
+from mdm_common.fetch import DEFAULT_WORKERS, mdm_fetch_concurrently
+from mdm_common.jamf_session import JamfSession
+from mdm_common.metrics import RunMetrics, prog_timed_iter
+from mdm_common.pagination import DEFAULT_PAGE_SIZE, JamfPager
+from mdm_common.report_output import (
+    COMPUTER_REPORT_SCHEMA,
+    DEFAULT_CHUNK_SIZE,
+    MOBILE_DEVICE_REPORT_SCHEMA,
+    OUTPUT_FORMATS,
+    ReportWriter,
+)
+from mdm_common.report_fields import COMPUTER_REPORT_FIELDS, MOBILE_DEVICE_REPORT_FIELDS, FieldExtractor
+from mdm_common.response_cache import DEFAULT_CACHE_MAX_MB, ResponseCache
+
 
 # -- VARIABLES -- #
 
@@ -31,388 +42,245 @@ NOW = datetime.datetime.now()
 CURRENT_YEAR = NOW.year
 TODAY = date.today()
 
-# Jamf Environment
-JAMF_URL = '<insert_your_jamf_pro_url>'
-USERNAME = input("Enter your Jamf Pro Username: ")
-PASSWORD = getpass()
+# Report columns and where each one is read from in the Classic API device record.
+# The app's computer report adds 'Enrollment DEP' and its mobile report names the enrollment date 'Last Enrollment'.
+COMPUTER_FIELDS = FieldExtractor(
+    COMPUTER_REPORT_FIELDS + [('Enrollment DEP', ('general', 'management_status', 'enrolled_via_dep'))]
+)
+MOBILE_DEVICE_FIELDS = FieldExtractor([
+    ('Last Enrollment' if column == 'Last Enrollment UTC' else column, path)
+    for column, path in MOBILE_DEVICE_REPORT_FIELDS
+])
+
+
+# -- ARGUMENTS -- #
+
+def prog_build_parser():
+    parser = argparse.ArgumentParser(description='Generate Jamf device reports and audits.')
+    mdm_add_config_arguments(parser)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of concurrent device detail requests (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f'page size for Jamf Pro API listings (default: {DEFAULT_PAGE_SIZE})')
+    parser.add_argument('--bulk', action='store_true',
+                        help='collect computers from paged /api/v1/computers-inventory instead of per-device Classic API calls')
+    parser.add_argument('--format', nargs='+', choices=OUTPUT_FORMATS, default=['csv'],
+                        help='report file formats; parquet and feather keep column types and need pyarrow (default: csv)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'rows held in memory before they are written to the report files (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--max-rate', type=float, default=None,
+                        help='cap on Jamf API requests per second (default: no cap, concurrency still adapts to throttling)')
+    parser.add_argument('--cache', action='store_true',
+                        help='cache Jamf GET responses on disk so re-runs read from disk instead of the API')
+    parser.add_argument('--cache-bypass', action='store_true',
+                        help='ignore cached responses for this run but refresh the cache (implies --cache)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help=f'size limit of the response cache before least recently used entries are evicted (default: {DEFAULT_CACHE_MAX_MB})')
+    parser.add_argument('--metrics', default=None,
+                        help='write request and stage metrics here at the end of the run: Prometheus text for .prom files, JSON otherwise')
+    return parser
 
 
 # -- GENERAL REQUEST FUNCTIONS -- #
 
-def mdm_get_request_jamf_classic_json(endpoint):
-    headers = {'accept': 'application/json'}
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.get(
-                url=endpoint,
-                auth=HTTPBasicAuth(USERNAME, PASSWORD),
-                headers=headers,
-                verify=False,
-            )
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                successful = True
-        else:
-            result = response.json()
-            return result
-
-
-def mdm_get_request_jamf_classic_xml(endpoint):
-    headers = {'accept': 'application/xml'}
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.get(
-                url=endpoint,
-                auth=HTTPBasicAuth(USERNAME, PASSWORD),
-                headers=headers,
-                verify=False,
-            )
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                successful = True
-        else:
-            result = response.text
-            return result
-
-
-def mdm_get_request_jamf_pro(endpoint):
-    headers = {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}',
-    }
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.get(
-                url=endpoint,
-                headers=headers,
-                verify=False,
-            )
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                print("Could not complete after 10 attempts.")
-                successful = True
-        else:
-            result = response.json()
-            return result
-
-
-def mdm_get_token():
-    successful = False
-    attempts = 0
-    while successful == False:
-        try:
-            response = requests.post(
-                url=f"{JAMF_URL}/api/v1/auth/token",
-                headers={"accept": "application/json"},
-                auth=HTTPBasicAuth(USERNAME, PASSWORD),
-                verify=False,
-            )
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            attempts += 1
-            if attempts >= 10:
-                print("Could not complete after 10 attempts.")
-                successful = True
-        else:
-            data = response.json()
-            token = data['token']
-            return token
+def mdm_get_request_jamf_classic_json(jamf_session, endpoint):
+    response = jamf_session.get(endpoint)
+    response.raise_for_status()
+    result = response.json()
+    return result
 
 
-# -- MOBILE DEVICE FUNCTIONS -- #
+def mdm_get_request_jamf_classic_xml(jamf_session, endpoint):
+    response = jamf_session.get(endpoint, accept='application/xml')
+    response.raise_for_status()
+    result = response.text
+    return result
+
+
+def mdm_get_request_jamf_pro(jamf_session, endpoint):
+    response = jamf_session.get(endpoint, bearer=True)
+    response.raise_for_status()
+    result = response.json()
+    return result
+
+
+def mdm_get_token(jamf_session):
+    # Cached on disk and refreshed through keep-alive before it expires
+    token = jamf_session.token_manager.get_token()
+    return token
 
 
-def mdm_get_all_mobile_device_general_data():
-    endpoint = f"{JAMF_URL}/JSSResource/mobiledevices"
-    results = mdm_get_request_jamf_classic_json(endpoint)
+# -- MOBILE DEVICE FUNCTIONS -- #
+
+def mdm_get_all_mobile_device_general_data(jamf_session):
+    endpoint = f"{jamf_session.jamf_url}/JSSResource/mobiledevices"
+    results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
     mobile_devices = results['mobile_devices']
     return mobile_devices
 
 
-def mdm_get_mobile_device_data_by_id(device_id):
-    endpoint = f"{JAMF_URL}/JSSResource/mobiledevices/id/{device_id}"
-    results = mdm_get_request_jamf_classic_json(endpoint)
+def mdm_get_mobile_device_data_by_id(jamf_session, device_id):
+    endpoint = f"{jamf_session.jamf_url}/JSSResource/mobiledevices/id/{device_id}"
+    results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
     mobile_device_data = results['mobile_device']
     return mobile_device_data
 
 
 # -- COMPUTER FUNCTIONS -- #
 
-
-def mdm_get_all_computer_general_data():
-    endpoint = f"{JAMF_URL}/api/preview/computers?page-size=1000"
-    results = mdm_get_request_jamf_pro(endpoint)
-    computers = results['results']
+def mdm_get_all_computer_general_data(jamf_session, page_size):
+    # Pages are streamed lazily; total_count is read from the first page
+    endpoint = f"{jamf_session.jamf_url}/api/preview/computers"
+    computers = JamfPager(functools.partial(mdm_get_request_jamf_pro, jamf_session), endpoint, page_size=page_size)
     return computers
 
 
-def mdm_get_computer_data_by_id(device_id):
-    endpoint = f"{JAMF_URL}/JSSResource/computers/id/{device_id}"
-    results = mdm_get_request_jamf_classic_json(endpoint)
+def mdm_get_computer_data_by_id(jamf_session, device_id):
+    endpoint = f"{jamf_session.jamf_url}/JSSResource/computers/id/{device_id}"
+    results = mdm_get_request_jamf_classic_json(jamf_session, endpoint)
     computer = results['computer']
     return computer
 
 
+# -- REPORT FUNCTIONS -- #
+
+def mdm_run_computer_report(jamf_session, args, metrics):
+    print("\nStarting Computer Report")
+
+    # Get all computer data from MDM
+    print("Getting all computer data...")
+    with metrics.stage('computer.list'):
+        if args.bulk:
+            # Read the report's inventory sections in pages instead of one request per device
+            number_of_computers, computer_details = mdm_iter_computers_in_bulk(
+                functools.partial(mdm_get_request_jamf_pro, jamf_session), jamf_session.jamf_url, args.page_size,
+            )
+        else:
+            computers = mdm_get_all_computer_general_data(jamf_session, args.page_size)
+            number_of_computers = computers.total_count
+            computer_ids = (computer['id'] for computer in computers)
+            computer_details = mdm_fetch_concurrently(
+                functools.partial(mdm_get_computer_data_by_id, jamf_session), computer_ids, workers=args.workers, metrics=metrics,
+            )
+    print(f"Total number of computers found: {number_of_computers}")
+
+    # Rows are written to the report files every --chunk-size computers
+    computer_writer = ReportWriter('mdm_computer_report', TODAY, args.format, COMPUTER_REPORT_SCHEMA, COMPUTER_FIELDS.columns, latest=False)
+
+    # Loop through each device and flatten its details into one report row
+    print("Looping through each computer to get additional data...")
+    rows = []
+    for device_id, computer in tqdm(prog_timed_iter(computer_details, metrics, 'computer.fetch'), total=number_of_computers):
+        with metrics.stage('computer.flatten'):
+            # Fields missing from the details, or details that could not be fetched, are left blank
+            rows.append(COMPUTER_FIELDS.extract(device_id, computer))
+        # Write the chunk and start the rows over
+        if len(rows) >= args.chunk_size:
+            with metrics.stage('computer.write'):
+                computer_writer.write(rows)
+            rows = []
+
+    print("Saving MDM Computer Report...")
+    with metrics.stage('computer.write'):
+        computer_writer.write(rows)
+        computer_writer.close()
+    return computer_writer
+
+
+def mdm_run_mobile_device_report(jamf_session, args, metrics):
+    print("\nStarting Mobile Device Report")
+
+    # Get all mobile device data
+    print("Getting all mobile device data...")
+    with metrics.stage('mobile_device.list'):
+        mobile_devices = mdm_get_all_mobile_device_general_data(jamf_session)
+
+    # Get total number of devices
+    number_of_mobile_devices = len(mobile_devices)
+    print(f"Total number of mobile devices found: {number_of_mobile_devices}")
+
+    mobile_device_ids = (mobile_device['id'] for mobile_device in mobile_devices)
+    mobile_device_details = mdm_fetch_concurrently(
+        functools.partial(mdm_get_mobile_device_data_by_id, jamf_session),
+        mobile_device_ids,
+        workers=args.workers,
+        metrics=metrics,
+    )
+    # Rows are written to the report files every --chunk-size mobile devices
+    mobile_device_writer = ReportWriter(
+        'mdm_mobile_device_report', TODAY, args.format, MOBILE_DEVICE_REPORT_SCHEMA, MOBILE_DEVICE_FIELDS.columns, latest=False,
+    )
+
+    # Loop through each device and flatten its details into one report row
+    print("Looping through each mobile device to get additional data...")
+    rows = []
+    for device_id, device_data in tqdm(prog_timed_iter(mobile_device_details, metrics, 'mobile_device.fetch'), total=number_of_mobile_devices):
+        with metrics.stage('mobile_device.flatten'):
+            # Fields missing from the details, or details that could not be fetched, are left blank
+            rows.append(MOBILE_DEVICE_FIELDS.extract(device_id, device_data))
+        # Write the chunk and start the rows over
+        if len(rows) >= args.chunk_size:
+            with metrics.stage('mobile_device.write'):
+                mobile_device_writer.write(rows)
+            rows = []
+
+    print("Saving MDM Mobile Device Report...")
+    with metrics.stage('mobile_device.write'):
+        mobile_device_writer.write(rows)
+        mobile_device_writer.close()
+    return mobile_device_writer
+
+
+def mdm_print_audits(mobile_device_writer):
+    # Only the columns the audits use are read back from the written report
+    audit_columns = sorted({column for rule in MOBILE_DEVICE_AUDITS for column in rule.columns})
+    current_mobile_device_report_df = mobile_device_writer.read(columns=audit_columns)
+    for rule, df in mdm_run_audits(current_mobile_device_report_df, MOBILE_DEVICE_AUDITS):
+        print(f"\n{rule.title}:")
+        print(df.to_string(index=False))
+
+
 # -- PROGRAM START -- #
 
-token = mdm_get_token()
-
-
-# COMPUTER REPORT
-
-print("\nStarting Computer Report")
-
-# Get all computer data from MDM
-print("Getting all computer data...")
-computers = mdm_get_all_computer_general_data()
-number_of_computers = len(computers)
-print(f"Total number of computers found: {number_of_computers}")
-
-# Create empty dict
-data = {
-    'Apple Silicon': [],
-    'Battery Capacity': [],
-    'Building': [],
-    'Department': [],
-    'Email': [],
-    'Enrollment DEP': [],
-    'Filevault Status': [],
-    'Full Name': [],
-    'Gatekeeper Status': [],
-    'ID': [],
-    'IP Address': [],
-    'Last Check In': [],
-    'Last Enrollment': [],
-    'Last Inventory Update': [],
-    'Management Status': [],
-    'MDM Expiration': [],
-    'Model': [],
-    'Model ID': [],
-    'Name': [],
-    'OS Version': [],
-    'Position': [],
-    'Processor': [],
-    'Processor Architecture': [],
-    'Processor Cores': [],
-    'Ram MB': [],
-    'Room': [],
-    'Serial Number': [],
-    'SIP Status': [],
-    'Storage Available MB': [],
-    'Storage Total MB': [],
-    'UDID': [],
-    'Username': [],
-}
-
-# Loop through each device, get device ID, and get additional data. Then, append to dict.
-print("Looping through each computer to get additional data...")
-for item in tqdm(range(number_of_computers)):
-    # Get device id
-    device_id = computers[item]['id']
-    data['ID'].append(device_id)
-    # Use device id to get additional data
-    computer = mdm_get_computer_data_by_id(device_id)
+def main(argv=None):
+    # Jamf URL and credentials come from the command line, environment or config file
+    # ([mdm_report_app] for options); anything still missing is prompted for unless --non-interactive
+    parser = prog_build_parser()
     try:
-        # Append data to dict
-        data['Enrollment DEP'].append(computer['general']['management_status']['enrolled_via_dep'])
-        data['IP Address'].append(computer['general']['ip_address'])
-        data['Management Status'].append(computer['general']['management_status']['enrolled_via_dep'])
-        data['Name'].append(computer['general']['name'])
-        data['Serial Number'].append(computer['general']['serial_number'])
-        data['UDID'].append(computer['general']['udid'])
-        data['Last Inventory Update'].append(computer['general']['report_date'])
-        data['Last Check In'].append(computer['general']['last_contact_time'])
-        data['Last Enrollment'].append(computer['general']['last_enrolled_date_utc'])
-        data['MDM Expiration'].append(computer['general']['mdm_profile_expiration_utc'])
-        data['Username'].append(computer['location']['username'])
-        data['Full Name'].append(computer['location']['realname'])
-        data['Email'].append(computer['location']['email_address'])
-        data['Position'].append(computer['location']['position'])
-        data['Department'].append(computer['location']['department'])
-        data['Building'].append(computer['location']['building'])
-        data['Room'].append(computer['location']['room'])
-        data['Model'].append(computer['hardware']['model'])
-        data['Model ID'].append(computer['hardware']['model_identifier'])
-        data['OS Version'].append(computer['hardware']['os_version'])
-        data['Processor'].append(computer['hardware']['processor_type'])
-        data['Apple Silicon'].append(computer['hardware']['is_apple_silicon'])
-        data['Processor Architecture'].append(computer['hardware']['processor_architecture'])
-        data['Processor Cores'].append(computer['hardware']['number_cores'])
-        data['Ram MB'].append(computer['hardware']['total_ram_mb'])
-        data['Battery Capacity'].append(computer['hardware']['battery_capacity'])
-        data['SIP Status'].append(computer['hardware']['sip_status'])
-        data['Gatekeeper Status'].append(computer['hardware']['gatekeeper_status'])
-        data['Storage Total MB'].append(computer['hardware']['storage'][0]['drive_capacity_mb'])
-        data['Storage Available MB'].append(computer['hardware']['storage'][0]['partitions'][0]['available_mb'])
-        data['Filevault Status'].append(computer['hardware']['storage'][0]['partitions'][0]['filevault_status'])
-    except IndexError:
-        pass
-    except KeyError:
-        pass
-    # If an attribute was skipped due to IndexError or KeyError, add a blank entry
-    correct_length = len(data['ID'])
-    for list in data:
-        target_list = data[list]
-        if len(target_list) != correct_length:
-            target_list.append('')
-
-print("Saving MDM Computer Report...")
-df = pd.DataFrame.from_dict(data)
-df = df.reindex(sorted(df.columns), axis=1)
-df = df.astype(object)
-df.to_csv(f"{TODAY}_mdm_computer_report.csv", index=False)
-
-# Save dataframe to variable for audit reports later
-current_computer_report_df = df.copy()
-
-
-# MOBILE DEVICE REPORT
-
-print("\nStarting Mobile Device Report")
-
-# Get all mobile device data
-print("Getting all mobile device data...")
-mobile_devices = mdm_get_all_mobile_device_general_data()
-
-# Get total number of devices
-number_of_mobile_devices = len(mobile_devices)
-print(f"Total number of mobile devices found: {number_of_mobile_devices}")
-
-# Create empty dict
-data = {
-    'Available MB': [],
-    'Battery Level': [],
-    'Building': [],
-    'Capacity MB': [],
-    'Carrier': [],
-    'Department': [],
-    'Device Name': [],
-    'Email Address': [],
-    'Enrollment Method': [],
-    'ICCID': [],
-    'ID': [],
-    'IMEI': [],
-    'Last Enrollment': [],
-    'Last Inventory Update': [],
-    'Model': [],
-    'Model Identifier': [],
-    'Model Number': [],
-    'Name': [],
-    'Passcode Status': [],
-    'Position': [],
-    'Phone Number': [],
-    'OS Build': [],
-    'OS Version': [],
-    'Percentage Used': [],
-    'Room': [],
-    'Serial Number': [],
-    'UDID': [],
-    'Username': [],
-}
-
-print("Looping through each mobile device to get additional data...")
-# Loop through each device, get device ID, and get additional data. Then, append to dict.
-for item in tqdm(range(number_of_mobile_devices)):
-    # Get device id
-    device_id = mobile_devices[item]['id']
-    data['ID'].append(device_id)
-    # Use device id to get additional data
-    device_data = mdm_get_mobile_device_data_by_id(device_id)
+        args, config = mdm_parse_args(parser, 'mdm_report_app', argv)
+        credentials = mdm_load_credentials(args, config, prompts={'username': 'Enter your Jamf Pro Username', 'password': 'Password'})
+    except ConfigError as error:
+        parser.error(str(error))
+
+    # Shared keep-alive session sized so every fetch worker has its own pooled connection
+    jamf_session = JamfSession(credentials.url, credentials.username, credentials.password, pool_size=args.workers, rate=args.max_rate)
+    if args.cache or args.cache_bypass:
+        jamf_session.response_cache = ResponseCache(max_bytes=args.cache_max_mb * 1024 * 1024, bypass=args.cache_bypass)
+
+    # Request latency, retries and bytes per endpoint, and the time spent in each stage of the run
+    metrics = RunMetrics()
+    jamf_session.metrics = metrics
+
     try:
-        # Append data to data dict
-        data['Available MB'].append(device_data['general']['available_mb'])
-        data['Battery Level'].append(device_data['general']['battery_level'])
-        data['Building'].append(device_data['location']['building'])
-        data['Capacity MB'].append(device_data['general']['capacity_mb'])
-        data['Carrier'].append(device_data['network']['home_carrier_network'])
-        data['Department'].append(device_data['location']['department'])
-        data['Device Name'].append(device_data['general']['device_name'])
-        data['Email Address'].append(device_data['location']['email_address'])
-        data['Enrollment Method'].append(device_data['general']['enrollment_method'])
-        data['ICCID'].append(device_data['network']['iccid'])
-        data['IMEI'].append(device_data['network']['imei'])
-        data['Last Enrollment'].append(device_data['general']['last_enrollment_utc'])
-        data['Last Inventory Update'].append(device_data['general']['last_inventory_update'])
-        data['Model'].append(device_data['general']['model'])
-        data['Model Identifier'].append(device_data['general']['model_identifier'])
-        data['Model Number'].append(device_data['general']['model_number'])
-        data['Name'].append(device_data['location']['realname'])
-        data['OS Build'].append(device_data['general']['os_build'])
-        data['OS Version'].append(device_data['general']['os_version'])
-        data['Passcode Status'].append(device_data['security']['passcode_present'])
-        data['Percentage Used'].append(device_data['general']['percentage_used'])
-        data['Phone Number'].append(device_data['general']['phone_number'])
-        data['Position'].append(device_data['location']['position'])
-        data['Room'].append(device_data['location']['room'])
-        data['Serial Number'].append(device_data['general']['serial_number'])
-        data['UDID'].append(device_data['general']['udid'])
-        data['Username'].append(device_data['location']['username'])
-    except IndexError:
-        pass
-    except KeyError:
-        pass
-    # If an attribute was skipped due to IndexError or KeyError, add a blank entry
-    correct_length = len(data['ID'])
-    for list in data:
-        target_list = data[list]
-        if len(target_list) != correct_length:
-            target_list.append('')
-
-print("Saving MDM Mobile Device Report...")
-df = pd.DataFrame.from_dict(data)
-df = df.reindex(sorted(df.columns), axis=1)
-df = df.astype(object)
-df.to_csv(f"{TODAY}_mdm_mobile_device_report.csv", index=False)
-
-# Save dataframe to variable for audit reports later
-current_mobile_device_report_df = df.copy()
-
-
-# -- AUDIT REPORTS -- #
-
-# Mobile Devices with 80% or Higher Storage Being Used
-print("\nMobile Devices with Full Storage:")
-df = current_mobile_device_report_df.copy()
-for idx, row in df.iterrows():
-    percentage_used = row['Percentage Used']
-    if percentage_used < 80:
-        df.drop(idx, inplace=True)
-df = df[['Device Name', 'Username', 'Serial Number', 'Percentage Used']]
-print(df.to_string(index=False))
-
-# Mobile Devices with 20% or Lower Battery Levels
-print("\nMobile Devices with Low Battery:")
-df = current_mobile_device_report_df.copy()
-for idx, row in df.iterrows():
-    battery_level = row['Battery Level']
-    if battery_level > 20:
-        df.drop(idx, inplace=True)
-df = df[['Device Name', 'Username', 'Serial Number', 'Battery Level']]
-print(df.to_string(index=False))
-
-# Mobile Devices with out of date Software Version
-print("\nMobile Devices with out of date software:")
-min_os = '15.0'
-df = current_mobile_device_report_df.copy()
-for idx, row in df.iterrows():
-    current_os_version = row['OS Version']
-    if version.parse(current_os_version) >= version.parse(min_os):
-        df.drop(idx, inplace=True)
-df = df[['Device Name', 'Username', 'OS Version', 'Serial Number']]
-print(df.to_string(index=False))
-
-
-# -- PROGRAM END -- #
\ No newline at end of file
+        with metrics.stage('auth'):
+            mdm_get_token(jamf_session)
+        mdm_run_computer_report(jamf_session, args, metrics)
+        mobile_device_writer = mdm_run_mobile_device_report(jamf_session, args, metrics)
+    finally:
+        jamf_session.close()
+
+    # -- AUDIT REPORTS -- #
+    with metrics.stage('mobile_device.audit'):
+        mdm_print_audits(mobile_device_writer)
+
+    # Where the run's time went, per stage and per Jamf API endpoint
+    if args.metrics:
+        metrics.write(args.metrics)
+        print(f"Run metrics saved to {args.metrics}")
+
+
+if __name__ == '__main__':
+    main()
+
+
+# -- PROGRAM END -- #
@@ -0,0 +1,760 @@
+#!/usr/bin/env python3
+
+# --------------- ENVIRONMENT SETUP --------------- #
+
+# Arguments
+import argparse
+
+# Date
+import datetime
+import time
+
+# JSON
+import json
+
+# Matching
+import fnmatch
+
+# Random
+import random
+import uuid
+
+# Server
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# Threading
+import threading
+
+# XML
+import xml.etree.ElementTree as ElementTree
+
+
+# --------------- GLOBAL VARIABLES --------------- #
+
+DEFAULT_PORT = 8765
+DEFAULT_TOKEN_LIFETIME = 20 * 60
+
+COMPUTER_MODELS = [
+    ('MacBook Pro (14-inch, 2023)', 'Mac14,9', 'Apple M2 Pro', True),
+    ('MacBook Air (M1, 2020)', 'MacBookAir10,1', 'Apple M1', True),
+    ('MacBook Pro (13-inch, 2020)', 'MacBookPro16,2', 'Quad-Core Intel Core i5', False),
+    ('iMac (Retina 5K, 27-inch, 2019)', 'iMac19,1', 'Six-Core Intel Core i5', False),
+    ('Mac mini (2018)', 'Macmini8,1', 'Quad-Core Intel Core i3', False),
+]
+MOBILE_DEVICE_MODELS = [
+    ('iPad (9th generation)', 'iPad12,1', 'MK2K3LL'),
+    ('iPad Air (5th generation)', 'iPad13,16', 'MM9C3LL'),
+    ('iPhone 14', 'iPhone14,7', 'MPUF3LL'),
+    ('iPhone 13', 'iPhone14,5', 'MLPF3LL'),
+]
+MACOS_VERSIONS = ['12.7.1', '13.6.3', '14.1.2', '14.2.1']
+IOS_VERSIONS = [('15.8', '19H370'), ('16.7.4', '20H240'), ('17.2.1', '21C66')]
+DEPARTMENTS = ['Engineering', 'Finance', 'Operations', 'Sales', 'Support']
+BUILDINGS = ['North', 'South', 'East']
+POSITIONS = ['Analyst', 'Engineer', 'Manager', 'Associate']
+GATEKEEPER_STATUSES = [('APP_STORE_AND_IDENTIFIED_DEVELOPERS', 'App Store and identified developers'), ('APP_STORE', 'App Store')]
+FILEVAULT_STATES = [('ENCRYPTED', 'Encrypted'), ('NOT_ENCRYPTED', 'Not encrypted')]
+# URL segment -> device kind for PreStage scopes and Classic static groups
+PRESTAGE_KINDS = {'computer-prestages': 'computer', 'mobile-device-prestages': 'mobile_device'}
+GROUP_KINDS = {'computergroups': 'computer', 'mobiledevicegroups': 'mobile_device'}
+# Every generated timestamp is counted back from this moment
+FLEET_EPOCH = datetime.datetime(2024, 6, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+# --------------- FUNCTIONS --------------- #
+
+# Program Functions
+def prog_iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def prog_classic_utc(moment):
+    # Classic API *_utc fields, e.g. 2024-01-08T15:35:00.000+0000
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}+0000"
+
+
+def prog_classic_time(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def prog_classic_mobile_time(moment):
+    # e.g. Monday, January 08 2024 at 3:35 PM
+    hour = moment.hour % 12 or 12
+    return moment.strftime('%A, %B %d %Y at ') + f"{hour}:{moment.minute:02d} " + moment.strftime('%p')
+
+
+def prog_page(items, query, default_page_size=100):
+    # Jamf Pro API paging: page, page-size and a totalCount over the whole listing
+    page = int(query.get('page', ['0'])[0])
+    page_size = int(query.get('page-size', [str(default_page_size)])[0])
+    return {'totalCount': len(items), 'results': items[page * page_size:(page + 1) * page_size]}
+
+
+class MockFleet:
+    # Synthetic computers and mobile devices, IDs 1..N, generated deterministically from the seed.
+    # The same device always has the same attributes; touch() moves its inventory date forward
+    # so incremental runs see it as changed.
+    def __init__(self, computers, mobile_devices, users=None, seed=0, groups=10, prestages=5):
+        self.computers = computers
+        self.mobile_devices = mobile_devices
+        self.users = users or max(1, (computers + mobile_devices) // 2)
+        self.seed = seed
+        # Named static groups and PreStages, IDs 1..N per device kind; tests may rename them
+        self.group_names = {kind: {group_id: f"Static Group {group_id}" for group_id in range(1, groups + 1)}
+                            for kind in ('computer', 'mobile_device')}
+        self.prestage_names = {kind: {prestage_id: f"PreStage {prestage_id}" for prestage_id in range(1, prestages + 1)}
+                               for kind in ('computer', 'mobile_device')}
+        self._touched = {}
+        # PreStage scopes by (kind, prestage_id) and static group members by (kind, group_id)
+        self._prestages = {}
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def touch(self, kind, device_id):
+        with self._lock:
+            self._touched[(kind, device_id)] = self._touched.get((kind, device_id), 0) + 1
+
+    def device_id(self, kind, serial_number):
+        # Inverse of the generated serial numbers; None for serials not in the fleet
+        prefix, count = ('C02', self.computers) if kind == 'computer' else ('DM', self.mobile_devices)
+        serial_number = serial_number.upper()
+        if not serial_number.startswith(prefix) or not serial_number[len(prefix):].isdigit():
+            return None
+        device_id = int(serial_number[len(prefix):])
+        return device_id if 1 <= device_id <= count else None
+
+    def prestage_scope(self, kind, prestage_id):
+        with self._lock:
+            scope = self._prestages.setdefault((kind, prestage_id), {'serials': [], 'versionLock': 0})
+            return {
+                'prestageId': str(prestage_id),
+                'assignments': [{'serialNumber': serial, 'userAssigned': 'api'} for serial in scope['serials']],
+                'versionLock': scope['versionLock'],
+            }
+
+    def add_to_prestage(self, kind, prestage_id, serial_numbers, version_lock):
+        # Like Jamf: a stale versionLock is a 409, and any unknown serial or one already
+        # scoped to another PreStage fails the whole request with a 400
+        with self._lock:
+            scope = self._prestages.setdefault((kind, prestage_id), {'serials': [], 'versionLock': 0})
+            if version_lock != scope['versionLock']:
+                return 409, [{'code': 'OPTIMISTIC_LOCK_FAILED', 'description': 'Optimistic lock failed'}]
+            errors = []
+            for serial in serial_numbers:
+                if self.device_id(kind, serial) is None:
+                    errors.append({'code': 'INVALID_FIELD', 'field': 'serialNumbers',
+                                   'description': f"Serial number {serial} is not in a device enrollment instance"})
+                    continue
+                for (other_kind, other_id), other in self._prestages.items():
+                    if other_kind == kind and other_id != prestage_id and serial.upper() in other['serials']:
+                        errors.append({'code': 'DEVICE_EXISTS_IN_ANOTHER_PRESTAGE', 'field': 'serialNumbers',
+                                       'description': f"Serial number {serial} is assigned to PreStage {other_id}"})
+            if errors:
+                return 400, errors
+            for serial in serial_numbers:
+                if serial.upper() not in scope['serials']:
+                    scope['serials'].append(serial.upper())
+            scope['versionLock'] += 1
+            return 200, None
+
+    def group(self, kind, group_id):
+        # Classic API static group with its members
+        describe = self.computer if kind == 'computer' else self.mobile_device
+        with self._lock:
+            members = sorted(self._groups.get((kind, group_id), ()))
+        devices = []
+        for device_id in members:
+            device = describe(device_id)
+            name = device['name'] if kind == 'computer' else device['device_name']
+            devices.append({'id': device_id, 'name': name, 'serial_number': device['serial_number']})
+        plural = 'computers' if kind == 'computer' else 'mobile_devices'
+        name = self.group_names[kind].get(group_id, f"Static Group {group_id}")
+        return {f"{kind}_group": {'id': group_id, 'name': name, 'is_smart': False, plural: devices}}
+
+    def update_group(self, kind, group_id, additions, deletions):
+        # additions and deletions hold device IDs or serial numbers; like the Classic API,
+        # a device that does not exist fails the whole update with a 409
+        members = []
+        for devices in (additions, deletions):
+            ids = []
+            for device in devices:
+                device_id = device if isinstance(device, int) else self.device_id(kind, device)
+                count = self.computers if kind == 'computer' else self.mobile_devices
+                if device_id is None or not 1 <= device_id <= count:
+                    return 409
+                ids.append(device_id)
+            members.append(ids)
+        with self._lock:
+            group = self._groups.setdefault((kind, group_id), set())
+            group.update(members[0])
+            group.difference_update(members[1])
+        return 201
+
+    def _random(self, kind, device_id):
+        return random.Random(f"{self.seed}:{kind}:{device_id}")
+
+    def _inventory_time(self, kind, device_id, rng):
+        moment = FLEET_EPOCH - datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 30))
+        return moment + datetime.timedelta(hours=self._touched.get((kind, device_id), 0))
+
+    def _user(self, rng):
+        user = rng.randrange(self.users)
+        return {
+            'username': f"user{user:06d}",
+            'realname': f"User {user:06d}",
+            'email': f"user{user:06d}@example.com",
+            'position': POSITIONS[user % len(POSITIONS)],
+            'department': user % len(DEPARTMENTS),
+            'building': user % len(BUILDINGS),
+            'room': str(100 + user % 300),
+        }
+
+    def computer(self, device_id):
+        # One set of attributes shared by the Classic and Jamf Pro API layouts
+        rng = self._random('computer', device_id)
+        model, model_identifier, processor, apple_silicon = rng.choice(COMPUTER_MODELS)
+        gatekeeper = rng.choice(GATEKEEPER_STATUSES)
+        filevault = FILEVAULT_STATES[0] if rng.random() < 0.95 else FILEVAULT_STATES[1]
+        capacity = rng.choice([256, 512, 1024]) * 1000
+        return {
+            'id': device_id,
+            'name': f"MAC-{device_id:06d}",
+            'serial_number': f"C02{device_id:07d}",
+            'udid': str(uuid.UUID(int=rng.getrandbits(128))),
+            'ip_address': f"10.{device_id // 65536 % 256}.{device_id // 256 % 256}.{device_id % 256}",
+            'report_date': self._inventory_time('computer', device_id, rng),
+            'last_contact_time': FLEET_EPOCH - datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 90)),
+            'last_enrolled_date': FLEET_EPOCH - datetime.timedelta(days=rng.randrange(30, 1500)),
+            'mdm_profile_expiration': FLEET_EPOCH + datetime.timedelta(days=rng.randrange(30, 700)),
+            'enrolled_via_dep': rng.random() < 0.9,
+            'location': self._user(rng),
+            'model': model,
+            'model_identifier': model_identifier,
+            'os_version': rng.choice(MACOS_VERSIONS),
+            'processor_type': processor,
+            'apple_silicon': apple_silicon,
+            'processor_architecture': 'arm64' if apple_silicon else 'x86_64',
+            'number_cores': rng.choice([4, 8, 10, 12]),
+            'total_ram_mb': rng.choice([8, 16, 32, 64]) * 1024,
+            'battery_capacity': rng.randrange(60, 101),
+            'sip_status': 'ENABLED',
+            'gatekeeper_status': gatekeeper,
+            'drive_capacity_mb': capacity,
+            'available_mb': rng.randrange(capacity // 20, capacity),
+            'filevault_status': filevault,
+        }
+
+    def classic_computer(self, device_id):
+        computer = self.computer(device_id)
+        location = computer['location']
+        return {'computer': {
+            'general': {
+                'id': device_id,
+                'name': computer['name'],
+                'ip_address': computer['ip_address'],
+                'serial_number': computer['serial_number'],
+                'udid': computer['udid'],
+                'management_status': {'enrolled_via_dep': computer['enrolled_via_dep']},
+                'report_date': prog_classic_time(computer['report_date']),
+                'last_contact_time': prog_classic_time(computer['last_contact_time']),
+                'last_enrolled_date_utc': prog_classic_utc(computer['last_enrolled_date']),
+                'mdm_profile_expiration_utc': prog_classic_utc(computer['mdm_profile_expiration']),
+            },
+            'location': {
+                'username': location['username'],
+                'realname': location['realname'],
+                'email_address': location['email'],
+                'position': location['position'],
+                'department': DEPARTMENTS[location['department']],
+                'building': BUILDINGS[location['building']],
+                'room': location['room'],
+            },
+            'hardware': {
+                'model': computer['model'],
+                'model_identifier': computer['model_identifier'],
+                'os_version': computer['os_version'],
+                'processor_type': computer['processor_type'],
+                'is_apple_silicon': computer['apple_silicon'],
+                'processor_architecture': computer['processor_architecture'],
+                'number_cores': computer['number_cores'],
+                'total_ram_mb': computer['total_ram_mb'],
+                'battery_capacity': computer['battery_capacity'],
+                'sip_status': 'Enabled',
+                'gatekeeper_status': computer['gatekeeper_status'][1],
+                'storage': [{
+                    'drive_capacity_mb': computer['drive_capacity_mb'],
+                    'partitions': [{
+                        'available_mb': computer['available_mb'],
+                        'filevault_status': computer['filevault_status'][1],
+                    }],
+                }],
+            },
+        }}
+
+    def inventory_computer(self, device_id):
+        # /api/v1/computers-inventory record
+        computer = self.computer(device_id)
+        location = computer['location']
+        return {
+            'id': str(device_id),
+            'udid': computer['udid'],
+            'general': {
+                'name': computer['name'],
+                'lastIpAddress': computer['ip_address'],
+                'reportDate': prog_iso(computer['report_date']),
+                'lastContactTime': prog_iso(computer['last_contact_time']),
+                'lastEnrolledDate': prog_iso(computer['last_enrolled_date']),
+                'mdmProfileExpiration': prog_iso(computer['mdm_profile_expiration']),
+                'enrolledViaAutomatedDeviceEnrollment': computer['enrolled_via_dep'],
+            },
+            'userAndLocation': {
+                'username': location['username'],
+                'realname': location['realname'],
+                'email': location['email'],
+                'position': location['position'],
+                'departmentId': str(location['department'] + 1),
+                'buildingId': str(location['building'] + 1),
+                'room': location['room'],
+            },
+            'hardware': {
+                'model': computer['model'],
+                'modelIdentifier': computer['model_identifier'],
+                'serialNumber': computer['serial_number'],
+                'processorType': computer['processor_type'],
+                'appleSilicon': computer['apple_silicon'],
+                'processorArchitecture': computer['processor_architecture'],
+                'coreCount': computer['number_cores'],
+                'totalRamMegabytes': computer['total_ram_mb'],
+                'batteryCapacityPercent': computer['battery_capacity'],
+            },
+            'operatingSystem': {'version': computer['os_version']},
+            'security': {'sipStatus': computer['sip_status'], 'gatekeeperStatus': computer['gatekeeper_status'][0]},
+            'storage': {'disks': [{
+                'sizeMegabytes': computer['drive_capacity_mb'],
+                'partitions': [{
+                    'partitionType': 'BOOT',
+                    'availableMegabytes': computer['available_mb'],
+                    'fileVault2State': computer['filevault_status'][0],
+                }],
+            }]},
+        }
+
+    def mobile_device(self, device_id):
+        rng = self._random('mobile_device', device_id)
+        model, model_identifier, model_number = rng.choice(MOBILE_DEVICE_MODELS)
+        os_version, os_build = rng.choice(IOS_VERSIONS)
+        capacity = rng.choice([64, 128, 256]) * 1000
+        available = rng.randrange(capacity // 50, capacity)
+        cellular = model.startswith('iPhone')
+        return {
+            'id': device_id,
+            'device_name': f"{model.split()[0].upper()}-{device_id:06d}",
+            'serial_number': f"DM{device_id:08d}",
+            'udid': uuid.UUID(int=rng.getrandbits(128)).hex,
+            'inventory_update': self._inventory_time('mobile_device', device_id, rng),
+            'last_enrollment': FLEET_EPOCH - datetime.timedelta(days=rng.randrange(30, 1500)),
+            'location': self._user(rng),
+            'model': model,
+            'model_identifier': model_identifier,
+            'model_number': model_number,
+            'os_version': os_version,
+            'os_build': os_build,
+            'battery_level': rng.randrange(5, 101),
+            'capacity_mb': capacity,
+            'available_mb': available,
+            'percentage_used': round(100 - available * 100 / capacity),
+            'passcode_present': rng.random() < 0.97,
+            'phone_number': f"+1555{device_id:07d}" if cellular else '',
+            'carrier': 'Example Wireless' if cellular else '',
+            'iccid': f"8901 2600 {device_id:08d} 00" if cellular else '',
+            'imei': f"35 {device_id:06d} 000000 0" if cellular else '',
+        }
+
+    def classic_mobile_device(self, device_id):
+        device = self.mobile_device(device_id)
+        location = device['location']
+        return {'mobile_device': {
+            'general': {
+                'id': device_id,
+                'name': device['device_name'],
+                'device_name': device['device_name'],
+                'serial_number': device['serial_number'],
+                'udid': device['udid'],
+                'available_mb': device['available_mb'],
+                'capacity_mb': device['capacity_mb'],
+                'percentage_used': device['percentage_used'],
+                'battery_level': device['battery_level'],
+                'enrollment_method': 'Prestage enrollment',
+                'last_enrollment_utc': prog_classic_utc(device['last_enrollment']),
+                'last_inventory_update': prog_classic_mobile_time(device['inventory_update']),
+                'model': device['model'],
+                'model_identifier': device['model_identifier'],
+                'model_number': device['model_number'],
+                'os_version': device['os_version'],
+                'os_build': device['os_build'],
+                'phone_number': device['phone_number'],
+            },
+            'location': {
+                'username': location['username'],
+                'realname': location['realname'],
+                'email_address': location['email'],
+                'position': location['position'],
+                'department': DEPARTMENTS[location['department']],
+                'building': BUILDINGS[location['building']],
+                'room': location['room'],
+            },
+            'network': {
+                'home_carrier_network': device['carrier'],
+                'iccid': device['iccid'],
+                'imei': device['imei'],
+            },
+            'security': {'passcode_present': device['passcode_present']},
+        }}
+
+    def match(self, kind, pattern):
+        # Classic /match: case-insensitive, '*' wildcards, across name, serial, UDID and user fields
+        pattern = pattern.lower()
+        count = self.computers if kind == 'computer' else self.mobile_devices
+        describe = self.computer if kind == 'computer' else self.mobile_device
+        matches = []
+        for device_id in range(1, count + 1):
+            device = describe(device_id)
+            location = device['location']
+            name = device['name'] if kind == 'computer' else device['device_name']
+            fields = [name, device['serial_number'], device['udid'], location['username'], location['realname'], location['email']]
+            if any(fnmatch.fnmatchcase(field.lower(), pattern) for field in fields):
+                matches.append({
+                    'id': device_id,
+                    'name': name,
+                    'serial_number': device['serial_number'],
+                    'udid': device['udid'],
+                    'username': location['username'],
+                    'realname': location['realname'],
+                    'email': location['email'],
+                })
+        return matches
+
+
+class MockFaults:
+    # Latency and failure injection applied to every API request
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500,
+                 throttle_rate=0.0, retry_after=1, max_in_flight=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_in_flight = max_in_flight
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                extra = self._random.uniform(0, self.jitter) if self.jitter else 0
+            time.sleep(self.latency + extra)
+
+    def failure(self, in_flight):
+        # Returns (status, headers) for an injected failure, or None
+        with self._lock:
+            roll = self._random.random()
+        if (self.max_in_flight and in_flight > self.max_in_flight) or roll < self.throttle_rate:
+            return 429, {'Retry-After': str(self.retry_after)}
+        if roll < self.throttle_rate + self.error_rate:
+            return self.error_status, {}
+        return None
+
+
+class MockStats:
+    # Request counts by endpoint and status, bytes sent and the peak number of requests in flight
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.statuses = {}
+            self.bytes_sent = 0
+            self.in_flight = 0
+            self.peak_in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self.in_flight
+
+    def end(self, endpoint, status, size):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.bytes_sent += size
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'statuses': dict(self.statuses),
+                'bytes_sent': self.bytes_sent,
+                'peak_in_flight': self.peak_in_flight,
+            }
+
+
+def prog_endpoint_name(path):
+    # /JSSResource/computers/id/12 -> /JSSResource/computers/id/{id}, for per-endpoint counts
+    parts = path.split('/')
+    for index in range(1, len(parts)):
+        if parts[index - 1] in ('id', 'match', 'computer', 'mobile_device', 'computer-prestages', 'mobile-device-prestages') and parts[index]:
+            parts[index] = '{id}' if parts[index - 1] != 'match' else '{match}'
+    return '/'.join(parts)
+
+
+class MockJamfHandler(BaseHTTPRequestHandler):
+    # Serves the Jamf Pro and Classic API endpoints the MDM scripts use from server.fleet
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        query = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if path.startswith('/mock/'):
+            # Control endpoints skip fault injection and are not counted
+            status, payload = self._control(method, path)
+            self._send(status, payload)
+            return
+        in_flight = self.server.stats.begin()
+        status, payload, headers = 500, None, {}
+        try:
+            self.server.faults.delay()
+            failure = self.server.faults.failure(in_flight)
+            if failure is not None:
+                status, headers = failure
+            else:
+                status, payload = self._route(method, path, query, body)
+        finally:
+            size = self._send(status, payload, headers)
+            self.server.stats.end(f"{method} {prog_endpoint_name(path)}", status, size)
+
+    def _send(self, status, payload, headers=None):
+        content = b'' if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        return len(content)
+
+    def _control(self, method, path):
+        if path == '/mock/stats':
+            return 200, self.server.stats.to_dict()
+        if path == '/mock/reset' and method == 'POST':
+            self.server.stats.reset()
+            return 200, {}
+        parts = path.split('/')
+        if len(parts) == 5 and parts[2] == 'touch' and method == 'POST':
+            # POST /mock/touch/{computer|mobile_device}/{id}
+            self.server.fleet.touch(parts[3], int(parts[4]))
+            return 200, {}
+        return 404, None
+
+    def _authorized(self, classic):
+        authorization = self.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            return self.server.valid_token(authorization[len('Bearer '):])
+        # The Classic API also accepts Basic authentication
+        return classic and authorization.startswith('Basic ')
+
+    def _route(self, method, path, query, body):
+        fleet = self.server.fleet
+        if method == 'POST' and path == '/api/v1/auth/token':
+            if not self.headers.get('Authorization', '').startswith('Basic '):
+                return 401, None
+            return 200, self.server.issue_token()
+        if method == 'POST' and path == '/api/v1/auth/keep-alive':
+            if not self._authorized(classic=False):
+                return 401, None
+            return 200, self.server.issue_token()
+        if not self._authorized(classic=path.startswith('/JSSResource/')):
+            return 401, None
+        parts = path.split('/')
+        if len(parts) in (6, 7) and parts[1:3] == ['api', 'v2'] and parts[3] in PRESTAGE_KINDS and parts[5] == 'scope':
+            # /api/v2/{computer|mobile-device}-prestages/{id}/scope[/add-multiple]
+            kind, prestage_id = PRESTAGE_KINDS[parts[3]], int(parts[4])
+            if method == 'GET' and len(parts) == 6:
+                return 200, fleet.prestage_scope(kind, prestage_id)
+            if method == 'POST' and len(parts) == 7 and parts[6] == 'add-multiple':
+                request = json.loads(body or b'{}')
+                status, errors = fleet.add_to_prestage(kind, prestage_id, request.get('serialNumbers', []), request.get('versionLock'))
+                if errors:
+                    return status, {'httpStatus': status, 'errors': errors}
+                return 200, fleet.prestage_scope(kind, prestage_id)
+            return 405, None
+        if len(parts) == 5 and parts[1] == 'JSSResource' and parts[2] in GROUP_KINDS and parts[3] == 'id':
+            kind, group_id = GROUP_KINDS[parts[2]], int(parts[4])
+            if method == 'GET':
+                return 200, fleet.group(kind, group_id)
+            if method == 'PUT':
+                # <computer_group><computer_additions><computer><serial_number>...</serial_number>...
+                try:
+                    root = ElementTree.fromstring(body)
+                except ElementTree.ParseError:
+                    return 400, None
+                changes = []
+                for change in ('additions', 'deletions'):
+                    devices = []
+                    for device in root.findall(f"{kind}_{change}/{kind}"):
+                        device_id = device.findtext('id')
+                        devices.append(int(device_id) if device_id else device.findtext('serial_number') or '')
+                    changes.append(devices)
+                status = fleet.update_group(kind, group_id, *changes)
+                return status, {f"{kind}_group": {'id': group_id}} if status == 201 else None
+            return 405, None
+        if method != 'GET':
+            return 405, None
+        if path in ('/api/v3/computer-prestages', '/api/v2/mobile-device-prestages'):
+            kind = 'computer' if 'computer' in path else 'mobile_device'
+            prestages = [{'id': str(prestage_id), 'displayName': name} for prestage_id, name in fleet.prestage_names[kind].items()]
+            return 200, prog_page(prestages, query)
+        if path in ('/JSSResource/computergroups', '/JSSResource/mobiledevicegroups'):
+            kind = 'computer' if path.endswith('computergroups') else 'mobile_device'
+            groups = [{'id': group_id, 'name': name, 'is_smart': False} for group_id, name in fleet.group_names[kind].items()]
+            return 200, {f"{kind}_groups": groups}
+        if path == '/api/preview/computers':
+            items = [{'id': str(device_id), 'name': f"MAC-{device_id:06d}"} for device_id in range(1, fleet.computers + 1)]
+            return 200, prog_page(items, query)
+        if path == '/api/v1/computers-inventory':
+            page = prog_page(range(1, fleet.computers + 1), query)
+            page['results'] = [fleet.inventory_computer(device_id) for device_id in page['results']]
+            return 200, page
+        if path == '/api/v2/mobile-devices/detail':
+            page = prog_page(range(1, fleet.mobile_devices + 1), query)
+            page['results'] = [
+                {
+                    'mobileDeviceId': str(device_id),
+                    'general': {'lastInventoryUpdateDate': prog_iso(fleet.mobile_device(device_id)['inventory_update'])},
+                }
+                for device_id in page['results']
+            ]
+            return 200, page
+        if path == '/api/v1/departments':
+            return 200, prog_page([{'id': str(index + 1), 'name': name} for index, name in enumerate(DEPARTMENTS)], query)
+        if path == '/api/v1/buildings':
+            return 200, prog_page([{'id': str(index + 1), 'name': name} for index, name in enumerate(BUILDINGS)], query)
+        if path == '/JSSResource/computers':
+            return 200, {'computers': [{'id': device_id, 'name': f"MAC-{device_id:06d}"} for device_id in range(1, fleet.computers + 1)]}
+        if path == '/JSSResource/mobiledevices':
+            return 200, {'mobile_devices': [
+                {'id': device_id, 'serial_number': f"DM{device_id:08d}"} for device_id in range(1, fleet.mobile_devices + 1)
+            ]}
+        if len(parts) == 5 and parts[1] == 'JSSResource' and parts[3] == 'id':
+            device_id = int(parts[4])
+            if parts[2] == 'computers' and 1 <= device_id <= fleet.computers:
+                return 200, fleet.classic_computer(device_id)
+            if parts[2] == 'mobiledevices' and 1 <= device_id <= fleet.mobile_devices:
+                return 200, fleet.classic_mobile_device(device_id)
+            return 404, None
+        if len(parts) == 5 and parts[1] == 'JSSResource' and parts[3] == 'match':
+            if parts[2] == 'computers':
+                return 200, {'computers': fleet.match('computer', unquote(parts[4]))}
+            if parts[2] == 'mobiledevices':
+                return 200, {'mobile_devices': fleet.match('mobile_device', unquote(parts[4]))}
+        return 404, None
+
+
+class MockJamfServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fleet, faults=None, token_lifetime=DEFAULT_TOKEN_LIFETIME, verbose=False):
+        super().__init__(address, MockJamfHandler)
+        self.fleet = fleet
+        self.faults = faults or MockFaults()
+        self.stats = MockStats()
+        self.token_lifetime = token_lifetime
+        self.verbose = verbose
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        expires = time.time() + self.token_lifetime
+        with self._lock:
+            self._tokens[token] = expires
+        expiry = datetime.datetime.fromtimestamp(expires, tz=datetime.timezone.utc)
+        return {'token': token, 'expires': prog_iso(expiry)}
+
+    def valid_token(self, token):
+        with self._lock:
+            return self._tokens.get(token, 0) > time.time()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def mdm_start_mock_server(fleet, faults=None, host='127.0.0.1', port=0, **kwargs):
+    # Serves in a background thread; port 0 picks a free port (see server.url). Stop with server.shutdown().
+    server = MockJamfServer((host, port), fleet, faults, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# --------------- PROGRAM START --------------- #
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the Jamf Pro and Classic APIs with a synthetic fleet.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--computers', type=int, default=1000, help='number of computers (default: 1000)')
+    parser.add_argument('--mobile-devices', type=int, default=1000, help='number of mobile devices (default: 1000)')
+    parser.add_argument('--users', type=int, default=None, help='number of distinct users devices are assigned to')
+    parser.add_argument('--groups', type=int, default=10, help='named static groups per device kind (default: 10)')
+    parser.add_argument('--prestages', type=int, default=5, help='named PreStages per device kind (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='fleet seed; the same seed always generates the same fleet')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra random seconds per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of API requests that fail with --error-status')
+    parser.add_argument('--error-status', type=int, default=500, help='status returned by injected errors (default: 500)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of API requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s (default: 1)')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='answer 429 while more requests than this are in flight')
+    parser.add_argument('--token-lifetime', type=int, default=DEFAULT_TOKEN_LIFETIME, help='bearer token lifetime in seconds')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    fleet = MockFleet(args.computers, args.mobile_devices, users=args.users, seed=args.seed,
+                      groups=args.groups, prestages=args.prestages)
+    faults = MockFaults(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after, max_in_flight=args.max_in_flight,
+    )
+    server = MockJamfServer((args.host, args.port), fleet, faults, token_lifetime=args.token_lifetime, verbose=args.verbose)
+    print(f"Mock Jamf serving {args.computers} computers and {args.mobile_devices} mobile devices at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass